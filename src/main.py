@@ -2,7 +2,7 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))  # Corrige o problema de importação no Render
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from src.routes.auth import auth_bp
 from src.routes.booking import booking_bp
 from src.routes.patient import patient_bp
@@ -10,7 +10,21 @@ from src.routes.professional import professional_bp
 from src.routes.search import search_bp
 from src.routes.professional_activity import activity_bp
 from src.routes.admin import admin_bp
+from src.routes.files import files_bp
 from src.models.user import db
+from src.utils.search_index import init_search_index
+from src.utils.expiration import init_expiration_scheduler
+from src.utils.notifications import init_notifications
+from src.utils.booking_rollups import init_booking_rollups
+from src.utils.passwords import init_password_hasher
+from src.utils.rate_limit import DEFAULT_RULES, init_rate_limiter
+from src.utils.tokens import init_tokens
+from src.utils.signing_keys import init_signing_keys
+from src.utils.storage import init_storage
+from src.utils.uploads import init_uploads
+from src.utils.previews import init_previews
+from src.utils.delivery import send_static
+from src.utils.assets import init_assets
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 
@@ -28,16 +42,72 @@ else:
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key_for_testing')
 
+# Armazenamento dos uploads: 'local' (padrão) ou 's3', configurado pelas chaves S3_*
+for key in ('UPLOAD_STORAGE', 'S3_ENDPOINT_URL', 'S3_BUCKET', 'S3_ACCESS_KEY_ID', 'S3_SECRET_ACCESS_KEY',
+            'S3_REGION', 'S3_PREFIX'):
+    if os.environ.get(key):
+        app.config[key] = os.environ[key]
+
+# Limites de login e cadastro: RATE_LIMIT_STORAGE 'memory' (padrão, por processo) ou
+# 'shared://host:porta'; cada regra no formato 'limite/período em segundos' ou 'off'
+for key in ('RATE_LIMIT_STORAGE', 'RATE_LIMIT_STORE_AUTHKEY'):
+    if os.environ.get(key):
+        app.config[key] = os.environ[key]
+if os.environ.get('RATE_LIMIT_MAX_KEYS'):
+    app.config['RATE_LIMIT_MAX_KEYS'] = int(os.environ['RATE_LIMIT_MAX_KEYS'])
+for key in ('RATE_LIMIT_ENABLED', 'RATE_LIMIT_TRUST_PROXY'):
+    if os.environ.get(key):
+        app.config[key] = os.environ[key].lower() in ('1', 'true', 'yes')
+for key in (rule[0] for rules in DEFAULT_RULES.values() for rule in rules):
+    if os.environ.get(key):
+        value = os.environ[key]
+        app.config[key] = None if value == 'off' else tuple(int(part) for part in value.split('/'))
+
+# Envio das notificações: 'log' (padrão) ou 'smtp', configurado pelas chaves SMTP_*
+for key in ('NOTIFICATION_TRANSPORT', 'SMTP_HOST', 'SMTP_SENDER', 'SMTP_USERNAME', 'SMTP_PASSWORD'):
+    if os.environ.get(key):
+        app.config[key] = os.environ[key]
+if os.environ.get('SMTP_PORT'):
+    app.config['SMTP_PORT'] = int(os.environ['SMTP_PORT'])
+if os.environ.get('SMTP_USE_TLS'):
+    app.config['SMTP_USE_TLS'] = os.environ['SMTP_USE_TLS'].lower() in ('1', 'true', 'yes')
+
+# Chaves de assinatura dos tokens: JWT_SIGNING_KEYS (JSON {kid: PEM}) ou um diretório
+# compartilhado em JWT_KEYS_DIR; sem nenhuma a aplicação não sobe. JWT_KEYS_AUTOGENERATE
+# cria a primeira chave no diretório (só desenvolvimento); JWT_ACCEPT_HS256 volta a aceitar
+# os tokens antigos assinados com o SECRET_KEY
+for key in ('JWT_SIGNING_KEYS', 'JWT_KEYS_DIR', 'JWT_ALGORITHM'):
+    if os.environ.get(key):
+        app.config[key] = os.environ[key]
+for key in ('JWT_KEY_ACTIVATION_DELAY_SECONDS', 'JWT_KEYS_RELOAD_SECONDS'):
+    if os.environ.get(key):
+        app.config[key] = int(os.environ[key])
+for key in ('JWT_KEYS_AUTOGENERATE', 'JWT_ACCEPT_HS256'):
+    if os.environ.get(key):
+        app.config[key] = os.environ[key].lower() in ('1', 'true', 'yes')
+
+# Entrega dos arquivos: 'app' (padrão), 'x-accel' (nginx) ou 'x-sendfile' (Apache/lighttpd)
+if os.environ.get('FILE_DELIVERY'):
+    app.config['FILE_DELIVERY'] = os.environ['FILE_DELIVERY']
+
+# Build dos estáticos (`flask build-assets`); padrão instance/assets
+if os.environ.get('ASSETS_FOLDER'):
+    app.config['ASSETS_FOLDER'] = os.environ['ASSETS_FOLDER']
+
 db.init_app(app)
 
 # Servir frontend na raiz
 @app.route('/')
 def index():
-    return app.send_static_file('index.html')
+    return serve_static('index.html')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
-    return send_from_directory(app.static_folder, filename)
+    # Uploads ficam fora: só saem por /files/uploads com link assinado
+    return send_static(app.static_folder, filename)
+
+# /static/<arquivo> segue as mesmas regras
+app.view_functions['static'] = serve_static
 
 # Blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -47,10 +117,47 @@ app.register_blueprint(professional_bp, url_prefix='/api/professional')
 app.register_blueprint(search_bp, url_prefix='/api/search')
 app.register_blueprint(activity_bp, url_prefix='/api/activities')
 app.register_blueprint(admin_bp, url_prefix='/admin')
+app.register_blueprint(files_bp, url_prefix='/files')
 
 # Criação das tabelas do banco de dados
 with app.app_context():
     db.create_all()
 
+# Índice de busca de profissionais em memória
+init_search_index(app)
+
+# Expiração periódica de agendamentos e cadastros pendentes vencidos
+init_expiration_scheduler(app)
+
+# Entrega assíncrona das notificações gravadas no outbox
+init_notifications(app)
+
+# Comandos da consolidação diária de agendamentos
+init_booking_rollups(app)
+
+# Limite de hashes de senha simultâneos na máquina (todos os workers)
+init_password_hasher(app)
+
+# Limite de tentativas de login e cadastro (por IP e por email)
+init_rate_limiter(app)
+
+# Filtro em memória das revogações de access tokens
+init_tokens(app)
+
+# Chaves assimétricas de assinatura dos tokens; falha aqui se nenhuma foi provisionada
+init_signing_keys(app)
+
+# Armazenamento dos uploads (disco local ou S3)
+init_storage(app)
+
+# Uploads gravados em streaming e armazenados pelo conteúdo
+init_uploads(app)
+
+# Pré-visualizações dos diplomas geradas num pool de processos
+init_previews(app)
+
+# Estáticos com hash no nome e variantes pré-comprimidas, se o build existir
+init_assets(app)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
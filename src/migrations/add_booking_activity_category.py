@@ -0,0 +1,57 @@
+"""
+Script para gravar a atividade agendada em bookings e incluir a categoria dessa
+atividade na chave da consolidação diária (booking_daily_rollups)
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from flask import Flask
+from sqlalchemy import inspect, text
+
+from src.models.user import db
+from src.models import (
+    auth_token, availability, booking, booking_rollup, category, outbox, patient,
+    professional, professional_activity, stored_file
+)
+from src.models.booking_rollup import BookingDailyRollup, RollupWatermark
+from src.utils.booking_rollups import WATERMARK_NAME, rebuild_rollups
+
+# Aplicação mínima: importar src.main exigiria as chaves de assinatura e subiria o
+# agendador e o índice de busca
+# Mesma pasta instance/ da aplicação: o SQLite local é o mesmo arquivo
+app = Flask(__name__, instance_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'instance')))
+database_url = os.environ.get('DATABASE_URL')
+if database_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace('postgres://', 'postgresql://', 1)
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///saude_connect.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+def run_migration():
+    with app.app_context():
+        try:
+            columns = {column['name'] for column in inspect(db.engine).get_columns('bookings')}
+            if 'activity_id' not in columns:
+                print("Adicionando a coluna bookings.activity_id...")
+                db.session.execute(text("ALTER TABLE bookings ADD COLUMN activity_id INTEGER REFERENCES activities (id)"))
+
+            # A chave primária mudou: a tabela é recriada e recalculada a partir de bookings
+            print("Recriando booking_daily_rollups com a categoria na chave...")
+            db.session.execute(text("DROP TABLE IF EXISTS booking_daily_rollups"))
+            db.session.commit()
+            BookingDailyRollup.__table__.create(db.engine)
+            RollupWatermark.__table__.create(db.engine, checkfirst=True)
+            db.session.query(RollupWatermark).filter_by(name=WATERMARK_NAME).delete()
+            db.session.commit()
+
+            written = rebuild_rollups(db.engine)
+            print(f"{written} linhas de consolidação gravadas")
+            print("Migração concluída com sucesso!")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro durante a migração: {e}")
+
+if __name__ == '__main__':
+    run_migration()
@@ -0,0 +1,64 @@
+"""
+Script para impedir agendamentos duplicados: índice único parcial sobre os horários
+ativos e, no PostgreSQL, a exclusion constraint que barra intervalos sobrepostos
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from src.models.user import db
+from src.models.booking import DEFAULT_DURATION_MINUTES
+
+# Aplicação mínima: importar src.main exigiria as chaves de assinatura e subiria o
+# agendador e o índice de busca
+# Mesma pasta instance/ da aplicação: o SQLite local é o mesmo arquivo
+app = Flask(__name__, instance_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'instance')))
+database_url = os.environ.get('DATABASE_URL')
+if database_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace('postgres://', 'postgresql://', 1)
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///saude_connect.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+ACTIVE_CONDITION = "status IN ('pending', 'confirmed')"
+
+def run_migration():
+    with app.app_context():
+        try:
+            is_postgres = db.engine.dialect.name == 'postgresql'
+            print("Criando índice uq_bookings_professional_active_slot...")
+            if is_postgres:
+                with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                    connection.execute(text(
+                        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_bookings_professional_active_slot "
+                        f"ON bookings (professional_id, scheduled_date) WHERE {ACTIVE_CONDITION}"
+                    ))
+                    print("Criando exclusion constraint ex_bookings_professional_overlap...")
+                    connection.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+                    exists = connection.execute(text(
+                        "SELECT 1 FROM pg_constraint WHERE conname = 'ex_bookings_professional_overlap'"
+                    )).scalar()
+                    if not exists:
+                        connection.execute(text(f"""
+                            ALTER TABLE bookings ADD CONSTRAINT ex_bookings_professional_overlap EXCLUDE USING gist (
+                                professional_id WITH =,
+                                tsrange(scheduled_date, scheduled_date + interval '{DEFAULT_DURATION_MINUTES} minutes') WITH &&
+                            ) WHERE ({ACTIVE_CONDITION})
+                        """))
+            else:
+                db.session.execute(text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS uq_bookings_professional_active_slot "
+                    f"ON bookings (professional_id, scheduled_date) WHERE {ACTIVE_CONDITION}"
+                ))
+                db.session.commit()
+            print("Migração concluída com sucesso!")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro durante a migração (verifique agendamentos duplicados existentes): {e}")
+
+if __name__ == '__main__':
+    run_migration()
@@ -0,0 +1,52 @@
+"""
+Script para criar os índices parciais percorridos pela expiração de agendamentos
+e cadastros de profissionais pendentes
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from src.models.user import db
+
+# Aplicação mínima: importar src.main exigiria as chaves de assinatura e subiria o
+# agendador e o índice de busca
+# Mesma pasta instance/ da aplicação: o SQLite local é o mesmo arquivo
+app = Flask(__name__, instance_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'instance')))
+database_url = os.environ.get('DATABASE_URL')
+if database_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace('postgres://', 'postgresql://', 1)
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///saude_connect.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+INDEXES = {
+    'ix_bookings_active_scheduled_date':
+        "bookings (scheduled_date, id) WHERE status IN ('pending', 'confirmed')",
+    'ix_professionals_pending_created_at':
+        "professionals (created_at, id) WHERE approval_status = 'pending'",
+}
+
+def run_migration():
+    with app.app_context():
+        try:
+            is_postgres = db.engine.dialect.name == 'postgresql'
+            for name, definition in INDEXES.items():
+                print(f"Criando índice {name}...")
+                if is_postgres:
+                    # CONCURRENTLY não pode rodar dentro de transação e não bloqueia escritas
+                    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                        connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+                else:
+                    db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}"))
+                    db.session.commit()
+            print("Migração concluída com sucesso!")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro durante a migração: {e}")
+
+if __name__ == '__main__':
+    run_migration()
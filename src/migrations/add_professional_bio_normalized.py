@@ -0,0 +1,66 @@
+"""
+Script para adicionar a coluna professionals.bio_normalized (bio sem acentos, em
+minúsculas), usada pelo filtro de palavras-chave da busca, e preencher os registros existentes
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from flask import Flask
+from sqlalchemy import text, inspect
+
+from src.models.user import db
+from src.utils.text import fold_text
+
+BATCH_SIZE = 1000
+
+# Aplicação mínima: importar src.main rodaria create_all e a construção do índice de
+# busca, que já esperam a coluna bio_normalized
+# Mesma pasta instance/ da aplicação: o SQLite local é o mesmo arquivo
+app = Flask(__name__, instance_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'instance')))
+database_url = os.environ.get('DATABASE_URL')
+if database_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace('postgres://', 'postgresql://', 1)
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///saude_connect.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+def run_migration():
+    with app.app_context():
+        try:
+            columns = [c['name'] for c in inspect(db.engine).get_columns('professionals')]
+            if 'bio_normalized' not in columns:
+                print("Adicionando coluna bio_normalized à tabela professionals...")
+                db.session.execute(text("ALTER TABLE professionals ADD COLUMN bio_normalized TEXT"))
+                db.session.commit()
+            else:
+                print("A coluna bio_normalized já existe na tabela professionals.")
+
+            # Preencher em lotes para não manter a tabela travada
+            total = 0
+            last_id = 0
+            while True:
+                rows = db.session.execute(
+                    text("SELECT id, bio FROM professionals WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                    {"last_id": last_id, "limit": BATCH_SIZE}
+                ).fetchall()
+                if not rows:
+                    break
+                db.session.execute(
+                    text("UPDATE professionals SET bio_normalized = :bio_normalized WHERE id = :id"),
+                    [{"id": row.id, "bio_normalized": fold_text(row.bio)} for row in rows]
+                )
+                db.session.commit()
+                total += len(rows)
+                last_id = rows[-1].id
+            print(f"{total} profissionais atualizados.")
+
+            print("Migração concluída com sucesso!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro durante a migração: {e}")
+
+if __name__ == '__main__':
+    run_migration()
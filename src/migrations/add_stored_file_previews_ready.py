@@ -0,0 +1,45 @@
+"""
+Script para adicionar a coluna stored_files.previews_ready_at, que registra quando as
+pré-visualizações de um diploma ficaram prontas. Depois dela, `flask generate-previews`
+registra as que já existem no armazenamento e gera as que faltam
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from flask import Flask
+from sqlalchemy import text, inspect
+
+from src.models.user import db
+
+# Aplicação mínima: importar src.main exigiria as chaves de assinatura e subiria o
+# agendador e o índice de busca
+# Mesma pasta instance/ da aplicação: o SQLite local é o mesmo arquivo
+app = Flask(__name__, instance_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'instance')))
+database_url = os.environ.get('DATABASE_URL')
+if database_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace('postgres://', 'postgresql://', 1)
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///saude_connect.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+def run_migration():
+    with app.app_context():
+        try:
+            columns = [c['name'] for c in inspect(db.engine).get_columns('stored_files')]
+            if 'previews_ready_at' not in columns:
+                print("Adicionando coluna previews_ready_at à tabela stored_files...")
+                db.session.execute(text("ALTER TABLE stored_files ADD COLUMN previews_ready_at TIMESTAMP"))
+                db.session.commit()
+            else:
+                print("A coluna previews_ready_at já existe na tabela stored_files.")
+
+            print("Migração concluída com sucesso!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro durante a migração: {e}")
+
+if __name__ == '__main__':
+    run_migration()
@@ -0,0 +1,78 @@
+"""
+Script para adicionar a coluna users.name_normalized (nome sem acentos, em minúsculas),
+preencher os registros existentes e criar os índices usados pela busca de profissionais
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from flask import Flask
+from sqlalchemy import text, inspect
+
+from src.models.user import db
+from src.utils.text import fold_text
+
+BATCH_SIZE = 1000
+
+# Aplicação mínima: importar src.main rodaria create_all, o DDL do índice trigram e a
+# construção do índice de busca, que já esperam a coluna name_normalized
+# Mesma pasta instance/ da aplicação: o SQLite local é o mesmo arquivo
+app = Flask(__name__, instance_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'instance')))
+database_url = os.environ.get('DATABASE_URL')
+if database_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace('postgres://', 'postgresql://', 1)
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///saude_connect.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+def run_migration():
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            is_postgres = db.engine.dialect.name == 'postgresql'
+
+            columns = [c['name'] for c in inspector.get_columns('users')]
+            if 'name_normalized' not in columns:
+                print("Adicionando coluna name_normalized à tabela users...")
+                db.session.execute(text("ALTER TABLE users ADD COLUMN name_normalized VARCHAR(100)"))
+                db.session.commit()
+            else:
+                print("A coluna name_normalized já existe na tabela users.")
+
+            # Preencher em lotes para não manter a tabela travada
+            total = 0
+            last_id = 0
+            while True:
+                rows = db.session.execute(
+                    text("SELECT id, name FROM users WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                    {"last_id": last_id, "limit": BATCH_SIZE}
+                ).fetchall()
+                if not rows:
+                    break
+                db.session.execute(
+                    text("UPDATE users SET name_normalized = :name_normalized WHERE id = :id"),
+                    [{"id": row.id, "name_normalized": fold_text(row.name)} for row in rows]
+                )
+                db.session.commit()
+                total += len(rows)
+                last_id = rows[-1].id
+            print(f"{total} usuários atualizados.")
+
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_users_name_normalized ON users (name_normalized)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_professionals_approval_status_id ON professionals (approval_status, id)"))
+            if is_postgres:
+                db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                db.session.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_users_name_normalized_trgm ON users USING gin (name_normalized gin_trgm_ops)"
+                ))
+            db.session.commit()
+
+            print("Migração concluída com sucesso!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro durante a migração: {e}")
+
+if __name__ == '__main__':
+    run_migration()
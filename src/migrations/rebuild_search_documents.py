@@ -0,0 +1,43 @@
+"""
+Script para (re)criar os documentos da busca textual de profissionais
+(tsvector no PostgreSQL, FTS5 no SQLite) a partir das tabelas atuais
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from flask import Flask
+
+from src.models.user import db
+# Modelos importados para que os mapeamentos se resolvam e o create_all crie todas as tabelas
+from src.models import (  # noqa: F401
+    auth_token, availability, booking, booking_rollup, category, outbox, patient, professional,
+    professional_activity, stored_file
+)
+from src.utils.full_text import rebuild_all_documents
+
+# Aplicação mínima: importar src.main exigiria as chaves de assinatura e subiria o
+# agendador e o índice de busca
+# Mesma pasta instance/ da aplicação: o SQLite local é o mesmo arquivo
+app = Flask(__name__, instance_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'instance')))
+database_url = os.environ.get('DATABASE_URL')
+if database_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace('postgres://', 'postgresql://', 1)
+else:
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///saude_connect.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+def run_migration():
+    with app.app_context():
+        try:
+            # Garante que a tabela/índice de documentos existam
+            db.create_all()
+            total = rebuild_all_documents(db.engine)
+            print(f"{total} documentos de busca recriados.")
+            print("Migração concluída com sucesso!")
+        except Exception as e:
+            print(f"Erro durante a migração: {e}")
+
+if __name__ == '__main__':
+    run_migration()
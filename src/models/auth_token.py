@@ -0,0 +1,46 @@
+from src.models.user import db
+from datetime import datetime
+
+class RefreshToken(db.Model):
+    """
+    Refresh token opaco, guardado apenas como hash SHA-256. Cada uso gera um novo token
+    da mesma família (`family_id`); reapresentar um token já usado revoga a família inteira.
+    """
+    __tablename__ = 'refresh_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    family_id = db.Column(db.String(32), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    used_at = db.Column(db.DateTime, nullable=True)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<RefreshToken {self.id} user={self.user_id} family={self.family_id}>'
+
+
+class TokenRevocation(db.Model):
+    """
+    Revogação de access tokens ainda não expirados: um token (kind='jti') ou todos os
+    tokens de um usuário emitidos antes de `not_before` (kind='user'). A linha só
+    precisa existir até `expires_at`, quando os tokens afetados já expiraram, então a
+    tabela fica pequena e cabe inteira no filtro de Bloom de src/utils/tokens.py.
+    """
+    __tablename__ = 'token_revocations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)  # jti, user
+    value = db.Column(db.String(64), nullable=False)
+    not_before = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    # Os workers releem as revogações recentes por created_at
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_token_revocations_kind_value', 'kind', 'value'),
+    )
+
+    def __repr__(self):
+        return f'<TokenRevocation {self.kind}:{self.value}>'
@@ -0,0 +1,83 @@
+from src.models.user import db
+from datetime import datetime
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+class AvailabilityWindow(db.Model):
+    """
+    Janela semanal recorrente de atendimento. O horário é guardado em minutos desde
+    segunda-feira 00:00 (0 a 10080), o que permite buscar por intervalo com um índice.
+    """
+    __tablename__ = 'availability_windows'
+
+    id = db.Column(db.Integer, primary_key=True)
+    professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id', ondelete='CASCADE'), nullable=False, index=True)
+    start_week_minute = db.Column(db.Integer, nullable=False)
+    end_week_minute = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # "Quem atende no intervalo [a, b)?" vira start <= a AND end >= b
+    __table_args__ = (
+        db.Index('ix_availability_windows_interval', 'start_week_minute', 'end_week_minute', 'professional_id'),
+        db.CheckConstraint('start_week_minute >= 0 AND end_week_minute <= 10080 AND start_week_minute < end_week_minute',
+                           name='ck_availability_windows_range'),
+    )
+
+    def __repr__(self):
+        return f'<AvailabilityWindow {self.professional_id} {self.start_week_minute}-{self.end_week_minute}>'
+
+    def serialize_days(self):
+        """
+        A janela no formato aceito pelo PUT, uma entrada por dia: janelas unidas através
+        da meia-noite são guardadas numa linha só, mas voltam partidas em cada virada.
+        """
+        days = []
+        start = self.start_week_minute
+        while start < self.end_week_minute:
+            weekday = start // MINUTES_PER_DAY
+            end = min(self.end_week_minute, (weekday + 1) * MINUTES_PER_DAY)
+            days.append({
+                'id': self.id,
+                'weekday': weekday,
+                'start': _format_minutes(start - weekday * MINUTES_PER_DAY),
+                'end': _format_minutes(end - weekday * MINUTES_PER_DAY)
+            })
+            start = end
+        return days
+
+
+class AvailabilityException(db.Model):
+    """
+    Exceção pontual à agenda semanal: um bloqueio (férias, feriado) ou,
+    com `is_available`, um horário extra de atendimento.
+    """
+    __tablename__ = 'availability_exceptions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id', ondelete='CASCADE'), nullable=False)
+    starts_at = db.Column(db.DateTime, nullable=False)
+    ends_at = db.Column(db.DateTime, nullable=False)
+    is_available = db.Column(db.Boolean, nullable=False, default=False)
+    reason = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_availability_exceptions_professional_starts_at', 'professional_id', 'starts_at'),
+    )
+
+    def __repr__(self):
+        return f'<AvailabilityException {self.professional_id} {self.starts_at}-{self.ends_at}>'
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'starts_at': self.starts_at.isoformat() if self.starts_at else None,
+            'ends_at': self.ends_at.isoformat() if self.ends_at else None,
+            'is_available': self.is_available,
+            'reason': self.reason
+        }
+
+
+def _format_minutes(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
@@ -1,6 +1,14 @@
 from datetime import datetime
+from sqlalchemy import DDL, event
 from src.models.user import db
 
+# 'expired': pendente cujo horário passou sem confirmação (ver src/utils/expiration.py)
+BOOKING_STATUSES = ('pending', 'confirmed', 'cancelled', 'completed', 'expired')
+# Status que ocupam o horário do profissional
+ACTIVE_STATUSES = ('pending', 'confirmed')
+# Agendamentos não têm duração própria; cada um ocupa este intervalo a partir de scheduled_date
+DEFAULT_DURATION_MINUTES = 60
+
 class Booking(db.Model):
     __tablename__ = 'bookings'
     
@@ -8,10 +16,35 @@ class Booking(db.Model):
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
     professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'), nullable=False)
     scheduled_date = db.Column(db.DateTime, nullable=False)  # Renomeado de date_time para scheduled_date
+    # Atividade agendada; define a categoria do agendamento na consolidação diária
+    activity_id = db.Column(db.Integer, db.ForeignKey('activities.id'), nullable=True)
     status = db.Column(db.String(20), nullable=False, default='pending')  # Padronizado para 'pending'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Listagens por paciente/profissional são varreduras de intervalo ordenadas por data
+    __table_args__ = (
+        db.Index('ix_bookings_patient_id_scheduled_date', 'patient_id', 'scheduled_date'),
+        db.Index('ix_bookings_professional_id_scheduled_date', 'professional_id', 'scheduled_date'),
+        # Exportações e relatórios por período
+        db.Index('ix_bookings_scheduled_date_id', 'scheduled_date', 'id'),
+        # Alterações recentes, lidas pela recuperação da consolidação diária
+        db.Index('ix_bookings_updated_at_id', 'updated_at', 'id'),
+        # Índice parcial pequeno: só os agendamentos ativos, percorridos pela expiração
+        db.Index(
+            'ix_bookings_active_scheduled_date', 'scheduled_date', 'id',
+            postgresql_where=db.text("status IN ('pending', 'confirmed')"),
+            sqlite_where=db.text("status IN ('pending', 'confirmed')")
+        ),
+        # Dois agendamentos ativos não podem começar no mesmo horário do mesmo profissional
+        db.Index(
+            'uq_bookings_professional_active_slot', 'professional_id', 'scheduled_date',
+            unique=True,
+            postgresql_where=db.text("status IN ('pending', 'confirmed')"),
+            sqlite_where=db.text("status IN ('pending', 'confirmed')")
+        ),
+    )
+    
     def __repr__(self):
         return f'<Booking {self.id} - {self.status}>'
 
@@ -20,8 +53,29 @@ class Booking(db.Model):
             'id': self.id,
             'patient_id': self.patient_id,
             'professional_id': self.professional_id,
+            'activity_id': self.activity_id,
             'scheduled_date': self.scheduled_date.isoformat() if self.scheduled_date else None,
             'status': self.status,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+# No PostgreSQL, a sobreposição de horários (não só o mesmo início) é barrada por uma
+# exclusion constraint; no SQLite o insert condicional de `insert_booking_if_free` cumpre
+# esse papel, já que as escritas são serializadas.
+event.listen(
+    Booking.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
+event.listen(
+    Booking.__table__,
+    'after_create',
+    DDL(f"""
+        ALTER TABLE bookings ADD CONSTRAINT ex_bookings_professional_overlap EXCLUDE USING gist (
+            professional_id WITH =,
+            tsrange(scheduled_date, scheduled_date + interval '{DEFAULT_DURATION_MINUTES} minutes') WITH &&
+        ) WHERE (status IN ('pending', 'confirmed'))
+    """).execute_if(dialect='postgresql')
+)
@@ -0,0 +1,33 @@
+from src.models.user import db
+from datetime import datetime
+
+# Colunas da chave primária não aceitam NULL: agendamentos sem atividade (ou com
+# atividade sem categoria) ficam nesta categoria
+NO_CATEGORY = 0
+
+class BookingDailyRollup(db.Model):
+    """
+    Total de agendamentos por dia, profissional, categoria e status, mantido por
+    src/utils/booking_rollups.py. A categoria é a da atividade agendada
+    (bookings.activity_id), não as atividades que o profissional oferece hoje.
+    """
+    __tablename__ = 'booking_daily_rollups'
+
+    # A chave começa pelo dia: consultas por período são varreduras de intervalo
+    day = db.Column(db.Date, primary_key=True)
+    professional_id = db.Column(db.Integer, primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True, default=NO_CATEGORY)
+    status = db.Column(db.String(20), primary_key=True)
+    booking_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<BookingDailyRollup {self.day} {self.professional_id} {self.category_id} {self.status}={self.booking_count}>'
+
+
+class RollupWatermark(db.Model):
+    """Até quando (bookings.updated_at) o job de recuperação já processou."""
+    __tablename__ = 'rollup_watermarks'
+
+    name = db.Column(db.String(50), primary_key=True)
+    processed_until = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,50 @@
+from src.models.user import db
+from datetime import datetime
+
+class OutboxMessage(db.Model):
+    """
+    Notificação a entregar, gravada na mesma transação da alteração que a originou.
+    Os workers de src/utils/notifications.py consomem as linhas 'pending' cujo
+    `available_at` já passou; o mesmo campo serve de prazo de posse durante o envio
+    e de horário da próxima tentativa após uma falha.
+    """
+    __tablename__ = 'outbox_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # booking_created, booking_updated
+    booking_id = db.Column(db.Integer, nullable=False)
+    recipient_role = db.Column(db.String(20), nullable=False)  # patient, professional
+    payload = db.Column(db.JSON, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    # Só as mensagens pendentes são varridas pelos workers
+    __table_args__ = (
+        db.Index(
+            'ix_outbox_messages_pending_available_at', 'available_at', 'id',
+            postgresql_where=db.text("status = 'pending'"),
+            sqlite_where=db.text("status = 'pending'")
+        ),
+    )
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} {self.event_type} {self.status}>'
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'booking_id': self.booking_id,
+            'recipient_role': self.recipient_role,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'available_at': self.available_at.isoformat() if self.available_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
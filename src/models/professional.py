@@ -1,5 +1,8 @@
+from sqlalchemy.orm import validates
 from src.models.user import db
 from src.models.professional_activity import ProfessionalActivity
+from src.models.availability import AvailabilityWindow, AvailabilityException
+from src.utils.text import fold_text
 from datetime import datetime
 
 class Professional(db.Model):
@@ -10,15 +13,37 @@ class Professional(db.Model):
     document_number = db.Column(db.String(50), nullable=False)  # CPF ou documento profissional - aumentado para 50
     diploma_file = db.Column(db.Text, nullable=False)  # Caminho para o arquivo do diploma - alterado para Text
     bio = db.Column(db.Text, nullable=True)
-    approval_status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
+    # Bio sem acentos e em minúsculas, usada pelo filtro de palavras-chave no banco (mantida por `_sync_bio_normalized`)
+    bio_normalized = db.Column(db.Text, nullable=True)
+    approval_status = db.Column(db.String(20), default='pending')  # pending, approved, rejected, expired
     approval_date = db.Column(db.DateTime, nullable=True)
     rejection_reason = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Busca e paginação por chave filtram por status e ordenam por id
+    __table_args__ = (
+        db.Index('ix_professionals_approval_status_id', 'approval_status', 'id'),
+        # Cadastros pendentes por antiguidade, percorridos pela expiração
+        db.Index(
+            'ix_professionals_pending_created_at', 'created_at', 'id',
+            postgresql_where=db.text("approval_status = 'pending'"),
+            sqlite_where=db.text("approval_status = 'pending'")
+        ),
+    )
+    
     # Relacionamento com atividades/especialidades
     activities = db.relationship('ProfessionalActivity', backref='professional', cascade='all, delete-orphan')
     
+    # Agenda estruturada (janelas semanais e exceções)
+    availability_windows = db.relationship('AvailabilityWindow', cascade='all, delete-orphan', passive_deletes=True)
+    availability_exceptions = db.relationship('AvailabilityException', cascade='all, delete-orphan', passive_deletes=True)
+    
+    @validates('bio')
+    def _sync_bio_normalized(self, key, bio):
+        self.bio_normalized = fold_text(bio)
+        return bio
+    
     def __repr__(self):
         return f'<Professional {self.id}>'
 
@@ -35,6 +60,7 @@ class Activity(db.Model):
     
     # Relacionamento com profissionais
     professionals = db.relationship('ProfessionalActivity', backref='activity')
+    category = db.relationship('Category')
     
     def __repr__(self):
         return f'<Activity {self.name}>'
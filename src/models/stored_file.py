@@ -0,0 +1,24 @@
+from src.models.user import db
+from datetime import datetime
+
+class StoredFile(db.Model):
+    """
+    Arquivo enviado, guardado uma única vez pelo conteúdo (SHA-256). `ref_count` conta
+    os registros que apontam para ele (hoje, Professional.diploma_file) e é mantido por
+    src/utils/uploads.py; com zero referências o arquivo é removido por `flask uploads-gc`.
+    """
+    __tablename__ = 'stored_files'
+
+    # Caminho relativo à pasta de uploads: '<2 primeiros dígitos>/<sha256>.<extensão>'
+    key = db.Column(db.String(80), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Atualizado a cada novo envio do mesmo conteúdo: protege o arquivo da coleta
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Quando as pré-visualizações ficaram prontas (src/utils/previews.py); None enquanto não
+    previews_ready_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<StoredFile {self.key} refs={self.ref_count}>'
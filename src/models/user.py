@@ -1,5 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import validates
 from datetime import datetime
+from src.utils.text import fold_text
 
 db = SQLAlchemy()
 
@@ -10,14 +13,36 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
     name = db.Column(db.String(100), nullable=False)
+    # Nome sem acentos e em minúsculas, usado na busca por nome (mantido por `_sync_name_normalized`)
+    name_normalized = db.Column(db.String(100), nullable=True, index=True)
     phone = db.Column(db.String(20), nullable=True)
     user_type = db.Column(db.String(20), nullable=False)  # 'professional', 'patient', 'admin'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Índice trigram para buscas por substring (LIKE '%termo%') no PostgreSQL
+    __table_args__ = (
+        db.Index(
+            'ix_users_name_normalized_trgm', 'name_normalized',
+            postgresql_using='gin', postgresql_ops={'name_normalized': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
+    
     # Relacionamento com perfil específico baseado no tipo de usuário
     professional = db.relationship('Professional', backref='user', uselist=False, cascade='all, delete-orphan')
     patient = db.relationship('Patient', backref='user', uselist=False, cascade='all, delete-orphan')
     
+    @validates('name')
+    def _sync_name_normalized(self, key, name):
+        self.name_normalized = fold_text(name)
+        return name
+    
     def __repr__(self):
         return f'<User {self.email}>'
+
+# O índice trigram depende da extensão pg_trgm
+event.listen(
+    User.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
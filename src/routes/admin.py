@@ -1,57 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from src.models.user import User, db
 from src.models.professional import Professional, Activity
 from src.models.professional_activity import ProfessionalActivity # For checking usage in delete_activity
 from src.models.category import Category
-# from src.utils.auth import admin_required # Removed as per task
-from datetime import datetime
-from functools import wraps
-import jwt
-import os 
-from flask import current_app
-
-# Middleware para verificar se o usuário é administrador
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization') # More robust way to get header
-
-        if auth_header and auth_header.startswith('Bearer '):
-            try:
-                token = auth_header.split(" ")[1]
-            except IndexError:
-                return jsonify({'error': 'Formato de token inválido. Use "Bearer <token>"'}), 401
-        
-        if not token:
-            return jsonify({'error': 'Token de autenticação não fornecido ou malformado'}), 401
-
-        try:
-            # Use current_app.config for SECRET_KEY
-            secret_key = current_app.config.get('SECRET_KEY')
-            if not secret_key:
-                # Fallback if not set in app config, though it should be
-                secret_key = os.environ.get('SECRET_KEY', 'dev_secret_key_for_testing')
-
-            data = jwt.decode(token, secret_key, algorithms=["HS256"])
-            
-            # Ensure 'user_type' is in the token payload
-            if 'user_type' not in data:
-                return jsonify({'error': 'Token inválido: user_type ausente'}), 401
-
-            if data['user_type'] != 'admin':
-                return jsonify({'error': 'Acesso restrito a administradores'}), 403
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expirado'}), 401
-        except jwt.InvalidTokenError: # Catches various JWT errors like invalid signature, malformed token
-            return jsonify({'error': 'Token inválido ou malformado'}), 401
-        except Exception as e: # Catch any other unexpected errors during token decoding
-            # It's good to log this error on the server side for debugging
-            # print(f"Unexpected error during token decoding: {e}") 
-            return jsonify({'error': 'Erro interno ao processar token'}), 500
-            
-        return f(*args, **kwargs)
-    return decorated
+from src.models.booking import Booking
+from src.utils.catalog_cache import get_catalog_cache
+from src.utils.expiration import get_expiration_scheduler
+from src.utils.booking_rollups import GROUP_BY_DIMENSIONS, rollup_stats
+from src.utils.auth import admin_required
+from src.utils.previews import preview_urls, ready_keys
+from src.utils.tokens import revoke_user_tokens
+from datetime import date, datetime
+from sqlalchemy import select
+import csv
+import io
+import json
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -66,6 +29,8 @@ def get_pending_professionals():
             .add_columns(User.name, User.email, Professional.id, Professional.user_id, Professional.document_number, Professional.diploma_file, Professional.bio, Professional.created_at)\
             .all()
         
+        # Uma consulta para a fila inteira, não uma verificação no armazenamento por diploma
+        ready = ready_keys(prof_data.diploma_file for prof_data in pending_professionals)
         results = []
         for prof_data in pending_professionals:
             results.append({
@@ -75,6 +40,8 @@ def get_pending_professionals():
                 "email": prof_data.email,
                 "document_number": prof_data.document_number,
                 "diploma_file": prof_data.diploma_file,
+                # Miniatura e primeira página; o original enquanto não ficam prontas
+                **preview_urls(prof_data.diploma_file, prof_data.diploma_file in ready),
                 "bio": prof_data.bio,
                 "approval_status": 'pending', # Explicitly set as we filtered for it
                 "created_at": prof_data.created_at.isoformat() if prof_data.created_at else None,
@@ -197,6 +164,7 @@ def add_activity():
         )
         db.session.add(new_activity)
         db.session.commit()
+        get_catalog_cache().bump_version()
         
         category_info = None
         if new_activity.category_id is not None:
@@ -248,6 +216,7 @@ def update_activity(activity_id):
         
         # activity.updated_at = datetime.utcnow() # Add if Activity model has updated_at
         db.session.commit()
+        get_catalog_cache().bump_version()
 
         category_info = None
         if activity.category_id is not None:
@@ -284,12 +253,147 @@ def delete_activity(activity_id):
 
         db.session.delete(activity)
         db.session.commit()
+        get_catalog_cache().bump_version()
         return jsonify({"message": "Activity deleted successfully"}), 200
     except Exception as e:
         db.session.rollback()
         # Log the error e
         return jsonify({"message": "Error deleting activity", "error": str(e)}), 500
 
+# Exportação de agendamentos para relatórios
+
+EXPORT_COLUMNS = ('id', 'patient_id', 'professional_id', 'scheduled_date', 'status', 'created_at', 'updated_at')
+DEFAULT_EXPORT_BATCH_SIZE = 1000
+
+def _export_record(row):
+    # Mesmo formato de Booking.serialize()
+    return {
+        column: value.isoformat() if isinstance(value, datetime) else value
+        for column, value in zip(EXPORT_COLUMNS, row)
+    }
+
+def _format_ndjson(rows):
+    return ''.join(json.dumps(_export_record(row), ensure_ascii=False) + '\n' for row in rows)
+
+def _format_csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(_export_record(row).values() for row in rows)
+    return buffer.getvalue()
+
+@admin_bp.route('/bookings/export', methods=['GET'])
+@admin_required
+def export_bookings():
+    """
+    Exporta agendamentos em NDJSON (padrão) ou CSV como resposta em streaming.
+    As linhas são lidas com cursor no servidor, em lotes, e escritas à medida que
+    chegam: a memória do worker não depende do total exportado.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({"message": "Formato inválido. Use 'ndjson' ou 'csv'."}), 400
+    try:
+        date_from = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        date_to = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"message": "Datas inválidas. Use o formato ISO 8601."}), 400
+
+    query = select(*(getattr(Booking, column) for column in EXPORT_COLUMNS))
+    # O intervalo de datas usa o índice (scheduled_date, id), que também entrega a ordem
+    if date_from:
+        query = query.where(Booking.scheduled_date >= date_from)
+    if date_to:
+        query = query.where(Booking.scheduled_date < date_to)
+    if request.args.get('status'):
+        query = query.where(Booking.status.in_(request.args['status'].split(',')))
+    query = query.order_by(Booking.scheduled_date, Booking.id)
+
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', DEFAULT_EXPORT_BATCH_SIZE)
+    formatter = _format_csv if export_format == 'csv' else _format_ndjson
+    engine = db.engine
+
+    def generate():
+        if export_format == 'csv':
+            yield _format_csv([], header=True)
+        # Conexão própria, fora da sessão da requisição, mantida só enquanto o corpo é enviado
+        with engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+            for rows in result.partitions():
+                yield formatter(rows)
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=bookings.{extension}'
+    return response
+
+@admin_bp.route('/stats/bookings', methods=['GET'])
+@admin_required
+def booking_stats():
+    """
+    Totais de agendamentos por período lidos da consolidação diária.
+    Parâmetros: from/to (AAAA-MM-DD, inclusivos), group_by (day, professional,
+    category, status; separados por vírgula), professional_id, category_id, status.
+    """
+    try:
+        date_from = date.fromisoformat(request.args['from'])
+        date_to = date.fromisoformat(request.args['to'])
+        professional_id = int(request.args['professional_id']) if request.args.get('professional_id') else None
+        category_id = int(request.args['category_id']) if request.args.get('category_id') else None
+    except (KeyError, ValueError):
+        return jsonify({"message": "Informe from e to no formato AAAA-MM-DD; ids devem ser numéricos."}), 400
+    group_by = [d for d in request.args.get('group_by', 'day').split(',') if d]
+    invalid = [d for d in group_by if d not in GROUP_BY_DIMENSIONS]
+    if invalid or date_from > date_to:
+        return jsonify({"message": f"Agrupamento ou período inválido. Agrupamentos: {list(GROUP_BY_DIMENSIONS)}"}), 400
+    statuses = request.args['status'].split(',') if request.args.get('status') else None
+
+    try:
+        stats = rollup_stats(db.session, date_from, date_to, group_by, professional_id, category_id, statuses)
+        return jsonify({
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat(),
+            'group_by': group_by,
+            **stats
+        }), 200
+    except Exception as e:
+        return jsonify({"message": "Error fetching booking stats", "error": str(e)}), 500
+
+@admin_bp.route('/maintenance/expiration', methods=['GET'])
+@admin_required
+def expiration_metrics():
+    scheduler = get_expiration_scheduler()
+    if scheduler is None:
+        return jsonify({"message": "Agendador de expiração não configurado"}), 404
+    return jsonify(scheduler.metrics()), 200
+
+@admin_bp.route('/maintenance/expiration', methods=['POST'])
+@admin_required
+def run_expiration():
+    scheduler = get_expiration_scheduler()
+    if scheduler is None:
+        return jsonify({"message": "Agendador de expiração não configurado"}), 404
+    metrics = scheduler.run_once()
+    if metrics is None:
+        return jsonify({"message": "Erro ao expirar registros pendentes"}), 500
+    return jsonify(metrics), 200
+
+@admin_bp.route('/users/<int:user_id>/revoke-tokens', methods=['POST'])
+@admin_required
+def revoke_tokens(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    try:
+        revoke_user_tokens(db.session, user.id)
+        db.session.commit()
+        return jsonify({"message": "Sessões do usuário revogadas"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Error revoking tokens", "error": str(e)}), 500
+
 # Ensure this blueprint is registered in app.py or main.py
 # from src.routes.admin import admin_bp
 # app.register_blueprint(admin_bp)
@@ -1,17 +1,23 @@
-from flask import Blueprint, request, jsonify, current_app
-import os
-import jwt
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-import uuid
-from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, jsonify, current_app
+from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
 
 from src.models.user import db, User
 from src.models.professional import Professional, Activity, ProfessionalActivity
+from src.utils.passwords import PasswordHasherBusy, busy_response, get_password_hasher
+from src.utils.rate_limit import rate_limited
+from src.utils.auth import token_required
+from src.utils.signing_keys import DEFAULT_JWKS_MAX_AGE, get_key_set
+from src.utils.tokens import (
+    access_token_ttl, issue_access_token, issue_refresh_token, revoke_access_token,
+    revoke_refresh_token, rotate_refresh_token
+)
+from src.utils.uploads import store_upload
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited('login', error_key='message')
 def login():
     try:
         # Verificar se a requisição é JSON
@@ -29,24 +35,26 @@ def login():
             
         user = User.query.filter_by(email=data.get('email')).first()
         
-        if not user or not check_password_hash(user.password, data.get('password')):
+        hasher = get_password_hasher()
+        if not hasher.verify(user.password if user else None, data.get('password')):
             return jsonify({'message': 'Email ou senha incorretos'}), 401
+
+        # Hash gravado com algoritmo/custo antigos: refaz com a configuração atual
+        if hasher.needs_rehash(user.password):
+            try:
+                user.password = hasher.rehash(data.get('password'))
+            except PasswordHasherBusy:
+                # O login já foi validado; o rehash fica para a próxima vez
+                pass
             
-        # Gerar token JWT
-        token_payload = {
-            'user_id': user.id,
-            'user_type': user.user_type,
-            'exp': datetime.utcnow() + timedelta(days=1)
-        }
-        
-        token = jwt.encode(
-            token_payload,
-            current_app.config['SECRET_KEY'],
-            algorithm='HS256'
-        )
-        
+        # Access token curto + refresh token rotativo (grava também o rehash, se houve)
+        refresh_token = issue_refresh_token(db.session, user.id)
+        db.session.commit()
+
         return jsonify({
-            'token': token,
+            'token': issue_access_token(user),
+            'refresh_token': refresh_token,
+            'expires_in': access_token_ttl(),
             'user': {
                 'id': user.id,
                 'name': user.name,
@@ -55,20 +63,74 @@ def login():
             }
         }), 200
         
+    except PasswordHasherBusy:
+        return busy_response('message')
     except Exception as e:
         return jsonify({'message': f'Erro no login: {str(e)}'}), 500
 
-# Configuração para upload de arquivos
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads')
-ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh():
+    data = request.get_json(silent=True) or {}
+    if not data.get('refresh_token'):
+        return jsonify({'message': 'Refresh token ausente'}), 400
+    try:
+        rotated = rotate_refresh_token(db.session, data['refresh_token'])
+        # Commit também na falha: reutilizar um token já trocado revoga a família
+        db.session.commit()
+        if rotated is None:
+            return jsonify({'message': 'Refresh token inválido ou expirado'}), 401
+        user_id, refresh_token = rotated
 
-# Criar diretório de uploads se não existir
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'message': 'Refresh token inválido ou expirado'}), 401
+        return jsonify({
+            'token': issue_access_token(user),
+            'refresh_token': refresh_token,
+            'expires_in': access_token_ttl()
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Erro ao renovar o token: {str(e)}'}), 500
+
+@auth_bp.route('/logout', methods=['POST'])
+@token_required
+def logout():
+    data = request.get_json(silent=True) or {}
+    try:
+        if request.token_claims.get('jti'):
+            revoke_access_token(db.session, request.token_claims)
+        if data.get('refresh_token'):
+            revoke_refresh_token(db.session, data['refresh_token'])
+        db.session.commit()
+        return jsonify({'message': 'Sessão encerrada'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Erro ao encerrar a sessão: {str(e)}'}), 500
+
+@auth_bp.route('/jwks.json', methods=['GET'])
+def jwks():
+    # Chaves públicas para validar os access tokens fora desta aplicação
+    body, etag = get_key_set().jwks()
+    response = Response(body, mimetype='application/jwk-set+json')
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('JWKS_MAX_AGE', DEFAULT_JWKS_MAX_AGE)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# Configuração para upload de arquivos (pasta e limites em src/utils/uploads.py)
+ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@auth_bp.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    # O arquivo é lido durante o parse do formulário, antes ou dentro da rota
+    return jsonify({'error': 'Arquivo maior que o tamanho máximo permitido'}), 413
+
 @auth_bp.route('/register/professional', methods=['POST'])
+@rate_limited('register')
 def register_professional():
     try:
         # Verificar se a requisição contém dados de formulário
@@ -98,16 +160,16 @@ def register_professional():
         if not allowed_file(diploma_file.filename):
             return jsonify({'error': 'Formato de arquivo não permitido. Use PDF, PNG, JPG ou JPEG'}), 400
         
-        # Salvar o arquivo com nome único
-        filename = secure_filename(diploma_file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-        diploma_file.save(file_path)
+        # Hash antes de gravar o diploma: sem vaga para o hash, nada fica salvo em disco
+        password_hash = get_password_hasher().hash(data.get('password'))
+
+        # Já recebido em disco durante o upload; aqui só ganha o nome pelo conteúdo
+        diploma_key = store_upload(diploma_file)
         
         # Criar usuário
         new_user = User(
             email=data.get('email'),
-            password=generate_password_hash(data.get('password')),
+            password=password_hash,
             name=data.get('name'),
             phone=data.get('phone', ''),
             user_type='professional'
@@ -130,7 +192,7 @@ def register_professional():
         new_professional = Professional(
             user_id=new_user.id,
             document_number=document_number,
-            diploma_file=unique_filename,
+            diploma_file=diploma_key,
             bio=bio,
             approval_status='pending'
         )
@@ -181,11 +243,18 @@ def register_professional():
             'user_id': new_user.id
         }), 201
         
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return busy_response()
+    except RequestEntityTooLarge:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/register/patient', methods=['POST'])
+@rate_limited('register')
 def register_patient():
     try:
         # Verificar se a requisição é JSON
@@ -211,7 +280,7 @@ def register_patient():
         # Criar usuário
         new_user = User(
             email=data.get('email'),
-            password=generate_password_hash(data.get('password')),
+            password=get_password_hasher().hash(data.get('password')),
             name=data.get('name'),
             phone=data.get('phone', ''),
             user_type='patient'
@@ -254,6 +323,9 @@ def register_patient():
             'user_id': new_user.id
         }), 201
         
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -1,16 +1,83 @@
-from flask import Blueprint, request, jsonify
-from src.models.booking import Booking, db
+from flask import Blueprint, request, jsonify, current_app
+from src.models.booking import Booking, ACTIVE_STATUSES, BOOKING_STATUSES, db
+from src.models.professional import Professional
 from src.utils.auth import token_required
+from src.utils.pagination import parse_limit, encode_cursor, decode_cursor
+from src.utils.notifications import enqueue_booking_event
+from src.utils.booking_rollups import refresh_rollups_for
+from src.utils.bookings import (
+    insert_booking_if_free, nearest_free_slots, overlapping_booking_condition, find_conflicts,
+    offered_activities
+)
+from sqlalchemy import insert, tuple_
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 
 booking_bp = Blueprint('booking', __name__, url_prefix='/api/booking')
 
+DEFAULT_BATCH_MAX_ITEMS = 500
+
+def _scope_to_caller(query):
+    """
+    Restringe a consulta aos agendamentos que o usuário do token pode ver: todos para
+    administradores, os do próprio profissional ou os do próprio paciente. Retorna None
+    se o usuário profissional ainda não tiver cadastro de profissional.
+    """
+    if request.user_type == 'admin':
+        return query
+    if request.user_type == 'professional':
+        professional_id = db.session.query(Professional.id).filter_by(user_id=request.user_id).scalar()
+        if professional_id is None:
+            return None
+        return query.filter(Booking.professional_id == professional_id)
+    return query.filter(Booking.patient_id == request.user_id)
+
 @booking_bp.route('/', methods=['GET'])
 @token_required
 def list_bookings():
     try:
-        bookings = Booking.query.all()
-        return jsonify([b.serialize() for b in bookings]), 200
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+            after = (datetime.fromisoformat(cursor['scheduled_date']), int(cursor['id'])) if cursor else None
+            date_from = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+            date_to = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Parâmetros de paginação ou datas inválidos'}), 400
+
+        query = _scope_to_caller(Booking.query)
+        if query is None:
+            return jsonify([]), 200
+
+        # Administradores podem filtrar por paciente ou profissional
+        if request.user_type == 'admin':
+            if request.args.get('patient_id'):
+                query = query.filter(Booking.patient_id == request.args.get('patient_id', type=int))
+            if request.args.get('professional_id'):
+                query = query.filter(Booking.professional_id == request.args.get('professional_id', type=int))
+
+        status = request.args.get('status')
+        if status:
+            query = query.filter(Booking.status.in_(status.split(',')))
+        if date_from:
+            query = query.filter(Booking.scheduled_date >= date_from)
+        if date_to:
+            query = query.filter(Booking.scheduled_date < date_to)
+
+        # Paginação por chave sobre (scheduled_date, id), coberta pelos índices compostos
+        if after:
+            query = query.filter(tuple_(Booking.scheduled_date, Booking.id) > tuple_(*after))
+
+        bookings = query.order_by(Booking.scheduled_date, Booking.id).limit(limit + 1).all()
+
+        response = jsonify([b.serialize() for b in bookings[:limit]])
+        if len(bookings) > limit:
+            last = bookings[limit - 1]
+            response.headers['X-Next-Cursor'] = encode_cursor({
+                'scheduled_date': last.scheduled_date.isoformat(),
+                'id': last.id
+            })
+        return response, 200
     except Exception as e:
         return jsonify({'error': f'Erro ao listar agendamentos: {str(e)}'}), 500
 
@@ -23,20 +90,52 @@ def get_booking(id):
     except Exception as e:
         return jsonify({'error': f'Erro ao buscar agendamento: {str(e)}'}), 500
 
+def _conflict_response(professional_id, scheduled_date):
+    """409 com os horários livres mais próximos, para o cliente oferecer alternativas."""
+    alternatives = nearest_free_slots(db.session, professional_id, scheduled_date)
+    return jsonify({
+        'error': 'Horário indisponível para este profissional.',
+        'alternatives': [
+            {'starts_at': starts_at.isoformat(), 'ends_at': ends_at.isoformat()}
+            for starts_at, ends_at in alternatives
+        ]
+    }), 409
+
 @booking_bp.route('/', methods=['POST'])
 @token_required
 def create_booking():
     try:
-        data = request.json
-        new_booking = Booking(
-            patient_id=request.user_id,
-            professional_id=data['professional_id'],
-            scheduled_date=datetime.fromisoformat(data['scheduled_date']),
-            status=data.get('status', 'pending')
-        )
-        db.session.add(new_booking)
+        data = request.json or {}
+        try:
+            professional_id = int(data['professional_id'])
+            scheduled_date = datetime.fromisoformat(data['scheduled_date'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'professional_id e scheduled_date são obrigatórios'}), 400
+        status = data.get('status', 'pending')
+        if status not in BOOKING_STATUSES:
+            return jsonify({'error': f'Status inválido: {status}'}), 400
+        try:
+            activity_id = _parse_activity_id(data)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'activity_id deve ser numérico'}), 400
+        if activity_id is not None and not offered_activities(db.session, [(professional_id, activity_id)]):
+            return jsonify({'error': 'Atividade não oferecida por este profissional'}), 400
+
+        # O teste de conflito e a gravação são um único comando: não há janela entre eles
+        try:
+            booking_id = insert_booking_if_free(
+                db.session, request.user_id, professional_id, scheduled_date, status, activity_id
+            )
+        except IntegrityError:
+            booking_id = None
+        if booking_id is None:
+            db.session.rollback()
+            return _conflict_response(professional_id, scheduled_date)
+
+        enqueue_booking_event(db.session, booking_id, 'booking_created')
+        refresh_rollups_for(db.session, [(professional_id, scheduled_date)])
         db.session.commit()
-        return jsonify(new_booking.serialize()), 201
+        return jsonify(db.session.get(Booking, booking_id).serialize()), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Erro ao criar agendamento: {str(e)}'}), 500
@@ -47,21 +146,221 @@ def update_booking(id):
     try:
         booking = Booking.query.get_or_404(id)
         data = request.json
+        if 'status' in data and data['status'] not in BOOKING_STATUSES:
+            return jsonify({'error': f"Status inválido: {data['status']}"}), 400
+        previous_slot = (booking.professional_id, booking.scheduled_date)
+        if 'activity_id' in data:
+            try:
+                activity_id = _parse_activity_id(data)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'activity_id deve ser numérico'}), 400
+            if activity_id is not None and not offered_activities(db.session, [(booking.professional_id, activity_id)]):
+                return jsonify({'error': 'Atividade não oferecida por este profissional'}), 400
+            booking.activity_id = activity_id
         if 'scheduled_date' in data:
             booking.scheduled_date = datetime.fromisoformat(data['scheduled_date'])
         booking.status = data.get('status', booking.status)
-        db.session.commit()
+        professional_id, scheduled_date = booking.professional_id, booking.scheduled_date
+        # Antes da consulta de conflito, cujo autoflush limparia o estado de alteração
+        changed = db.session.is_modified(booking)
+        if booking.status in ACTIVE_STATUSES:
+            conflict = db.session.query(
+                Booking.query.filter(
+                    overlapping_booking_condition(professional_id, scheduled_date),
+                    Booking.id != booking.id
+                ).exists()
+            ).scalar()
+            if conflict:
+                db.session.rollback()
+                return _conflict_response(professional_id, scheduled_date)
+        try:
+            if changed:
+                enqueue_booking_event(db.session, booking.id, 'booking_updated')
+                refresh_rollups_for(db.session, [previous_slot, (professional_id, scheduled_date)])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return _conflict_response(professional_id, scheduled_date)
         return jsonify(booking.serialize()), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Erro ao atualizar agendamento: {str(e)}'}), 500
 
+def _parse_activity_id(data):
+    # Opcional: agendamentos antigos e importações nem sempre trazem a atividade
+    value = data.get('activity_id')
+    return int(value) if value not in (None, '') else None
+
+def _batch_items(data, key):
+    items = data.get(key) if isinstance(data, dict) else None
+    max_items = current_app.config.get('BOOKING_BATCH_MAX_ITEMS', DEFAULT_BATCH_MAX_ITEMS)
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({'error': f"'{key}' deve ser uma lista não vazia"}), 400)
+    if len(items) > max_items:
+        return None, (jsonify({'error': f'No máximo {max_items} itens por lote'}), 400)
+    return items, None
+
+def _batch_response(results):
+    failed = sum(1 for r in results if r['result'] != 'ok')
+    body = {'results': results, 'succeeded': len(results) - failed, 'failed': failed}
+    # 207: o lote foi processado, mas parte dos itens não foi aceita
+    return jsonify(body), (207 if failed else 200)
+
+@booking_bp.route('/batch', methods=['POST'])
+@token_required
+def create_bookings_batch():
+    """
+    Cria vários agendamentos em uma transação. Itens inválidos ou em conflito são
+    recusados individualmente; os demais são gravados com um único INSERT em lote.
+    """
+    try:
+        items, error = _batch_items(request.get_json(silent=True), 'bookings')
+        if error:
+            return error
+
+        results = [None] * len(items)
+        accepted = {}
+        for index, item in enumerate(items):
+            try:
+                professional_id = int(item['professional_id'])
+                scheduled_date = datetime.fromisoformat(item['scheduled_date'])
+                status = item.get('status', 'pending')
+                activity_id = _parse_activity_id(item)
+                # Só administradores (importações de clínicas) agendam em nome de outro paciente
+                patient_id = int(item.get('patient_id', request.user_id)) if request.user_type == 'admin' else request.user_id
+            except (KeyError, TypeError, ValueError, AttributeError):
+                results[index] = {'index': index, 'result': 'invalid',
+                                  'error': 'professional_id e scheduled_date são obrigatórios; ids devem ser numéricos'}
+                continue
+            if status not in BOOKING_STATUSES:
+                results[index] = {'index': index, 'result': 'invalid', 'error': f'Status inválido: {status}'}
+                continue
+            accepted[index] = {
+                'patient_id': patient_id,
+                'professional_id': professional_id,
+                'scheduled_date': scheduled_date,
+                'status': status,
+                'activity_id': activity_id,
+            }
+
+        offered = offered_activities(db.session, [
+            (row['professional_id'], row['activity_id']) for row in accepted.values() if row['activity_id'] is not None
+        ])
+        for index, row in list(accepted.items()):
+            if row['activity_id'] is not None and (row['professional_id'], row['activity_id']) not in offered:
+                results[index] = {'index': index, 'result': 'invalid', 'error': 'Atividade não oferecida por este profissional'}
+                del accepted[index]
+
+        conflicts = find_conflicts(db.session, [
+            (index, row['professional_id'], row['scheduled_date'])
+            for index, row in accepted.items() if row['status'] in ACTIVE_STATUSES
+        ])
+        for index in conflicts:
+            results[index] = {'index': index, 'result': 'conflict', 'error': 'Horário indisponível para este profissional.'}
+            del accepted[index]
+
+        if accepted:
+            indexes = list(accepted)
+            try:
+                # Um único INSERT com várias linhas; o RETURNING devolve os objetos na ordem enviada
+                created = db.session.scalars(
+                    insert(Booking).returning(Booking, sort_by_parameter_order=True),
+                    [accepted[index] for index in indexes]
+                ).all()
+            except IntegrityError:
+                # Outra requisição ocupou um dos horários entre a verificação e a gravação
+                db.session.rollback()
+                return jsonify({'error': 'Conflito com agendamentos gravados simultaneamente; nenhum item foi criado. Tente novamente.'}), 409
+            # Serializa antes do commit, que expiraria os objetos e forçaria um SELECT por item
+            for index, booking in zip(indexes, created):
+                results[index] = {'index': index, 'result': 'ok', 'booking': booking.serialize()}
+                enqueue_booking_event(db.session, booking.id, 'booking_created')
+            refresh_rollups_for(db.session, [(b.professional_id, b.scheduled_date) for b in created])
+            db.session.commit()
+
+        return _batch_response(results)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro ao criar agendamentos: {str(e)}'}), 500
+
+@booking_bp.route('/batch/status', methods=['PUT'])
+@token_required
+def update_bookings_status_batch():
+    """Atualiza o status de vários agendamentos do usuário em uma transação."""
+    try:
+        items, error = _batch_items(request.get_json(silent=True), 'updates')
+        if error:
+            return error
+
+        results = [None] * len(items)
+        requested = {}
+        for index, item in enumerate(items):
+            try:
+                booking_id = int(item['id'])
+                status = item['status']
+            except (KeyError, TypeError, ValueError):
+                results[index] = {'index': index, 'result': 'invalid', 'error': 'id e status são obrigatórios'}
+                continue
+            if status not in BOOKING_STATUSES:
+                results[index] = {'index': index, 'result': 'invalid', 'error': f'Status inválido: {status}'}
+            elif booking_id in requested.values():
+                results[index] = {'index': index, 'result': 'invalid', 'error': 'Agendamento repetido no lote'}
+            else:
+                requested[index] = booking_id
+
+        query = _scope_to_caller(Booking.query)
+        bookings = {}
+        if query is not None and requested:
+            bookings = {b.id: b for b in query.filter(Booking.id.in_(requested.values()))}
+        for index, booking_id in list(requested.items()):
+            if booking_id not in bookings:
+                results[index] = {'index': index, 'result': 'not_found', 'error': 'Agendamento não encontrado'}
+                del requested[index]
+
+        # Reativar um agendamento exige que o horário ainda esteja livre
+        reactivated = [
+            (index, bookings[booking_id].professional_id, bookings[booking_id].scheduled_date)
+            for index, booking_id in requested.items()
+            if items[index]['status'] in ACTIVE_STATUSES and bookings[booking_id].status not in ACTIVE_STATUSES
+        ]
+        # Os que serão cancelados/concluídos neste lote liberam o horário
+        released = [booking_id for index, booking_id in requested.items() if items[index]['status'] not in ACTIVE_STATUSES]
+        for index in find_conflicts(db.session, reactivated, exclude_ids=released):
+            results[index] = {'index': index, 'result': 'conflict', 'error': 'Horário indisponível para este profissional.'}
+            del requested[index]
+
+        if requested:
+            now = datetime.utcnow()
+            for index, booking_id in requested.items():
+                bookings[booking_id].status = items[index]['status']
+                bookings[booking_id].updated_at = now
+            try:
+                # Linhas com as mesmas colunas alteradas vão em um único UPDATE executemany
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                return jsonify({'error': 'Conflito com agendamentos gravados simultaneamente; nenhum item foi alterado. Tente novamente.'}), 409
+            for index, booking_id in requested.items():
+                results[index] = {'index': index, 'result': 'ok', 'booking': bookings[booking_id].serialize()}
+                enqueue_booking_event(db.session, booking_id, 'booking_updated')
+            refresh_rollups_for(db.session, [
+                (bookings[booking_id].professional_id, bookings[booking_id].scheduled_date) for booking_id in requested.values()
+            ])
+            db.session.commit()
+
+        return _batch_response(results)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro ao atualizar agendamentos: {str(e)}'}), 500
+
 @booking_bp.route('/<int:id>', methods=['DELETE'])
 @token_required
 def delete_booking(id):
     try:
         booking = Booking.query.get_or_404(id)
+        slot = (booking.professional_id, booking.scheduled_date)
         db.session.delete(booking)
+        refresh_rollups_for(db.session, [slot])
         db.session.commit()
         return jsonify({'message': 'Agendamento deletado com sucesso.'}), 200
     except Exception as e:
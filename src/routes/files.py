@@ -0,0 +1,13 @@
+from flask import Blueprint, request, jsonify
+from src.utils.delivery import send_upload, verify_upload_url
+from src.utils.storage import get_storage
+
+files_bp = Blueprint('files', __name__, url_prefix='/files')
+
+@files_bp.route('/uploads/<path:key>', methods=['GET'])
+def get_upload(key):
+    # Sem token: o link assinado já é a autorização, emitido só para admin e dono
+    remaining = verify_upload_url(key, request.args.get('expires'), request.args.get('signature'))
+    if remaining is None:
+        return jsonify({'error': 'Link inválido ou expirado'}), 403
+    return send_upload(get_storage(), key, max_age=remaining)
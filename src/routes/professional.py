@@ -1,6 +1,14 @@
 from flask import Blueprint, request, jsonify
 from src.models.professional import Professional, db
-from src.utils.auth import token_required
+from src.models.availability import AvailabilityWindow, AvailabilityException
+from src.utils.auth import token_required, roles_required
+from src.models.booking import DEFAULT_DURATION_MINUTES
+from src.utils.availability import normalize_windows, free_slots, parse_datetime
+from src.utils.previews import preview_urls
+from datetime import datetime, timedelta
+
+# Maior intervalo aceito pelo cálculo de horários livres
+MAX_SLOTS_RANGE_DAYS = 92
 
 professional_bp = Blueprint('professional', __name__, url_prefix='/api/professional')
 
@@ -36,7 +44,7 @@ def get_professional(professional_id):
         return jsonify({'error': f'Erro ao buscar profissional: {str(e)}'}), 500
 
 @professional_bp.route('/<int:professional_id>', methods=['PUT'])
-@token_required
+@roles_required('admin', 'professional', error_key='error')
 def update_professional(professional_id):
     try:
         prof = Professional.query.get_or_404(professional_id)
@@ -55,7 +63,7 @@ def update_professional(professional_id):
                     return jsonify({'error': f'Status de aprovação inválido. Valores permitidos: {allowed_statuses}'}), 400
                 prof.approval_status = data['approval_status']
         
-        elif request.user_type == 'professional':
+        else:
             # Check if the professional is updating their own profile
             if prof.user_id != request.user_id:
                 return jsonify({'error': 'Não autorizado a atualizar este perfil'}), 403
@@ -65,10 +73,6 @@ def update_professional(professional_id):
             if 'approval_status' in data:
                 # Professionals cannot change their own approval status
                 return jsonify({'error': 'Você não tem permissão para alterar o status de aprovação.'}), 403
-        
-        else:
-            # Other user types are not authorized
-            return jsonify({'error': 'Não autorizado'}), 403
 
         db.session.commit()
         return jsonify({'message': 'Profissional atualizado com sucesso!'}), 200
@@ -87,3 +91,111 @@ def delete_professional(professional_id):
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Erro ao excluir profissional: {str(e)}'}), 500
+
+@professional_bp.route('/<int:professional_id>/diploma', methods=['GET'])
+@token_required
+def get_diploma(professional_id):
+    try:
+        prof = Professional.query.get_or_404(professional_id)
+        if request.user_type != 'admin' and prof.user_id != request.user_id:
+            return jsonify({'error': 'Não autorizado a ver este diploma'}), 403
+        if not prof.diploma_file:
+            return jsonify({'error': 'Diploma não enviado'}), 404
+        # Links assinados e de curta duração
+        return jsonify(preview_urls(prof.diploma_file)), 200
+    except Exception as e:
+        return jsonify({'error': f'Erro ao buscar diploma: {str(e)}'}), 500
+
+@professional_bp.route('/<int:professional_id>/availability', methods=['GET'])
+@token_required
+def get_availability(professional_id):
+    try:
+        prof = Professional.query.get_or_404(professional_id)
+        windows = AvailabilityWindow.query.filter_by(professional_id=prof.id)\
+            .order_by(AvailabilityWindow.start_week_minute).all()
+        exceptions = AvailabilityException.query.filter_by(professional_id=prof.id)\
+            .order_by(AvailabilityException.starts_at).all()
+        return jsonify({
+            'windows': [day for w in windows for day in w.serialize_days()],
+            'exceptions': [e.serialize() for e in exceptions]
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'Erro ao buscar disponibilidade: {str(e)}'}), 500
+
+@professional_bp.route('/<int:professional_id>/availability', methods=['PUT'])
+@token_required
+def update_availability(professional_id):
+    try:
+        prof = Professional.query.get_or_404(professional_id)
+        if request.user_type != 'admin' and not (request.user_type == 'professional' and prof.user_id == request.user_id):
+            return jsonify({'error': 'Não autorizado a alterar esta agenda'}), 403
+
+        data = request.json
+        if not data:
+            return jsonify({'error': 'Dados não fornecidos'}), 400
+
+        # Substitui a agenda inteira: janelas semanais e/ou exceções enviadas
+        try:
+            intervals = normalize_windows(data['windows']) if 'windows' in data else None
+            exceptions = None
+            if 'exceptions' in data:
+                exceptions = []
+                for item in data['exceptions']:
+                    starts_at = parse_datetime(item['starts_at'])
+                    ends_at = parse_datetime(item['ends_at'])
+                    if starts_at >= ends_at:
+                        raise ValueError('Exceção com início após o fim')
+                    exceptions.append(AvailabilityException(
+                        professional_id=prof.id,
+                        starts_at=starts_at,
+                        ends_at=ends_at,
+                        is_available=bool(item.get('is_available', False)),
+                        reason=item.get('reason')
+                    ))
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Agenda inválida: {str(e)}'}), 400
+
+        if intervals is not None:
+            AvailabilityWindow.query.filter_by(professional_id=prof.id).delete()
+            db.session.add_all([
+                AvailabilityWindow(professional_id=prof.id, start_week_minute=start, end_week_minute=end)
+                for start, end in intervals
+            ])
+        if exceptions is not None:
+            AvailabilityException.query.filter_by(professional_id=prof.id).delete()
+            db.session.add_all(exceptions)
+
+        db.session.commit()
+        return jsonify({'message': 'Disponibilidade atualizada com sucesso!'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro ao atualizar disponibilidade: {str(e)}'}), 500
+
+@professional_bp.route('/<int:professional_id>/slots', methods=['GET'])
+@token_required
+def get_free_slots(professional_id):
+    try:
+        prof = Professional.query.get_or_404(professional_id)
+
+        try:
+            range_start = parse_datetime(request.args['from']) if request.args.get('from') else datetime.utcnow().replace(second=0, microsecond=0)
+            range_end = parse_datetime(request.args['to']) if request.args.get('to') else range_start + timedelta(days=7)
+            duration = int(request.args.get('duration', DEFAULT_DURATION_MINUTES))
+        except ValueError:
+            return jsonify({'error': 'Parâmetros from, to ou duration inválidos'}), 400
+
+        if duration <= 0 or range_start >= range_end:
+            return jsonify({'error': 'Intervalo ou duração inválidos'}), 400
+        if range_end - range_start > timedelta(days=MAX_SLOTS_RANGE_DAYS):
+            return jsonify({'error': f'O intervalo máximo é de {MAX_SLOTS_RANGE_DAYS} dias'}), 400
+
+        slots = free_slots(db.session, prof.id, range_start, range_end, duration)
+        return jsonify({
+            'professional_id': prof.id,
+            'from': range_start.isoformat(),
+            'to': range_end.isoformat(),
+            'duration': duration,
+            'slots': [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in slots]
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'Erro ao calcular horários livres: {str(e)}'}), 500
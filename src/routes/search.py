@@ -1,12 +1,85 @@
+import bisect
+from datetime import timedelta
 from flask import Blueprint, request, jsonify
 from sqlalchemy import exc
+from sqlalchemy.orm import joinedload, selectinload
 from src.models.user import User, db
 from src.models.professional import Professional, Activity, ProfessionalActivity
 from src.models.category import Category
+from src.models.booking import DEFAULT_DURATION_MINUTES
 from src.utils.auth import token_required
+from src.utils.catalog_cache import cached_json_response
+from src.utils.search_index import get_search_index
+from src.utils import full_text
+from src.utils.availability import available_professionals_subquery, parse_datetime, week_segments
+from src.utils.pagination import parse_limit, encode_cursor, decode_cursor
+from src.utils.text import fold_text, escape_like
 
 search_bp = Blueprint('search', __name__, url_prefix='/api/search')
 
+def professional_load_options():
+    """
+    Opções de carregamento que trazem usuário, atividades, atividade global e
+    categoria em um número fixo de consultas, independente do tamanho do resultado.
+    """
+    return (
+        joinedload(Professional.user),
+        selectinload(Professional.activities)
+            .joinedload(ProfessionalActivity.activity)
+            .joinedload(Activity.category),
+    )
+
+def serialize_professional_activity(pa):
+    activity_model = pa.activity
+    category_name = None
+    activity_global_description = ''
+
+    if activity_model:
+        activity_global_description = activity_model.description if activity_model.description else ''
+        if activity_model.category:
+            category_name = activity_model.category.name
+
+    return {
+        'professional_activity_id': pa.id,
+        'activity_id': pa.activity_id,
+        'activity_name': activity_model.name if activity_model else 'Atividade Desconhecida',
+        'activity_description': activity_global_description,
+        'professional_description': pa.description,
+        'price': pa.price,
+        'availability': pa.availability,
+        'category': category_name
+    }
+
+def _filtered_query(activity_id, category, name, keywords, available_between=None):
+    """Consulta de profissionais aprovados com os filtros aplicados no banco."""
+    query = Professional.query.options(*professional_load_options())\
+        .filter(Professional.approval_status == 'approved')
+
+    if available_between:
+        query = query.filter(Professional.id.in_(available_professionals_subquery(*available_between)))
+
+    # EXISTS em vez de JOIN: evita linhas duplicadas e permite combinar os filtros
+    if activity_id is not None:
+        query = query.filter(Professional.activities.any(ProfessionalActivity.activity_id == activity_id))
+
+    if category and category.lower() != 'todas':
+        query = query.filter(Professional.activities.any(
+            ProfessionalActivity.activity.has(Activity.category.has(Category.name == category))
+        ))
+
+    # Busca por nome no banco, sem diferenciar maiúsculas nem acentos
+    folded_name = fold_text(name) if name else None
+    if folded_name:
+        query = query.join(User, User.id == Professional.user_id)\
+            .filter(User.name_normalized.like(f'%{escape_like(folded_name)}%', escape='\\'))
+
+    # Palavras-chave comparadas com a bio já normalizada, como o nome
+    if keywords:
+        for term in fold_text(keywords).split():
+            query = query.filter(Professional.bio_normalized.like(f'%{escape_like(term)}%', escape='\\'))
+
+    return query
+
 @search_bp.route('/professionals', methods=['GET'])
 @token_required
 def search_professionals():
@@ -14,92 +87,129 @@ def search_professionals():
         activity_id = request.args.get('activity_id')
         category = request.args.get('category')
         name = request.args.get('name')
-
-        query = Professional.query.filter_by(approval_status='approved')
-
-        if activity_id:
-            query = query.join(ProfessionalActivity).filter(ProfessionalActivity.activity_id == activity_id)
-
-        if category and category.lower() != 'todas':
-            query = query.join(ProfessionalActivity).join(Activity).join(Category).filter(Category.name == category)
-
-        professionals = query.all()
+        keywords = request.args.get('keywords')
+        query_text = request.args.get('q')
+
+        try:
+            activity_id = int(activity_id) if activity_id else None
+        except ValueError:
+            return jsonify({'error': 'activity_id inválido'}), 400
+
+        # Disponibilidade: livre durante [available_at, available_at + duration)
+        available_between = None
+        if request.args.get('available_at'):
+            try:
+                starts_at = parse_datetime(request.args['available_at'])
+                duration = int(request.args.get('duration', DEFAULT_DURATION_MINUTES))
+                if duration <= 0:
+                    raise ValueError()
+                available_between = (starts_at, starts_at + timedelta(minutes=duration))
+                week_segments(*available_between)  # valida o tamanho do intervalo
+            except ValueError:
+                return jsonify({'error': 'available_at ou duration inválido'}), 400
+
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else {}
+            after_id = int(cursor['id']) if 'id' in cursor else None
+            offset = int(cursor.get('offset', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Parâmetros de paginação inválidos'}), 400
+
+        dialect_name = db.engine.dialect.name
+        if query_text and not full_text.is_supported(dialect_name):
+            # Sem busca textual nativa: usa as palavras-chave da bio
+            keywords = ' '.join(filter(None, [keywords, query_text]))
+            query_text = None
+
+        index = None if query_text else get_search_index()
+        next_cursor = None
+        if query_text:
+            # Modo textual: ordenado por relevância, paginado por deslocamento
+            query, rank = full_text.apply_full_text(
+                _filtered_query(activity_id, category, name, keywords, available_between), query_text, dialect_name
+            )
+            professionals = []
+            if query is not None:
+                professionals = query.order_by(rank.desc(), Professional.id)\
+                    .offset(offset).limit(limit + 1).all()
+            if len(professionals) > limit:
+                professionals = professionals[:limit]
+                next_cursor = encode_cursor({'offset': offset + limit})
+        elif index is not None:
+            # Filtros resolvidos pela interseção das listas do índice em memória
+            matching_ids = index.search(
+                activity_id=activity_id,
+                category=category if category and category.lower() != 'todas' else None,
+                name=name,
+                keywords=keywords
+            )
+            if available_between:
+                available_ids = set(db.session.execute(available_professionals_subquery(*available_between)).scalars())
+                matching_ids = [prof_id for prof_id in matching_ids if prof_id in available_ids]
+            start = bisect.bisect_right(matching_ids, after_id) if after_id is not None else 0
+            page_ids = matching_ids[start:start + limit + 1]
+            if len(page_ids) > limit:
+                page_ids = page_ids[:limit]
+                next_cursor = encode_cursor({'id': page_ids[-1]})
+
+            professionals = []
+            if page_ids:
+                professionals = Professional.query.options(*professional_load_options())\
+                    .filter(Professional.id.in_(page_ids))\
+                    .order_by(Professional.id).all()
+        else:
+            query = _filtered_query(activity_id, category, name, keywords, available_between)
+            # Paginação por chave (keyset): o custo não depende da posição da página
+            if after_id is not None:
+                query = query.filter(Professional.id > after_id)
+            professionals = query.order_by(Professional.id).limit(limit + 1).all()
+            if len(professionals) > limit:
+                professionals = professionals[:limit]
+                next_cursor = encode_cursor({'id': professionals[-1].id})
 
         result = []
         for prof in professionals:
-            user = User.query.get(prof.user_id)
+            user = prof.user
             if not user:
                 continue
 
-            if name and name.lower() not in user.name.lower():
-                continue
-
-            activities_data = []
-            for pa in prof.activities: # pa is a ProfessionalActivity instance
-                activity_model = Activity.query.get(pa.activity_id)
-                category_name = None
-                activity_global_description = ''
-
-                if activity_model:
-                    activity_global_description = activity_model.description if activity_model.description else ''
-                    if activity_model.category_id:
-                        category_model = Category.query.get(activity_model.category_id)
-                        if category_model:
-                            category_name = category_model.name
-                
-                activity_data = {
-                    'professional_activity_id': pa.id,
-                    'activity_id': pa.activity_id,
-                    'activity_name': activity_model.name if activity_model else 'Atividade Desconhecida',
-                    'activity_description': activity_global_description,
-                    'professional_description': pa.description,
-                    'price': pa.price,
-                    'availability': pa.availability, # Assuming pa has availability from ProfessionalActivity model
-                    'category': category_name
-                }
-                activities_data.append(activity_data)
-
             prof_data = {
                 'id': prof.id,
                 'user_id': prof.user_id,
                 'name': user.name,
                 'phone': user.phone,
                 'bio': prof.bio,
-                'activities': activities_data
+                'activities': [serialize_professional_activity(pa) for pa in prof.activities]
             }
             result.append(prof_data)
 
-        return jsonify(result), 200
+        response = jsonify(result)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
     except Exception as e:
         return jsonify({'error': f'Erro ao buscar profissionais: {str(e)}'}), 500
 
+def _load_activities():
+    activities = Activity.query.options(joinedload(Activity.category)).order_by(Activity.id).all()
+    return [{
+        'id': activity.id,
+        'name': activity.name,
+        'description': activity.description or '',
+        'category_id': activity.category_id,
+        'category': activity.category.name if activity.category else None
+    } for activity in activities]
+
+def _load_categories():
+    categories = Category.query.order_by(Category.id).all()
+    return [category.to_dict() for category in categories]
+
 @search_bp.route('/activities', methods=['GET'])
 @token_required
 def get_activities():
     try:
-        inspector = db.inspect(db.engine)
-        if 'activities' not in inspector.get_table_names():
-            return jsonify([]), 200
-
-        activities = Activity.query.all()
-        result = []
-        for activity in activities:
-            category_name = None
-            if activity.category_id:
-                category = Category.query.get(activity.category_id)
-                if category:
-                    category_name = category.name
-
-            activity_data = {
-                'id': activity.id,
-                'name': activity.name,
-                'description': activity.description or '',
-                'category_id': activity.category_id,
-                'category': category_name
-            }
-            result.append(activity_data)
-
-        return jsonify(result), 200
+        return cached_json_response('activities', _load_activities)
     except exc.SQLAlchemyError as db_error:
         return jsonify({'error': f'Erro de banco de dados: {str(db_error)}'}), 500
     except Exception as e:
@@ -109,8 +219,7 @@ def get_activities():
 @token_required
 def get_categories():
     try:
-        categories = Category.query.all()
-        return jsonify([category.to_dict() for category in categories]), 200
+        return cached_json_response('categories', _load_categories)
     except Exception as e:
         # Log the error e
         return jsonify({'error': f'Erro ao buscar categorias: {str(e)}'}), 500
@@ -119,39 +228,15 @@ def get_categories():
 @token_required
 def get_professional_details(professional_id):
     try:
-        prof = Professional.query.get(professional_id)
+        prof = Professional.query.options(*professional_load_options())\
+            .filter(Professional.id == professional_id).first()
         if not prof:
             return jsonify({'error': 'Profissional não encontrado'}), 404
 
-        user = User.query.get(prof.user_id)
+        user = prof.user
         if not user:
             return jsonify({'error': 'Usuário não encontrado'}), 404
 
-        activities_data = []
-        for pa in prof.activities: # pa is a ProfessionalActivity instance
-            activity_model = Activity.query.get(pa.activity_id)
-            category_name = None
-            activity_global_description = ''
-
-            if activity_model:
-                activity_global_description = activity_model.description if activity_model.description else ''
-                if activity_model.category_id:
-                    category_model = Category.query.get(activity_model.category_id)
-                    if category_model:
-                        category_name = category_model.name
-            
-            activity_data = {
-                'professional_activity_id': pa.id,
-                'activity_id': pa.activity_id,
-                'activity_name': activity_model.name if activity_model else 'Atividade Desconhecida',
-                'activity_description': activity_global_description,
-                'professional_description': pa.description,
-                'price': pa.price,
-                'availability': pa.availability, # Assuming pa has availability from ProfessionalActivity model
-                'category': category_name
-            }
-            activities_data.append(activity_data)
-
         prof_data = {
             'id': prof.id,
             'user_id': prof.user_id,
@@ -159,7 +244,7 @@ def get_professional_details(professional_id):
             'email': user.email,
             'phone': user.phone,
             'bio': prof.bio,
-            'activities': activities_data
+            'activities': [serialize_professional_activity(pa) for pa in prof.activities]
         }
         return jsonify(prof_data), 200
     except Exception as e:
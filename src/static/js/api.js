@@ -83,7 +83,7 @@ window.api = {
             }
             
             // Armazenar token e dados do usuário
-            localStorage.setItem('token', data.token);
+            this.storeTokens(data);
             localStorage.setItem('userData', JSON.stringify(data.user));
             
             return data;
@@ -93,12 +93,94 @@ window.api = {
         }
     },
     
-    // Método para fazer logout
-    logout: function() {
+    // Guarda o access token (curto), o refresh token e quando o access token expira
+    storeTokens: function(data) {
+        localStorage.setItem('token', data.token);
+        if (data.refresh_token) {
+            localStorage.setItem('refreshToken', data.refresh_token);
+        }
+        if (data.expires_in) {
+            localStorage.setItem('tokenExpiresAt', String(Date.now() + data.expires_in * 1000));
+        }
+    },
+    
+    // Troca o refresh token por um novo par de tokens antes que o access token expire.
+    // As abas compartilham o refresh token do localStorage: a troca roda sob um Web Lock,
+    // uma aba por vez. Trocar de novo um token já usado revoga a família e derruba a sessão.
+    refreshSession: async function() {
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (!refreshToken) return false;
+        if (!navigator.locks) {
+            return this.rotateRefreshToken(refreshToken);
+        }
+        return navigator.locks.request('saude-connect-refresh', () => {
+            // Outra aba renovou enquanto esta esperava: os tokens novos já estão guardados
+            if (localStorage.getItem('refreshToken') !== refreshToken) {
+                return !!localStorage.getItem('refreshToken');
+            }
+            return this.rotateRefreshToken(refreshToken);
+        });
+    },
+    
+    // Troca o refresh token no servidor e guarda o par novo
+    rotateRefreshToken: async function(refreshToken) {
+        try {
+            const response = await fetch(`${this.baseUrl}/auth/refresh`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ refresh_token: refreshToken })
+            });
+            
+            if (response.status === 401) {
+                // Refresh token expirado ou revogado: a sessão acabou
+                this.clearSession();
+                return false;
+            }
+            if (!response.ok) return false;
+            
+            this.storeTokens(await response.json());
+            return true;
+        } catch (error) {
+            console.error('Erro ao renovar a sessão:', error);
+            return false;
+        }
+    },
+    
+    // Renova a sessão quando faltar menos de um minuto para o access token expirar
+    keepSessionAlive: function() {
+        const expiresAt = Number(localStorage.getItem('tokenExpiresAt') || 0);
+        if (expiresAt && expiresAt - Date.now() < 60 * 1000) {
+            this.refreshSession();
+        }
+    },
+    
+    clearSession: function() {
         localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
+        localStorage.removeItem('tokenExpiresAt');
         localStorage.removeItem('userData');
     },
     
+    // Método para fazer logout
+    logout: function() {
+        const token = localStorage.getItem('token');
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (token) {
+            // Revoga os tokens no servidor sem bloquear a saída
+            fetch(`${this.baseUrl}/auth/logout`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Authorization': `Bearer ${token}`
+                },
+                body: JSON.stringify({ refresh_token: refreshToken })
+            }).catch(error => console.error('Erro ao encerrar a sessão:', error));
+        }
+        this.clearSession();
+    },
+    
     // Método para cadastrar paciente
     registerPatient: async function(patientData) {
         try {
@@ -196,6 +278,26 @@ window.api = {
         }
     },
     
+    // Método para buscar todas as páginas de uma listagem paginada por cursor:
+    // repete a requisição com o cursor do cabeçalho X-Next-Cursor até ele não vir mais
+    fetchAllPages: async function(url, options = {}) {
+        const items = [];
+        let cursor = null;
+        do {
+            let pageUrl = url;
+            if (cursor) {
+                pageUrl += `${url.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}`;
+            }
+            const response = await fetch(pageUrl, options);
+            if (!response.ok) {
+                throw new Error(`Erro ${response.status} ao buscar ${url}`);
+            }
+            items.push(...await response.json());
+            cursor = response.headers.get('X-Next-Cursor');
+        } while (cursor);
+        return items;
+    },
+    
     // Método para buscar profissionais
     searchProfessionals: async function(params = {}) {
         try {
@@ -209,14 +311,8 @@ window.api = {
             
             const url = `${this.baseUrl}/search/professionals?${queryParams.toString()}`;
             
-            const response = await fetch(url);
-            
-            if (!response.ok) {
-                throw new Error('Erro ao buscar profissionais');
-            }
-            
-            const data = await response.json();
-            return data;
+            // Resultados em páginas de até 50: segue o cursor até o fim
+            return await this.fetchAllPages(url);
         } catch (error) {
             console.error('Erro ao buscar profissionais:', error);
             // Retornar array vazio em caso de erro para evitar quebra da interface
@@ -448,6 +544,33 @@ window.api = {
         }
     },
     
+    // Método para buscar os horários livres de um profissional (calculados no servidor)
+    getProfessionalSlots: async function(professionalId, from, to, duration = null) {
+        try {
+            const token = localStorage.getItem('token');
+            const queryParams = new URLSearchParams({ from, to });
+            if (duration) {
+                queryParams.append('duration', duration);
+            }
+            
+            const response = await fetch(`${this.baseUrl}/professional/${professionalId}/slots?${queryParams.toString()}`, {
+                headers: {
+                    'Authorization': `Bearer ${token}`
+                }
+            });
+            
+            if (!response.ok) {
+                throw new Error('Erro ao buscar horários livres');
+            }
+            
+            const data = await response.json();
+            return data.slots;
+        } catch (error) {
+            console.error('Erro ao buscar horários livres:', error);
+            return [];
+        }
+    },
+    
     // Método para criar uma reserva
     createBooking: async function(bookingData) {
         try {
@@ -491,18 +614,13 @@ window.api = {
                 url += `?status=${status}`;
             }
             
-            const response = await fetch(url, {
+            // Reservas em páginas de até 50, da mais antiga para a mais nova: segue o
+            // cursor para não perder as próximas de quem tem muitas
+            return await this.fetchAllPages(url, {
                 headers: {
                     'Authorization': `Bearer ${token}`
                 }
             });
-            
-            if (!response.ok) {
-                throw new Error('Erro ao buscar reservas');
-            }
-            
-            const data = await response.json();
-            return data;
         } catch (error) {
             console.error('Erro ao buscar reservas:', error);
             return [];
@@ -616,3 +734,7 @@ window.api = {
         }
     }
 };
+
+// Mantém o access token curto sempre válido enquanto a página estiver aberta
+window.api.keepSessionAlive();
+setInterval(() => window.api.keepSessionAlive(), 30 * 1000);
@@ -194,18 +194,13 @@ document.addEventListener('DOMContentLoaded', function() {
     // Carregar reservas concluídas
     async function loadCompletedBookings(professionalId) {
         try {
-            const response = await fetch(`${window.api.baseUrl}/booking/?status=completed`, {
+            // Todas as páginas: a listagem devolve até 50 por vez
+            const bookings = await window.api.fetchAllPages(`${window.api.baseUrl}/booking/?status=completed`, {
                 headers: {
                     'Authorization': `Bearer ${localStorage.getItem('token')}`
                 }
             });
             
-            if (!response.ok) {
-                throw new Error('Erro ao carregar atendimentos concluídos');
-            }
-            
-            const bookings = await response.json();
-            
             // Filtrar reservas deste profissional que ainda não foram avaliadas
             const professionalBookings = bookings.filter(booking => 
                 booking.professional.id == professionalId && !booking.reviewed
@@ -0,0 +1,226 @@
+"""
+Build dos arquivos estáticos do frontend: nomes com hash do conteúdo, variantes
+pré-comprimidas e referências reescritas nas páginas.
+
+- `flask build-assets` lê src/static e grava em ASSETS_FOLDER (padrão instance/assets):
+  cada arquivo que não é HTML ganha uma cópia '<nome>.<hash>.<extensão>', com
+  FINGERPRINT_LENGTH caracteres do SHA-256 do conteúdo; as páginas HTML mantêm o nome
+  e têm os src/href locais reescritos para os nomes com hash. Os arquivos de texto
+  ganham variantes '.br' (Brotli) e '.gz' (gzip), gravadas só quando ficam menores que
+  o original. manifest.json descreve o resultado; o build é gravado numa pasta
+  temporária e trocado de uma vez, então os workers nunca veem um build pela metade.
+- Na entrega (src/utils/delivery.py), com o build presente, `send_static` escolhe a
+  variante pelo Accept-Encoding e responde os arquivos com hash com
+  `Cache-Control: public, max-age=31536000, immutable`: o conteúdo de um nome nunca
+  muda, então o navegador não revalida. Os demais (páginas e nomes antigos) continuam
+  com revalidação por ETag. Arquivos fora do build saem da pasta original.
+
+O build é lido quando a aplicação sobe; rode `flask build-assets` no deploy (ou depois
+de alterar src/static) antes de iniciar os workers.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+from src.utils.delivery import PRIVATE_STATIC_DIRECTORIES
+
+MANIFEST_NAME = 'manifest.json'
+FINGERPRINT_LENGTH = 12
+HTML_EXTENSIONS = ('.html', '.htm')
+COMPRESSIBLE_EXTENSIONS = HTML_EXTENSIONS + ('.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.ico')
+# Em ordem de preferência quando o cliente aceita as duas com a mesma qualidade
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+ENCODING_SUFFIXES = dict(ENCODINGS)
+
+# src="..." e href="..." com aspas simples ou duplas
+_REFERENCE_PATTERN = re.compile(r'''(\b(?:src|href)\s*=\s*)(["'])([^"']*)\2''', re.IGNORECASE)
+# URLs com esquema (https:, data:, mailto:), relativas ao protocolo ou só âncora
+_EXTERNAL_PATTERN = re.compile(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*:|//|#)')
+
+
+def assets_folder(app):
+    return app.config.get('ASSETS_FOLDER') or os.path.join(app.instance_path, 'assets')
+
+
+def fingerprinted_name(path, content):
+    root, extension = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:FINGERPRINT_LENGTH]}{extension}'
+
+
+def rewrite_references(page, html, fingerprints):
+    """Troca em `html` (da página `page`) as referências locais pelos nomes com hash."""
+    directory = posixpath.dirname(page)
+
+    def replace(match):
+        prefix, quote, url = match.groups()
+        if _EXTERNAL_PATTERN.match(url):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        if path.startswith('/'):
+            logical = path.lstrip('/')
+            if logical.startswith('static/'):
+                logical = logical[len('static/'):]
+        else:
+            logical = posixpath.normpath(posixpath.join(directory, path))
+        target = fingerprints.get(logical)
+        if target is None:
+            return match.group(0)
+        # Mesmo diretório do original: só o último segmento muda
+        rewritten = path[:len(path) - len(posixpath.basename(path))] + posixpath.basename(target)
+        return f'{prefix}{quote}{rewritten}{suffix}{quote}'
+
+    return _REFERENCE_PATTERN.sub(replace, html)
+
+
+def _compress(encoding, content):
+    if encoding == 'gzip':
+        # mtime fixo: o mesmo conteúdo gera sempre os mesmos bytes (e o mesmo ETag)
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    import brotli
+    return brotli.compress(content, quality=11)
+
+
+def _source_files(source):
+    for root, directories, files in os.walk(source):
+        directories[:] = sorted(
+            d for d in directories
+            if not d.startswith('.') and os.path.relpath(os.path.join(root, d), source).split(os.sep)[0]
+            not in PRIVATE_STATIC_DIRECTORIES
+        )
+        for name in sorted(files):
+            if name.startswith('.') or name.endswith(tuple(ENCODING_SUFFIXES.values())):
+                continue
+            yield os.path.relpath(os.path.join(root, name), source).replace(os.sep, '/')
+
+
+def _write(folder, path, content):
+    """Grava `path` e as variantes comprimidas que valem a pena; devolve as codificações gravadas."""
+    target = os.path.join(folder, *path.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(content)
+    encodings = []
+    if path.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+        for encoding, suffix in ENCODINGS:
+            compressed = _compress(encoding, content)
+            if len(compressed) < len(content):
+                with open(target + suffix, 'wb') as f:
+                    f.write(compressed)
+                encodings.append(encoding)
+    return encodings
+
+
+def build_assets(source, destination):
+    """Gera o build de `source` em `destination`, substituindo o anterior; devolve o manifesto."""
+    contents = {}
+    for path in _source_files(source):
+        with open(os.path.join(source, *path.split('/')), 'rb') as f:
+            contents[path] = f.read()
+    fingerprints = {
+        path: fingerprinted_name(path, content)
+        for path, content in contents.items() if not path.lower().endswith(HTML_EXTENSIONS)
+    }
+
+    parent = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.assets-', dir=parent)
+    try:
+        files = {}
+        for path, content in contents.items():
+            if path.lower().endswith(HTML_EXTENSIONS):
+                content = rewrite_references(path, content.decode('utf-8'), fingerprints).encode('utf-8')
+            files[path] = {'immutable': False, 'encodings': _write(staging, path, content)}
+            if path in fingerprints:
+                files[fingerprints[path]] = {'immutable': True, 'encodings': _write(staging, fingerprints[path], content)}
+        manifest = {'fingerprints': fingerprints, 'files': files}
+        with open(os.path.join(staging, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        previous = None
+        if os.path.exists(destination):
+            previous = staging + '.old'
+            os.rename(destination, previous)
+        os.rename(staging, destination)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+@dataclass(frozen=True)
+class StaticAsset:
+    path: str  # Relativo à pasta do build, já com o sufixo da variante escolhida
+    mimetype: str
+    encoding: str = None
+    immutable: bool = False
+    negotiated: bool = False  # A resposta depende do Accept-Encoding
+
+
+class StaticAssets:
+    """Build carregado do manifesto; resolve o arquivo e a variante de cada requisição."""
+
+    def __init__(self, folder, manifest):
+        self.folder = folder
+        self.fingerprints = manifest['fingerprints']
+        self.files = manifest['files']
+
+    @classmethod
+    def load(cls, folder):
+        try:
+            with open(os.path.join(folder, MANIFEST_NAME), encoding='utf-8') as f:
+                return cls(folder, json.load(f))
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def negotiate(encodings, accept_encodings):
+        """A codificação de `encodings` com maior qualidade no Accept-Encoding, ou None."""
+        candidates = [(accept_encodings.quality(encoding), -order, encoding) for order, encoding in enumerate(encodings)]
+        quality, _, encoding = max(candidates, default=(0, 0, None))
+        return encoding if quality > 0 else None
+
+    def resolve(self, filename, accept_encodings):
+        """O arquivo do build para `filename`, ou None se ele não faz parte do build."""
+        path = posixpath.normpath(filename.replace('\\', '/')).lstrip('/')
+        entry = self.files.get(path)
+        if entry is None:
+            return None
+        encoding = self.negotiate(entry['encodings'], accept_encodings)
+        return StaticAsset(
+            path=path + ENCODING_SUFFIXES[encoding] if encoding else path,
+            mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+            encoding=encoding,
+            immutable=entry['immutable'],
+            negotiated=bool(entry['encodings']),
+        )
+
+
+def load_assets(app):
+    return StaticAssets.load(assets_folder(app))
+
+
+def init_assets(app):
+    """Carrega o build de ASSETS_FOLDER, se houver, e registra `flask build-assets`."""
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Gera os estáticos com hash no nome e as variantes .br/.gz em ASSETS_FOLDER."""
+        folder = assets_folder(app)
+        manifest = build_assets(app.static_folder, folder)
+        app.extensions['static_assets'] = StaticAssets(folder, manifest)
+        compressed = sum(1 for entry in manifest['files'].values() if entry['encodings'])
+        print(f"{len(manifest['fingerprints'])} arquivos com hash, {compressed} com variantes comprimidas em {folder}")
+
+    assets = load_assets(app)
+    if assets is not None:
+        app.extensions['static_assets'] = assets
+    return assets
@@ -1,36 +1,183 @@
+"""
+Autenticação JWT compartilhada por todas as rotas.
+
+Tokens com `kid` são verificados com a chave pública correspondente do conjunto de
+src/utils/signing_keys.py; tokens HS256 sem `kid` (assinados com o SECRET_KEY) só são
+aceitos enquanto JWT_ACCEPT_HS256 estiver ligado.
+
+Tokens já verificados ficam num cache LRU limitado, indexado por um digest do token
+(nunca o token em si) com chave derivada do SECRET_KEY; cada entrada vale até o `exp`
+do token ou AUTH_TOKEN_CACHE_TTL segundos, o que vencer primeiro. Numa requisição com
+token em cache, a verificação custa um hash e uma consulta a dicionário em vez da
+decodificação completa com HMAC.
+
+Depois da assinatura (ou do cache), cada requisição passa pelo filtro de revogações
+de src/utils/tokens.py e pelo cache de principais de src/utils/principals.py, ambos em
+memória: usuário excluído ou profissional rejeitado perde o acesso, e o perfil que vale
+é o atual, não o gravado no token.
+
+`token_required` e `admin_required` são atalhos de `roles_required`.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
 import jwt
 from flask import request, jsonify, current_app
-from functools import wraps
 
-def token_required(f):
+from src.utils.principals import get_principal, is_blocked
+from src.utils.signing_keys import get_key_set
+from src.utils.tokens import accepts_legacy_tokens, get_revocation_list
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL_SECONDS = 300
+
+
+class TokenCache:
+    """Cache LRU com expiração por entrada de claims de tokens já verificados."""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, now=None):
+        now = now or time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, claims, now=None):
+        now = now or time.time()
+        expires_at = now + self.ttl
+        if 'exp' in claims:
+            expires_at = min(expires_at, claims['exp'])
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_token_cache():
+    cache = current_app.extensions.get('auth_token_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('auth_token_cache', TokenCache(
+            current_app.config.get('AUTH_TOKEN_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+            current_app.config.get('AUTH_TOKEN_CACHE_TTL', DEFAULT_CACHE_TTL_SECONDS)
+        ))
+    return cache
+
+
+def _cache_key(token, secret):
+    # Com a chave derivada do segredo, trocar o SECRET_KEY invalida as entradas antigas
+    return hashlib.blake2b(
+        token.encode(), key=hashlib.sha256(secret.encode()).digest(), digest_size=32
+    ).digest()
+
+
+def decode_token(token):
+    """
+    Retorna as claims de um token válido, consultando o cache antes de verificar a
+    assinatura. Levanta jwt.ExpiredSignatureError / jwt.InvalidTokenError.
+    """
+    secret = current_app.config['SECRET_KEY']
+    cache = get_token_cache() if current_app.config.get('AUTH_TOKEN_CACHE_ENABLED', True) else None
+    key = _cache_key(token, secret) if cache is not None else None
+    if cache is not None:
+        claims = cache.get(key)
+        if claims is not None:
+            return claims
+
+    kid = jwt.get_unverified_header(token).get('kid')
+    if kid is not None:
+        # Objeto de chave já carregado: nada de PEM por requisição
+        signing_key = get_key_set().get(kid)
+        if signing_key is None:
+            raise jwt.InvalidTokenError('Chave de assinatura desconhecida')
+        claims = jwt.decode(token, signing_key.public_key, algorithms=[signing_key.algorithm])
+    elif accepts_legacy_tokens():
+        # Tokens HS256 sem kid (emitidos antes das chaves assimétricas)
+        claims = jwt.decode(token, secret, algorithms=["HS256"])
+    else:
+        raise jwt.InvalidTokenError('Token sem kid')
+    if 'user_id' not in claims or 'user_type' not in claims:
+        raise jwt.InvalidTokenError('Claims obrigatórias ausentes')
+    if cache is not None:
+        cache.put(key, claims)
+    return claims
+
+
+def bearer_token():
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header[len('Bearer '):].strip() or None
+    return None
+
+
+def roles_required(*roles, error_key='message'):
     """
-    Decorator para proteger rotas com autenticação JWT.
-    Adiciona `request.user_id` e `request.user_type` com base no token.
+    Decorator que exige um token válido de um usuário existente e, se `roles` for
+    informado, que o perfil atual do usuário seja um dos listados. Adiciona
+    `request.user_id`, `request.user_type` (o perfil atual) e `request.token_claims`.
     """
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization')
-
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(" ")[1]
-
-        if not token:
-            return jsonify({'message': 'Token ausente!'}), 401
-
-        try:
-            data = jwt.decode(
-                token,
-                current_app.config['SECRET_KEY'],
-                algorithms=["HS256"]
-            )
-            request.user_id = data['user_id']
-            request.user_type = data['user_type']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token expirado!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token inválido!'}), 401
-
-        return f(*args, **kwargs)
-
-    return decorated
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            token = bearer_token()
+            if not token:
+                return jsonify({error_key: 'Token ausente!'}), 401
+
+            try:
+                claims = decode_token(token)
+            except jwt.ExpiredSignatureError:
+                return jsonify({error_key: 'Token expirado!'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({error_key: 'Token inválido!'}), 401
+
+            if get_revocation_list().is_revoked(claims):
+                return jsonify({error_key: 'Token revogado!'}), 401
+
+            principal = get_principal(claims['user_id'])
+            if principal is None:
+                return jsonify({error_key: 'Usuário não encontrado'}), 401
+            if is_blocked(principal):
+                return jsonify({error_key: 'Cadastro de profissional não aprovado'}), 403
+
+            if roles and principal.user_type not in roles:
+                if roles == ('admin',):
+                    return jsonify({error_key: 'Acesso restrito a administradores'}), 403
+                return jsonify({error_key: 'Acesso não permitido para este perfil'}), 403
+
+            request.user_id = principal.user_id
+            request.user_type = principal.user_type
+            request.token_claims = claims
+            return f(*args, **kwargs)
+
+        return decorated
+    return decorator
+
+
+# Qualquer usuário autenticado
+token_required = roles_required()
+# Rotas do painel administrativo (respostas de erro com a chave 'error')
+admin_required = roles_required('admin', error_key='error')
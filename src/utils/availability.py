@@ -0,0 +1,206 @@
+from datetime import datetime, time, timedelta, timezone
+
+from sqlalchemy import and_, select
+
+from src.models.availability import AvailabilityWindow, AvailabilityException, MINUTES_PER_DAY, MINUTES_PER_WEEK
+from src.models.booking import Booking, ACTIVE_STATUSES, DEFAULT_DURATION_MINUTES
+from src.models.professional import Professional
+
+
+def parse_datetime(value):
+    """
+    Converte um datetime ISO 8601 no horário UTC sem fuso usado no banco. Valores com
+    offset ('2024-05-01T09:00:00-03:00') são convertidos; sem offset, já são UTC.
+    """
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def parse_time(value):
+    """Converte 'HH:MM' em minutos desde 00:00. Aceita '24:00' como fim do dia."""
+    hours, minutes = value.split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= minutes < 60) or not (0 <= hours < 24 or (hours == 24 and minutes == 0)):
+        raise ValueError(f'Horário inválido: {value}')
+    return hours * 60 + minutes
+
+
+def week_minute(moment):
+    """Minutos desde segunda-feira 00:00 da semana de `moment`."""
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def merge_intervals(intervals):
+    """Ordena e une intervalos [início, fim) sobrepostos ou adjacentes."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def normalize_windows(windows):
+    """
+    Converte [{'weekday': 0-6, 'start': 'HH:MM', 'end': 'HH:MM'}] em intervalos de
+    minutos da semana, unindo sobreposições para que cada horário contínuo fique em
+    uma única linha (condição para a busca por cobertura funcionar com um índice).
+    """
+    intervals = []
+    for window in windows:
+        weekday = int(window['weekday'])
+        if not 0 <= weekday <= 6:
+            raise ValueError(f'Dia da semana inválido: {weekday}')
+        start = parse_time(window['start'])
+        end = parse_time(window['end'])
+        if start >= end:
+            raise ValueError(f"Janela inválida: {window['start']}-{window['end']}")
+        offset = weekday * MINUTES_PER_DAY
+        intervals.append((offset + start, offset + end))
+    return merge_intervals(intervals)
+
+
+def week_segments(starts_at, ends_at):
+    """
+    Decompõe [starts_at, ends_at) em intervalos de minutos da semana. Um intervalo que
+    atravessa a virada de domingo para segunda gera dois segmentos.
+    """
+    duration = int((ends_at - starts_at).total_seconds() // 60)
+    if duration <= 0 or duration > MINUTES_PER_WEEK:
+        raise ValueError('Intervalo inválido')
+    start = week_minute(starts_at)
+    end = start + duration
+    if end <= MINUTES_PER_WEEK:
+        return [(start, end)]
+    return [(start, MINUTES_PER_WEEK), (0, end - MINUTES_PER_WEEK)]
+
+
+def available_professionals_subquery(starts_at, ends_at, booking_duration=DEFAULT_DURATION_MINUTES):
+    """
+    SELECT dos ids de profissionais livres durante todo o intervalo [starts_at, ends_at):
+    uma janela semanal (ou exceção de disponibilidade) cobre o intervalo, nenhuma exceção
+    de bloqueio o intercepta e nenhum agendamento ativo o ocupa.
+    """
+    covered = None
+    for segment_start, segment_end in week_segments(starts_at, ends_at):
+        window_ids = select(AvailabilityWindow.professional_id).where(
+            AvailabilityWindow.start_week_minute <= segment_start,
+            AvailabilityWindow.end_week_minute >= segment_end
+        )
+        condition = Professional.id.in_(window_ids)
+        covered = condition if covered is None else and_(covered, condition)
+
+    extra_ids = select(AvailabilityException.professional_id).where(
+        AvailabilityException.is_available.is_(True),
+        AvailabilityException.starts_at <= starts_at,
+        AvailabilityException.ends_at >= ends_at
+    )
+    blocked_ids = select(AvailabilityException.professional_id).where(
+        AvailabilityException.is_available.is_(False),
+        AvailabilityException.starts_at < ends_at,
+        AvailabilityException.ends_at > starts_at
+    )
+    # Um agendamento em t ocupa [t, t + duração); intercepta se t está em (início - duração, fim)
+    booked_ids = select(Booking.professional_id).where(
+        Booking.status.in_(ACTIVE_STATUSES),
+        Booking.scheduled_date > starts_at - timedelta(minutes=booking_duration),
+        Booking.scheduled_date < ends_at
+    )
+
+    return select(Professional.id).where(
+        Professional.approval_status == 'approved',
+        covered | Professional.id.in_(extra_ids),
+        Professional.id.not_in(blocked_ids),
+        Professional.id.not_in(booked_ids)
+    )
+
+
+def subtract_intervals(free, busy):
+    """
+    Remove de `free` os trechos ocupados por `busy`. Ambas as listas devem estar
+    ordenadas e sem sobreposição (ver `merge_intervals`); a varredura é linear.
+    """
+    result = []
+    busy_index = 0
+    for start, end in free:
+        cursor = start
+        # Ocupações que terminam antes desta janela não afetam as próximas
+        while busy_index < len(busy) and busy[busy_index][1] <= cursor:
+            busy_index += 1
+        scan = busy_index
+        while scan < len(busy) and busy[scan][0] < end:
+            busy_start, busy_end = busy[scan]
+            if busy_start > cursor:
+                result.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            if cursor >= end:
+                break
+            scan += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+
+def expand_windows(windows, range_start, range_end):
+    """Projeta as janelas semanais (minutos da semana) nas datas de [range_start, range_end)."""
+    week_start = datetime.combine((range_start - timedelta(days=range_start.weekday())).date(), time.min)
+    intervals = []
+    while week_start < range_end:
+        for start_minute, end_minute in windows:
+            start = max(week_start + timedelta(minutes=start_minute), range_start)
+            end = min(week_start + timedelta(minutes=end_minute), range_end)
+            if start < end:
+                intervals.append((start, end))
+        week_start += timedelta(weeks=1)
+    return intervals
+
+
+def free_slots(session, professional_id, range_start, range_end, duration,
+               booking_duration=DEFAULT_DURATION_MINUTES):
+    """
+    Horários livres de `duration` minutos do profissional em [range_start, range_end):
+    janelas semanais e exceções de disponibilidade, menos bloqueios e agendamentos ativos.
+    """
+    windows = session.execute(
+        select(AvailabilityWindow.start_week_minute, AvailabilityWindow.end_week_minute)
+        .where(AvailabilityWindow.professional_id == professional_id)
+    ).all()
+    exceptions = session.execute(
+        select(AvailabilityException.starts_at, AvailabilityException.ends_at, AvailabilityException.is_available)
+        .where(
+            AvailabilityException.professional_id == professional_id,
+            AvailabilityException.starts_at < range_end,
+            AvailabilityException.ends_at > range_start
+        )
+    ).all()
+    # Uma única varredura no índice (professional_id, scheduled_date)
+    booking_length = timedelta(minutes=booking_duration)
+    booked = session.execute(
+        select(Booking.scheduled_date).where(
+            Booking.professional_id == professional_id,
+            Booking.scheduled_date > range_start - booking_length,
+            Booking.scheduled_date < range_end,
+            Booking.status.in_(ACTIVE_STATUSES)
+        ).order_by(Booking.scheduled_date)
+    ).scalars().all()
+
+    open_intervals = expand_windows(windows, range_start, range_end)
+    open_intervals += [
+        (max(starts_at, range_start), min(ends_at, range_end))
+        for starts_at, ends_at, is_available in exceptions if is_available
+    ]
+    busy = [(starts_at, ends_at) for starts_at, ends_at, is_available in exceptions if not is_available]
+    busy += [(scheduled, scheduled + booking_length) for scheduled in booked]
+
+    free = subtract_intervals(merge_intervals(open_intervals), merge_intervals(busy))
+
+    step = timedelta(minutes=duration)
+    slots = []
+    for start, end in free:
+        while start + step <= end:
+            slots.append((start, start + step))
+            start += step
+    return slots
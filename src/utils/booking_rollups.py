@@ -0,0 +1,276 @@
+"""
+Consolidação diária de agendamentos (booking_daily_rollups) para o painel do admin.
+
+A unidade de manutenção é a célula (profissional, dia): recalcular uma célula conta
+de novo os agendamentos daquele profissional naquele dia pelo índice
+(professional_id, scheduled_date), então a operação é idempotente e barata. Cada
+agendamento conta uma vez, na categoria da atividade agendada; mudar a categoria de
+uma atividade do catálogo só se reflete após `rebuild-booking-rollups`.
+
+- Na escrita: as rotas chamam `refresh_rollups_for` na mesma transação da alteração.
+- Recuperação: `catch_up_rollups` recalcula as células dos agendamentos alterados
+  desde a última execução (bookings.updated_at), cobrindo escritas feitas fora das
+  rotas e corridas entre transações concorrentes.
+- Reconstrução: `rebuild_rollups` recalcula tudo, um intervalo de dias por transação.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+import click
+from sqlalchemy import and_, cast, delete, func, insert, or_, select, tuple_, Date
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.models.user import db
+from src.models.booking import Booking
+from src.models.booking_rollup import BookingDailyRollup, RollupWatermark, NO_CATEGORY
+from src.models.professional import Activity
+
+WATERMARK_NAME = 'booking_daily_rollups'
+CELLS_PER_STATEMENT = 200
+# Margem relida a cada recuperação: pega transações que commitaram fora de ordem
+CATCH_UP_OVERLAP = timedelta(minutes=5)
+GROUP_BY_DIMENSIONS = ('day', 'professional', 'category', 'status')
+
+
+def _day_expression(dialect_name):
+    if dialect_name == 'sqlite':
+        return func.date(Booking.scheduled_date)
+    return cast(Booking.scheduled_date, Date)
+
+
+def _counts_query(day_expression):
+    """Contagem por dia, profissional, categoria da atividade agendada e status."""
+    category = func.coalesce(Activity.category_id, NO_CATEGORY)
+    return (
+        select(day_expression, Booking.professional_id, category, Booking.status, func.count())
+        .select_from(Booking)
+        .outerjoin(Activity, Activity.id == Booking.activity_id)
+        .group_by(day_expression, Booking.professional_id, category, Booking.status)
+    )
+
+
+def _as_date(value):
+    # No SQLite date() devolve texto
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _upsert(connection, rows):
+    dialect_name = connection.dialect.name
+    if dialect_name in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(BookingDailyRollup)
+        # ON CONFLICT: duas transações recalculando a mesma célula não colidem na chave
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['day', 'professional_id', 'category_id', 'status'],
+            set_={'booking_count': stmt.excluded.booking_count, 'updated_at': stmt.excluded.updated_at}
+        ), rows)
+    else:
+        for row in rows:
+            connection.execute(delete(BookingDailyRollup).where(
+                BookingDailyRollup.day == row['day'],
+                BookingDailyRollup.professional_id == row['professional_id'],
+                BookingDailyRollup.category_id == row['category_id'],
+                BookingDailyRollup.status == row['status']
+            ))
+        connection.execute(insert(BookingDailyRollup), rows)
+
+
+def cells_for(bookings):
+    """Células afetadas por [(professional_id, scheduled_date)]."""
+    return {(professional_id, scheduled_date.date()) for professional_id, scheduled_date in bookings}
+
+
+def refresh_rollup_cells(connection, cells):
+    """Recalcula as células (professional_id, dia). Retorna quantas foram processadas."""
+    cells = sorted(set(cells))
+    day_expression = _day_expression(connection.dialect.name)
+    now = datetime.utcnow()
+    for start in range(0, len(cells), CELLS_PER_STATEMENT):
+        chunk = cells[start:start + CELLS_PER_STATEMENT]
+        counts = connection.execute(
+            _counts_query(day_expression).where(or_(*(
+                and_(Booking.professional_id == professional_id,
+                     Booking.scheduled_date >= datetime.combine(day, time.min),
+                     Booking.scheduled_date < datetime.combine(day + timedelta(days=1), time.min))
+                for professional_id, day in chunk
+            )))
+        ).all()
+
+        rows = [
+            {'day': _as_date(day), 'professional_id': professional_id, 'category_id': category_id,
+             'status': status, 'booking_count': count, 'updated_at': now}
+            for day, professional_id, category_id, status, count in counts
+        ]
+        if rows:
+            _upsert(connection, rows)
+
+        # Pares (categoria, status) que deixaram de existir na célula saem da consolidação
+        remaining = defaultdict(list)
+        for row in rows:
+            remaining[(row['professional_id'], row['day'])].append((row['category_id'], row['status']))
+        connection.execute(delete(BookingDailyRollup).where(or_(*(
+            and_(BookingDailyRollup.professional_id == professional_id,
+                 BookingDailyRollup.day == day,
+                 tuple_(BookingDailyRollup.category_id, BookingDailyRollup.status)
+                 .not_in(remaining[(professional_id, day)]))
+            for professional_id, day in chunk
+        ))))
+    return len(cells)
+
+
+def refresh_rollups_for(session, bookings):
+    """
+    Atualiza, na transação da sessão, as células de [(professional_id, scheduled_date)].
+    Faz flush antes, para que a recontagem veja as alterações pendentes da sessão.
+    """
+    session.flush()
+    refresh_rollup_cells(session.connection(), cells_for(bookings))
+
+
+def _set_watermark(connection, processed_until):
+    updated = connection.execute(
+        RollupWatermark.__table__.update()
+        .where(RollupWatermark.name == WATERMARK_NAME)
+        .values(processed_until=processed_until)
+    ).rowcount
+    if not updated:
+        connection.execute(insert(RollupWatermark).values(name=WATERMARK_NAME, processed_until=processed_until))
+
+
+def catch_up_rollups(engine, batch_size=1000):
+    """
+    Recalcula as células dos agendamentos alterados desde a última recuperação,
+    um lote por transação. Retorna o número de células recalculadas.
+    """
+    started = datetime.utcnow()
+    with engine.connect() as connection:
+        since = connection.execute(
+            select(RollupWatermark.processed_until).where(RollupWatermark.name == WATERMARK_NAME)
+        ).scalar()
+    if since is None:
+        # Primeira execução: a reconstrução completa define o ponto de partida
+        rebuild_rollups(engine)
+        return None
+
+    total = 0
+    after = (since - CATCH_UP_OVERLAP, 0)
+    while True:
+        with engine.begin() as connection:
+            changed = connection.execute(
+                select(Booking.updated_at, Booking.id, Booking.professional_id, Booking.scheduled_date)
+                .where(or_(Booking.updated_at > after[0],
+                           and_(Booking.updated_at == after[0], Booking.id > after[1])))
+                .order_by(Booking.updated_at, Booking.id)
+                .limit(batch_size)
+            ).all()
+            if changed:
+                total += refresh_rollup_cells(connection, cells_for(
+                    (professional_id, scheduled_date) for _, _, professional_id, scheduled_date in changed
+                ))
+                after = (changed[-1].updated_at, changed[-1].id)
+            if len(changed) < batch_size:
+                _set_watermark(connection, started)
+                return total
+
+
+def rebuild_rollups(engine, chunk_days=30, date_from=None, date_to=None):
+    """
+    Recalcula a consolidação do zero em janelas de `chunk_days` dias, uma transação
+    por janela. Retorna o número de linhas gravadas.
+    """
+    started = datetime.utcnow()
+    with engine.connect() as connection:
+        first, last = connection.execute(select(func.min(Booking.scheduled_date), func.max(Booking.scheduled_date))).one()
+    first = date_from or (first.date() if first else None)
+    last = date_to or (last.date() if last else None)
+
+    written = 0
+    day = first
+    while day is not None and day <= last:
+        chunk_end = min(day + timedelta(days=chunk_days), last + timedelta(days=1))
+        with engine.begin() as connection:
+            day_expression = _day_expression(connection.dialect.name)
+            connection.execute(delete(BookingDailyRollup).where(
+                BookingDailyRollup.day >= day, BookingDailyRollup.day < chunk_end
+            ))
+            counts = connection.execute(
+                _counts_query(day_expression)
+                .where(Booking.scheduled_date >= datetime.combine(day, time.min),
+                       Booking.scheduled_date < datetime.combine(chunk_end, time.min))
+            ).all()
+            if counts:
+                connection.execute(insert(BookingDailyRollup), [
+                    {'day': _as_date(row_day), 'professional_id': professional_id, 'category_id': category_id,
+                     'status': status, 'booking_count': count, 'updated_at': started}
+                    for row_day, professional_id, category_id, status, count in counts
+                ])
+            written += len(counts)
+        day = chunk_end
+
+    if date_from is None and date_to is None:
+        with engine.begin() as connection:
+            _set_watermark(connection, started)
+    return written
+
+
+def rollup_stats(session, date_from, date_to, group_by, professional_id=None, category_id=None, statuses=None):
+    """
+    Soma a consolidação em [date_from, date_to] agrupando por `group_by`. O custo depende
+    do número de dias e profissionais do período, não do volume de agendamentos.
+    Agendamentos sem categoria aparecem com category_id None.
+    """
+    rollup = BookingDailyRollup
+    filters = [rollup.day >= date_from, rollup.day <= date_to]
+    if professional_id is not None:
+        filters.append(rollup.professional_id == professional_id)
+    if statuses:
+        filters.append(rollup.status.in_(statuses))
+    if category_id is not None:
+        filters.append(rollup.category_id == category_id)
+
+    columns = {
+        'day': rollup.day,
+        'professional': rollup.professional_id,
+        'category': rollup.category_id,
+        'status': rollup.status,
+    }
+    labels = {'day': 'day', 'professional': 'professional_id', 'category': 'category_id', 'status': 'status'}
+    selected = [columns[dimension].label(labels[dimension]) for dimension in group_by]
+
+    query = select(*selected, func.sum(rollup.booking_count).label('count')).where(*filters)
+    if selected:
+        query = query.group_by(*selected).order_by(*selected)
+
+    rows = []
+    for row in session.execute(query):
+        item = row._asdict()
+        if 'day' in item:
+            item['day'] = _as_date(item['day']).isoformat()
+        if item.get('category_id') == NO_CATEGORY:
+            item['category_id'] = None
+        rows.append(item)
+
+    total = session.execute(select(func.coalesce(func.sum(rollup.booking_count), 0)).where(*filters)).scalar()
+    return {'rows': rows, 'total': total}
+
+
+def init_booking_rollups(app):
+    """Registra os comandos de manutenção da consolidação diária."""
+
+    @app.cli.command('rebuild-booking-rollups')
+    @click.option('--chunk-days', type=int, default=30, help='Dias recalculados por transação.')
+    @click.option('--from', 'date_from', default=None, help='Primeiro dia (AAAA-MM-DD).')
+    @click.option('--to', 'date_to', default=None, help='Último dia (AAAA-MM-DD).')
+    def rebuild_booking_rollups_command(chunk_days, date_from, date_to):
+        """Recalcula a consolidação diária de agendamentos a partir da tabela bookings."""
+        written = rebuild_rollups(
+            db.engine, chunk_days,
+            date.fromisoformat(date_from) if date_from else None,
+            date.fromisoformat(date_to) if date_to else None
+        )
+        print(f'{written} linhas de consolidação gravadas')
+
+    @app.cli.command('catch-up-booking-rollups')
+    def catch_up_booking_rollups_command():
+        """Recalcula as células dos agendamentos alterados desde a última execução."""
+        print(f'{catch_up_rollups(db.engine)} células recalculadas')
@@ -0,0 +1,106 @@
+import bisect
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, exists, insert, literal, select, tuple_
+
+from src.models.booking import Booking, ACTIVE_STATUSES, DEFAULT_DURATION_MINUTES
+from src.models.professional_activity import ProfessionalActivity
+from src.utils.availability import free_slots
+
+
+def overlapping_booking_condition(professional_id, scheduled_date, duration=DEFAULT_DURATION_MINUTES):
+    """Condição que encontra agendamentos ativos que se sobrepõem a [scheduled_date, + duração)."""
+    length = timedelta(minutes=duration)
+    return (
+        (Booking.professional_id == professional_id) &
+        Booking.status.in_(ACTIVE_STATUSES) &
+        (Booking.scheduled_date > scheduled_date - length) &
+        (Booking.scheduled_date < scheduled_date + length)
+    )
+
+
+def insert_booking_if_free(session, patient_id, professional_id, scheduled_date, status='pending', activity_id=None):
+    """
+    Insere o agendamento com um único INSERT ... SELECT ... WHERE NOT EXISTS, que só grava
+    se o horário estiver livre. Retorna o id criado ou None se houver conflito.
+
+    Deve ser o primeiro comando da transação: no SQLite o INSERT obtém o lock de escrita
+    antes de avaliar o NOT EXISTS, então inserções concorrentes são serializadas. No
+    PostgreSQL a garantia final é da exclusion constraint, que gera IntegrityError.
+    """
+    now = datetime.utcnow()
+    values = select(
+        literal(patient_id), literal(professional_id), literal(scheduled_date),
+        literal(status), literal(activity_id, Integer), literal(now), literal(now)
+    )
+    if status in ACTIVE_STATUSES:
+        values = values.where(~exists().where(overlapping_booking_condition(professional_id, scheduled_date)))
+
+    stmt = insert(Booking).from_select(
+        ['patient_id', 'professional_id', 'scheduled_date', 'status', 'activity_id', 'created_at', 'updated_at'],
+        values
+    ).returning(Booking.id)
+    return session.execute(stmt).scalar()
+
+
+def offered_activities(session, pairs):
+    """
+    Recebe [(professional_id, activity_id)] e retorna o subconjunto de pares em que o
+    profissional oferece a atividade, com uma única consulta.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return set()
+    return set(session.execute(
+        select(ProfessionalActivity.professional_id, ProfessionalActivity.activity_id)
+        .where(tuple_(ProfessionalActivity.professional_id, ProfessionalActivity.activity_id).in_(pairs))
+    ).tuples())
+
+
+def find_conflicts(session, candidates, exclude_ids=(), duration=DEFAULT_DURATION_MINUTES):
+    """
+    Recebe [(chave, professional_id, scheduled_date)] e retorna o conjunto de chaves que
+    conflitam com agendamentos ativos já gravados (exceto `exclude_ids`) ou com um
+    candidato anterior da própria lista. Faz uma única consulta para todos os candidatos.
+    """
+    if not candidates:
+        return set()
+    length = timedelta(minutes=duration)
+    professional_ids = {professional_id for _, professional_id, _ in candidates}
+    dates = [scheduled_date for _, _, scheduled_date in candidates]
+
+    query = select(Booking.professional_id, Booking.scheduled_date).where(
+        Booking.professional_id.in_(professional_ids),
+        Booking.status.in_(ACTIVE_STATUSES),
+        Booking.scheduled_date > min(dates) - length,
+        Booking.scheduled_date < max(dates) + length
+    )
+    if exclude_ids:
+        query = query.where(Booking.id.not_in(exclude_ids))
+
+    taken = defaultdict(list)
+    for professional_id, scheduled_date in session.execute(query):
+        taken[professional_id].append(scheduled_date)
+    for starts in taken.values():
+        starts.sort()
+
+    conflicts = set()
+    for key, professional_id, scheduled_date in candidates:
+        starts = taken[professional_id]
+        # Há conflito se algum início cai em (scheduled_date - duração, scheduled_date + duração)
+        pos = bisect.bisect_right(starts, scheduled_date - length)
+        if pos < len(starts) and starts[pos] < scheduled_date + length:
+            conflicts.add(key)
+        else:
+            bisect.insort(starts, scheduled_date)
+    return conflicts
+
+
+def nearest_free_slots(session, professional_id, around, count=3, duration=DEFAULT_DURATION_MINUTES):
+    """Os `count` horários livres mais próximos de `around`, na semana seguinte ou no dia anterior."""
+    range_start = max(around - timedelta(days=1), datetime.utcnow().replace(second=0, microsecond=0))
+    range_end = max(around, range_start) + timedelta(days=7)
+    slots = free_slots(session, professional_id, range_start, range_end, duration)
+    slots.sort(key=lambda slot: abs(slot[0] - around))
+    return sorted(slots[:count])
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import threading
+import time
+
+from flask import current_app, request
+
+# Tempo máximo que uma entrada fica válida sem invalidação explícita. O cache é
+# local ao processo: com vários workers do gunicorn, só o worker que atendeu a
+# alteração incrementa a versão, e os demais convergem após esse intervalo.
+DEFAULT_TTL_SECONDS = 300
+
+
+class CatalogCache:
+    """
+    Cache em memória dos dados de referência (atividades e categorias).
+    Guarda o JSON já serializado e a ETag de cada payload, associados a um número
+    de versão que é incrementado a cada alteração no catálogo.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._version = 1
+        self._entries = {}
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, key, loader):
+        """
+        Retorna (body, etag) para `key`, chamando `loader()` para montar o payload
+        apenas se não houver entrada válida para a versão atual.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['version'] == self._version and entry['expires_at'] > now:
+                return entry['body'], entry['etag']
+            version = self._version
+
+        body = json.dumps(loader(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = f'{key}-v{version}-{hashlib.sha256(body).hexdigest()[:16]}'
+
+        with self._lock:
+            # Uma invalidação concorrente durante o loader descarta este resultado
+            if version == self._version:
+                self._entries[key] = {
+                    'version': version,
+                    'body': body,
+                    'etag': etag,
+                    'expires_at': now + self.ttl_seconds,
+                }
+        return body, etag
+
+    def bump_version(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+
+def get_catalog_cache():
+    """Retorna o cache do catálogo da aplicação atual, criando-o na primeira chamada."""
+    cache = current_app.extensions.get('catalog_cache')
+    if cache is None:
+        ttl = current_app.config.get('CATALOG_CACHE_TTL', DEFAULT_TTL_SECONDS)
+        cache = current_app.extensions.setdefault('catalog_cache', CatalogCache(ttl_seconds=ttl))
+    return cache
+
+
+def cached_json_response(key, loader):
+    """
+    Responde com o payload em cache e ETag forte; devolve 304 quando o cliente
+    envia um If-None-Match correspondente.
+    """
+    body, etag = get_catalog_cache().get(key, loader)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
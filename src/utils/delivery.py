@@ -0,0 +1,163 @@
+"""
+Entrega de arquivos: links assinados para os uploads e repasse da transferência ao
+servidor web da frente.
+
+- Links assinados: os diplomas (e suas pré-visualizações) só saem por
+  /files/uploads/<chave>?expires=...&signature=..., gerados para quem pode vê-los (admin
+  e o próprio profissional). O link vale DIPLOMA_URL_TTL_SECONDS; a expiração é
+  arredondada para cima em DIPLOMA_URL_ROUNDING_SECONDS, então links emitidos no mesmo
+  intervalo são iguais e o navegador reaproveita o cache.
+- FILE_DELIVERY escolhe quem transfere os bytes depois da autorização:
+  'app' (padrão): o próprio worker, em blocos;
+  'x-accel': cabeçalho X-Accel-Redirect para uma location `internal` do nginx
+  (X_ACCEL_UPLOADS_PREFIX e X_ACCEL_STATIC_PREFIX);
+  'x-sendfile': cabeçalho X-Sendfile com o caminho absoluto (Apache/lighttpd).
+  Com armazenamento S3 não há caminho local: qualquer modo diferente de 'app' responde
+  com redirecionamento para uma URL pré-assinada do bucket, com a mesma validade.
+- Estáticos: com o build de src/utils/assets.py presente, a variante pré-comprimida e
+  os cabeçalhos de cache vêm do manifesto, em qualquer modo (no nginx, a location de
+  X_ACCEL_ASSETS_PREFIX aponta para ASSETS_FOLDER).
+"""
+import hashlib
+import hmac
+import math
+import mimetypes
+import os
+import time
+
+from flask import Response, abort, current_app, redirect, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from src.utils.storage import send_stored_file
+
+DELIVERY_MODES = ('app', 'x-accel', 'x-sendfile')
+DEFAULT_URL_TTL_SECONDS = 300
+DEFAULT_URL_ROUNDING_SECONDS = 60
+DEFAULT_X_ACCEL_UPLOADS_PREFIX = '/_protected/uploads/'
+DEFAULT_X_ACCEL_STATIC_PREFIX = '/_protected/static/'
+DEFAULT_X_ACCEL_ASSETS_PREFIX = '/_protected/assets/'
+# Estáticos com hash do conteúdo no nome
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Caminhos do frontend que nunca são servidos diretamente
+PRIVATE_STATIC_DIRECTORIES = ('uploads',)
+
+
+def delivery_mode():
+    mode = current_app.config.get('FILE_DELIVERY', 'app')
+    if mode not in DELIVERY_MODES:
+        raise ValueError(f'FILE_DELIVERY inválido: {mode}')
+    return mode
+
+
+# --- Links assinados ---
+
+def _signature(key, expires):
+    secret = hashlib.sha256(b'upload-url:' + current_app.config['SECRET_KEY'].encode()).digest()
+    return hmac.new(secret, f'{key}:{expires}'.encode(), hashlib.sha256).hexdigest()
+
+
+def upload_url(key, now=None):
+    """Link assinado e temporário para `key`."""
+    config = current_app.config
+    rounding = config.get('DIPLOMA_URL_ROUNDING_SECONDS', DEFAULT_URL_ROUNDING_SECONDS)
+    expires = (now or time.time()) + config.get('DIPLOMA_URL_TTL_SECONDS', DEFAULT_URL_TTL_SECONDS)
+    expires = int(math.ceil(expires / rounding) * rounding)
+    return url_for('files.get_upload', key=key, expires=expires, signature=_signature(key, expires))
+
+
+def verify_upload_url(key, expires, signature, now=None):
+    """Segundos de validade restantes do link, ou None se inválido ou expirado."""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return None
+    remaining = expires - (now or time.time())
+    if remaining <= 0 or not hmac.compare_digest(_signature(key, expires), signature or ''):
+        return None
+    return int(remaining)
+
+
+# --- Transferência ---
+
+def _offloaded(mimetype, header, value, max_age, public=False):
+    # Corpo vazio: o servidor da frente envia o arquivo (e trata Range) ao ver o cabeçalho
+    response = Response(mimetype=mimetype)
+    response.headers[header] = value
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+def send_upload(storage, key, max_age=0):
+    """Resposta com o upload `key`, já autorizado, conforme FILE_DELIVERY."""
+    mode = delivery_mode()
+    if mode == 'app':
+        return send_stored_file(storage, key, max_age=max_age)
+    try:
+        info = storage.stat(key)
+    except ValueError:
+        info = None
+    if info is None:
+        abort(404)
+    path = storage.local_path(key)
+    if path is None:
+        return redirect(storage.presigned_url(key, max(max_age, 1)))
+    mimetype = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+    if mode == 'x-sendfile':
+        return _offloaded(mimetype, 'X-Sendfile', os.path.abspath(path), max_age)
+    prefix = current_app.config.get('X_ACCEL_UPLOADS_PREFIX', DEFAULT_X_ACCEL_UPLOADS_PREFIX)
+    return _offloaded(mimetype, 'X-Accel-Redirect', prefix + key, max_age)
+
+
+def is_private_static(filename):
+    parts = os.path.normpath(filename).replace('\\', '/').lstrip('/').split('/')
+    return parts[0] in PRIVATE_STATIC_DIRECTORIES
+
+
+def _send_asset(assets, asset, mode):
+    if mode == 'app':
+        response = send_from_directory(assets.folder, asset.path, mimetype=asset.mimetype)
+    else:
+        max_age = current_app.get_send_file_max_age(asset.path) or 0
+        if mode == 'x-sendfile':
+            path = safe_join(assets.folder, asset.path)
+            response = _offloaded(asset.mimetype, 'X-Sendfile', os.path.abspath(path), max_age, public=True)
+        else:
+            prefix = current_app.config.get('X_ACCEL_ASSETS_PREFIX', DEFAULT_X_ACCEL_ASSETS_PREFIX)
+            response = _offloaded(asset.mimetype, 'X-Accel-Redirect', prefix + asset.path, max_age, public=True)
+    if asset.encoding:
+        response.content_encoding = asset.encoding
+    if asset.negotiated:
+        response.vary.add('Accept-Encoding')
+    if asset.immutable:
+        # O nome tem o hash do conteúdo: nunca precisa ser revalidado
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def send_static(folder, filename):
+    """Arquivo público do frontend conforme FILE_DELIVERY; uploads nunca saem por aqui."""
+    if is_private_static(filename):
+        abort(404)
+    mode = delivery_mode()
+    assets = current_app.extensions.get('static_assets')
+    asset = assets.resolve(filename, request.accept_encodings) if assets is not None else None
+    if asset is not None:
+        return _send_asset(assets, asset, mode)
+    if mode == 'app':
+        return send_from_directory(folder, filename)
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    max_age = current_app.get_send_file_max_age(filename) or 0
+    if mode == 'x-sendfile':
+        return _offloaded(mimetype, 'X-Sendfile', os.path.abspath(path), max_age, public=True)
+    prefix = current_app.config.get('X_ACCEL_STATIC_PREFIX', DEFAULT_X_ACCEL_STATIC_PREFIX)
+    return _offloaded(mimetype, 'X-Accel-Redirect', prefix + filename, max_age, public=True)
@@ -0,0 +1,210 @@
+"""
+Expiração periódica de registros pendentes que ninguém mais vai mover:
+
+- agendamentos 'pending' cujo horário já passou viram 'expired';
+- cadastros de profissionais 'pending' mais antigos que o prazo configurado
+  recebem o status configurado (por padrão 'expired');
+- revogações de tokens já vencidas são apagadas.
+
+O trabalho é feito em lotes limitados, cada um na sua própria transação curta,
+percorrendo índices parciais sobre os registros pendentes. Assim nenhum lock de
+escrita nas tabelas de agendamentos/profissionais dura mais que um lote.
+
+Pode rodar dentro do processo web (EXPIRATION_SCHEDULER_ENABLED) ou como processo
+separado com `flask expire-stale --interval 300`.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import select, update
+
+from src.models.user import db
+from src.models.booking import Booking
+from src.models.professional import Professional
+from src.utils.booking_rollups import catch_up_rollups, cells_for, refresh_rollup_cells
+from src.utils.tokens import purge_expired_revocations
+
+DEFAULT_INTERVAL_SECONDS = 300
+DEFAULT_BATCH_SIZE = 500
+# Limita o trabalho de uma execução; o restante fica para a próxima
+DEFAULT_MAX_BATCHES = 20
+DEFAULT_BOOKING_GRACE_MINUTES = 0
+DEFAULT_PROFESSIONAL_PENDING_DAYS = 90
+DEFAULT_PROFESSIONAL_EXPIRED_STATUS = 'expired'
+# Últimas execuções mantidas em memória para consulta
+RUN_HISTORY_SIZE = 20
+
+
+def _expire_in_batches(engine, model, id_query, values, guard, batch_size, max_batches, pause_seconds,
+                       on_expired=None):
+    """
+    Seleciona até `batch_size` ids com `id_query` e atualiza-os com `values`, uma
+    transação por lote. `guard` é reaplicado no UPDATE para não sobrescrever linhas
+    alteradas entre o SELECT e o UPDATE. `on_expired(connection, ids)` roda na mesma
+    transação do lote. Retorna (linhas alteradas, lotes executados).
+    """
+    total = 0
+    batches = 0
+    while batches < max_batches:
+        with engine.begin() as connection:
+            # SKIP LOCKED (PostgreSQL): linhas em uso por uma requisição ficam para depois
+            ids = list(connection.execute(
+                id_query.limit(batch_size).with_for_update(skip_locked=True)
+            ).scalars())
+            if ids:
+                total += connection.execute(
+                    update(model).where(model.id.in_(ids), guard).values(**values)
+                ).rowcount
+                if on_expired:
+                    on_expired(connection, ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return total, batches
+
+
+def _refresh_booking_rollups(connection, booking_ids):
+    slots = connection.execute(
+        select(Booking.professional_id, Booking.scheduled_date).where(Booking.id.in_(booking_ids))
+    ).all()
+    refresh_rollup_cells(connection, cells_for(slots))
+
+
+def expire_stale_records(engine, config, now=None):
+    """Executa uma rodada de expiração e retorna as métricas da execução."""
+    now = now or datetime.utcnow()
+    started = time.monotonic()
+    batch_size = config.get('EXPIRATION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    max_batches = config.get('EXPIRATION_MAX_BATCHES', DEFAULT_MAX_BATCHES)
+    pause_seconds = config.get('EXPIRATION_BATCH_PAUSE_SECONDS', 0)
+
+    booking_cutoff = now - timedelta(
+        minutes=config.get('BOOKING_PENDING_GRACE_MINUTES', DEFAULT_BOOKING_GRACE_MINUTES)
+    )
+    # A condição repete a do índice parcial ix_bookings_active_scheduled_date
+    stale_bookings = select(Booking.id).where(
+        Booking.status.in_(('pending', 'confirmed')),
+        Booking.status == 'pending',
+        Booking.scheduled_date < booking_cutoff
+    ).order_by(Booking.scheduled_date, Booking.id)
+    bookings_expired, booking_batches = _expire_in_batches(
+        engine, Booking, stale_bookings,
+        {'status': 'expired', 'updated_at': now},
+        Booking.status == 'pending',
+        batch_size, max_batches, pause_seconds,
+        on_expired=_refresh_booking_rollups
+    )
+
+    professionals_expired = 0
+    professional_batches = 0
+    pending_days = config.get('PROFESSIONAL_PENDING_MAX_AGE_DAYS', DEFAULT_PROFESSIONAL_PENDING_DAYS)
+    if pending_days:
+        stale_professionals = select(Professional.id).where(
+            Professional.approval_status == 'pending',
+            Professional.created_at < now - timedelta(days=pending_days)
+        ).order_by(Professional.created_at, Professional.id)
+        professionals_expired, professional_batches = _expire_in_batches(
+            engine, Professional, stale_professionals,
+            {
+                'approval_status': config.get('PROFESSIONAL_PENDING_EXPIRED_STATUS', DEFAULT_PROFESSIONAL_EXPIRED_STATUS),
+                'updated_at': now,
+            },
+            Professional.approval_status == 'pending',
+            batch_size, max_batches, pause_seconds
+        )
+
+    return {
+        'started_at': now.isoformat(),
+        'bookings_expired': bookings_expired,
+        'professionals_expired': professionals_expired,
+        'batches': booking_batches + professional_batches,
+        'duration_ms': round((time.monotonic() - started) * 1000, 1),
+    }
+
+
+class ExpirationScheduler:
+    """Executa `expire_stale_records` a cada `interval` segundos numa thread daemon."""
+
+    def __init__(self, app, interval=DEFAULT_INTERVAL_SECONDS):
+        self.app = app
+        self.interval = interval
+        self.runs = []
+        self.totals = {'runs': 0, 'bookings_expired': 0, 'professionals_expired': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                metrics = expire_stale_records(db.engine, self.app.config)
+                # Mesma rodada de manutenção: alinha a consolidação diária com os agendamentos
+                if self.app.config.get('ROLLUP_CATCH_UP_ENABLED', True):
+                    metrics['rollup_cells_refreshed'] = catch_up_rollups(db.engine)
+                metrics['token_revocations_purged'] = purge_expired_revocations(db.engine)
+            except Exception as e:
+                with self._lock:
+                    self.totals['errors'] += 1
+                self.app.logger.warning(f'Falha na expiração de pendentes: {e}')
+                return None
+        self.app.logger.info(
+            'Expiração: %(bookings_expired)s agendamentos, %(professionals_expired)s profissionais, '
+            '%(batches)s lotes em %(duration_ms)s ms', metrics
+        )
+        with self._lock:
+            self.runs = (self.runs + [metrics])[-RUN_HISTORY_SIZE:]
+            self.totals['runs'] += 1
+            self.totals['bookings_expired'] += metrics['bookings_expired']
+            self.totals['professionals_expired'] += metrics['professionals_expired']
+        return metrics
+
+    def metrics(self):
+        with self._lock:
+            return {'totals': dict(self.totals), 'last_runs': list(self.runs)}
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='expiration-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def get_expiration_scheduler():
+    return current_app.extensions.get('expiration_scheduler')
+
+
+def init_expiration_scheduler(app):
+    """
+    Registra o agendador e o comando `flask expire-stale`. A thread só é iniciada com
+    EXPIRATION_SCHEDULER_ENABLED; com vários workers, prefira o comando num processo à parte.
+    """
+    scheduler = app.extensions.setdefault(
+        'expiration_scheduler',
+        ExpirationScheduler(app, app.config.get('EXPIRATION_INTERVAL_SECONDS', DEFAULT_INTERVAL_SECONDS))
+    )
+
+    @app.cli.command('expire-stale')
+    @click.option('--interval', type=int, default=0, help='Repetir a cada N segundos (0 = executar uma vez).')
+    def expire_stale_command(interval):
+        """Expira agendamentos e cadastros de profissionais pendentes vencidos."""
+        while True:
+            metrics = scheduler.run_once()
+            print(metrics)
+            if not interval:
+                break
+            time.sleep(interval)
+
+    if app.config.get('EXPIRATION_SCHEDULER_ENABLED', False):
+        scheduler.start()
+    return scheduler
@@ -0,0 +1,194 @@
+"""
+Busca textual (full-text) sobre a bio do profissional e as descrições das atividades,
+usando o mecanismo nativo do banco: tsvector + índice GIN no PostgreSQL (configuração
+'portuguese', com stemming) e FTS5 no SQLite (desenvolvimento).
+
+Cada profissional tem um documento com dois campos: `title` (nomes das atividades e
+categorias, peso maior) e `body` (bio e descrições). Os documentos são reescritos no
+mesmo flush que altera o profissional, as atividades ou o catálogo.
+"""
+from sqlalchemy import DDL, column, delete, event, func, insert, literal_column, select, table
+
+from src.models.user import db
+from src.models.category import Category
+from src.models.professional import Professional, Activity, ProfessionalActivity
+from src.utils.text import fold_text
+from src.utils.search_index import tokenize
+
+POSTGRES_TABLE = 'professional_search_documents'
+SQLITE_TABLE = 'professional_search_fts'
+
+postgres_documents = table(
+    POSTGRES_TABLE, column('professional_id'), column('title_text'), column('body_text'), column('search_vector')
+)
+sqlite_documents = table(SQLITE_TABLE, column('rowid'), column('title'), column('body'))
+
+# --- Estruturas criadas junto com as demais tabelas (db.create_all) ---
+
+event.listen(db.metadata, 'after_create', DDL(f"""
+    CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} (
+        professional_id INTEGER PRIMARY KEY REFERENCES professionals(id) ON DELETE CASCADE,
+        title_text TEXT NOT NULL DEFAULT '',
+        body_text TEXT NOT NULL DEFAULT '',
+        search_vector TSVECTOR GENERATED ALWAYS AS (
+            setweight(to_tsvector('portuguese', title_text), 'A') ||
+            setweight(to_tsvector('portuguese', body_text), 'B')
+        ) STORED
+    )
+""").execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'after_create', DDL(
+    f"CREATE INDEX IF NOT EXISTS ix_{POSTGRES_TABLE}_search_vector ON {POSTGRES_TABLE} USING gin (search_vector)"
+).execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'after_create', DDL(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')"
+).execute_if(dialect='sqlite'))
+event.listen(db.metadata, 'before_drop', DDL(f"DROP TABLE IF EXISTS {POSTGRES_TABLE}").execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'before_drop', DDL(f"DROP TABLE IF EXISTS {SQLITE_TABLE}").execute_if(dialect='sqlite'))
+
+
+def is_supported(dialect_name):
+    return dialect_name in ('postgresql', 'sqlite')
+
+
+# --- Escrita dos documentos ---
+
+def _build_documents(connection, professional_ids):
+    """Monta (title, body) de cada profissional lendo as tabelas diretamente."""
+    rows = connection.execute(
+        select(
+            Professional.id, Professional.bio, ProfessionalActivity.description,
+            Activity.name, Activity.description, Category.name
+        )
+        .select_from(Professional)
+        .outerjoin(ProfessionalActivity, ProfessionalActivity.professional_id == Professional.id)
+        .outerjoin(Activity, Activity.id == ProfessionalActivity.activity_id)
+        .outerjoin(Category, Category.id == Activity.category_id)
+        .where(Professional.id.in_(professional_ids))
+    )
+    documents = {}
+    for prof_id, bio, pa_description, activity_name, activity_description, category_name in rows:
+        title, body = documents.setdefault(prof_id, ([], [bio]))
+        title.extend([activity_name, category_name])
+        body.extend([pa_description, activity_description])
+    # O texto é guardado sem acentos para que a busca também ignore acentuação
+    return {
+        prof_id: (
+            fold_text(' '.join(dict.fromkeys(t for t in title if t))),
+            fold_text(' '.join(dict.fromkeys(b for b in body if b))),
+        )
+        for prof_id, (title, body) in documents.items()
+    }
+
+
+def refresh_documents(connection, professional_ids):
+    """Reescreve os documentos dos profissionais informados (e remove os excluídos)."""
+    dialect_name = connection.dialect.name
+    professional_ids = sorted(i for i in professional_ids if i is not None)
+    if not professional_ids or not is_supported(dialect_name):
+        return
+
+    documents = _build_documents(connection, professional_ids)
+    if dialect_name == 'postgresql':
+        connection.execute(delete(postgres_documents).where(postgres_documents.c.professional_id.in_(professional_ids)))
+        rows = [{'professional_id': prof_id, 'title_text': title, 'body_text': body}
+                for prof_id, (title, body) in documents.items()]
+        if rows:
+            connection.execute(insert(postgres_documents), rows)
+    else:
+        connection.execute(delete(sqlite_documents).where(sqlite_documents.c.rowid.in_(professional_ids)))
+        rows = [{'rowid': prof_id, 'title': title, 'body': body}
+                for prof_id, (title, body) in documents.items()]
+        if rows:
+            connection.execute(insert(sqlite_documents), rows)
+
+
+def rebuild_all_documents(engine, batch_size=500):
+    """
+    Recria todos os documentos em lotes ordenados por id, com um commit por lote
+    para não manter locks longos. Retorna o total de profissionais processados.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            ids = list(connection.execute(
+                select(Professional.id).where(Professional.id > last_id).order_by(Professional.id).limit(batch_size)
+            ).scalars())
+            if not ids:
+                return total
+            refresh_documents(connection, ids)
+        total += len(ids)
+        last_id = ids[-1]
+
+
+@event.listens_for(db.session, 'after_flush')
+def _refresh_on_flush(session, flush_context):
+    professional_ids = set()
+    activity_ids = set()
+    category_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Professional):
+            professional_ids.add(obj.id)
+        elif isinstance(obj, ProfessionalActivity):
+            professional_ids.add(obj.professional_id)
+        elif isinstance(obj, Activity):
+            activity_ids.add(obj.id)
+        elif isinstance(obj, Category):
+            category_ids.add(obj.id)
+    if not (professional_ids or activity_ids or category_ids):
+        return
+
+    # Mesma conexão e transação do flush: o documento é gravado no mesmo commit
+    connection = session.connection()
+    if not is_supported(connection.dialect.name):
+        return
+
+    if category_ids:
+        activity_ids |= set(connection.execute(
+            select(Activity.id).where(Activity.category_id.in_(category_ids))
+        ).scalars())
+    if activity_ids:
+        professional_ids |= set(connection.execute(
+            select(ProfessionalActivity.professional_id).where(ProfessionalActivity.activity_id.in_(activity_ids))
+        ).scalars())
+
+    refresh_documents(connection, professional_ids)
+
+
+# --- Consulta ---
+
+def _sqlite_match_expression(query_text):
+    """
+    O FTS5 não tem stemmer para português: cada termo vira uma busca por prefixo,
+    sem o 's' final do plural ("idosos" -> "idoso"*), o que cobre as variações mais comuns.
+    """
+    terms = []
+    for term in sorted(tokenize(query_text)):
+        if len(term) > 4 and term.endswith('s'):
+            term = term[:-1]
+        terms.append(f'"{term}"*')
+    return ' '.join(terms)
+
+
+def apply_full_text(query, query_text, dialect_name):
+    """
+    Restringe a consulta de profissionais aos que correspondem a `query_text` e devolve
+    (query, rank), onde `rank` ordena do mais para o menos relevante com `.desc()`.
+    Retorna (None, None) se o banco não suportar busca textual ou não houver termos.
+    """
+    if dialect_name == 'postgresql':
+        ts_query = func.websearch_to_tsquery('portuguese', fold_text(query_text))
+        query = query.join(postgres_documents, postgres_documents.c.professional_id == Professional.id)\
+            .filter(postgres_documents.c.search_vector.op('@@')(ts_query))
+        return query, func.ts_rank_cd(postgres_documents.c.search_vector, ts_query)
+
+    if dialect_name == 'sqlite':
+        match_expression = _sqlite_match_expression(query_text)
+        if not match_expression:
+            return None, None
+        query = query.join(sqlite_documents, sqlite_documents.c.rowid == Professional.id)\
+            .filter(literal_column(SQLITE_TABLE).op('MATCH')(match_expression))
+        # bm25 é menor para documentos mais relevantes; o título pesa o dobro do corpo
+        return query, -func.bm25(literal_column(SQLITE_TABLE), 2.0, 1.0)
+
+    return None, None
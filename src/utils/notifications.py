@@ -0,0 +1,317 @@
+"""
+Notificações de agendamento com outbox transacional.
+
+As rotas chamam `enqueue_booking_event` antes do commit: as linhas de `outbox_messages`
+entram na mesma transação do agendamento, então não há notificação de agendamento
+desfeito nem agendamento sem notificação. Depois do commit, um pool de workers em
+threads entrega as mensagens por um transporte plugável (log, SMTP ou qualquer objeto
+com `send(message)`), com novas tentativas e backoff exponencial. A requisição não
+espera pela entrega. O pool sobe na primeira requisição de cada worker e também drena
+as mensagens que um processo anterior deixou pendentes.
+"""
+import logging
+import random
+import smtplib
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from src.models.user import db, User
+from src.models.booking import Booking
+from src.models.professional import Professional
+from src.models.outbox import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_SECONDS = 5
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 30
+DEFAULT_MAX_BACKOFF_SECONDS = 3600
+# Tempo de posse de uma mensagem em envio; se o worker morrer, ela volta para a fila
+DEFAULT_LEASE_SECONDS = 120
+
+SUBJECTS = {
+    'booking_created': 'Novo agendamento',
+    'booking_updated': 'Agendamento atualizado',
+}
+RECIPIENT_ROLES = ('patient', 'professional')
+
+
+@dataclass
+class Notification:
+    to: str
+    subject: str
+    body: str
+
+
+# --- Transportes ---
+
+class LogTransport:
+    """Apenas registra as mensagens no log (padrão em desenvolvimento)."""
+
+    def send(self, message):
+        logger.info('Notificação para %s: %s', message.to, message.subject)
+
+
+class SMTPTransport:
+    def __init__(self, host, port=25, sender='nao-responda@saudeconnect.com.br',
+                 username=None, password=None, use_tls=False, timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def send(self, message):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = message.to
+        email['Subject'] = message.subject
+        email.set_content(message.body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(email)
+
+
+def create_transport(config):
+    """
+    NOTIFICATION_TRANSPORT pode ser 'log', 'smtp' (configurado pelas chaves SMTP_*)
+    ou um objeto que implemente `send(message)`.
+    """
+    transport = config.get('NOTIFICATION_TRANSPORT', 'log')
+    if transport == 'log':
+        return LogTransport()
+    if transport == 'smtp':
+        return SMTPTransport(
+            config.get('SMTP_HOST', 'localhost'),
+            config.get('SMTP_PORT', 25),
+            sender=config.get('SMTP_SENDER', 'nao-responda@saudeconnect.com.br'),
+            username=config.get('SMTP_USERNAME'),
+            password=config.get('SMTP_PASSWORD'),
+            use_tls=config.get('SMTP_USE_TLS', False),
+        )
+    if hasattr(transport, 'send'):
+        return transport
+    raise ValueError(f'Transporte de notificação desconhecido: {transport}')
+
+
+# --- Escrita no outbox ---
+
+def enqueue_booking_event(session, booking_id, event_type, payload=None):
+    """Adiciona à sessão uma mensagem por destinatário; vai para o banco no mesmo commit."""
+    session.add_all([
+        OutboxMessage(event_type=event_type, booking_id=booking_id, recipient_role=role, payload=payload)
+        for role in RECIPIENT_ROLES
+    ])
+    session.info['outbox_pending'] = True
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_wakeup(session):
+    session.info.pop('outbox_pending', None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_workers(session):
+    if not session.info.pop('outbox_pending', False):
+        return
+    pool = current_app.extensions.get('notification_pool')
+    if pool is not None:
+        pool.wake()
+
+
+# --- Entrega ---
+
+def build_notification(session, message):
+    """Monta o e-mail de uma mensagem do outbox. Retorna None se não houver destinatário."""
+    booking = session.get(Booking, message.booking_id)
+    if booking is None:
+        return None
+    if message.recipient_role == 'patient':
+        # Booking.patient_id guarda o id do usuário do paciente (ver create_booking)
+        user = session.get(User, booking.patient_id)
+    else:
+        user = session.execute(
+            select(User).join(Professional, Professional.user_id == User.id)
+            .where(Professional.id == booking.professional_id)
+        ).scalar()
+    if user is None:
+        return None
+
+    when = booking.scheduled_date.strftime('%d/%m/%Y %H:%M')
+    subject = SUBJECTS.get(message.event_type, 'Atualização de agendamento')
+    body = (
+        f'Olá, {user.name}.\n\n'
+        f'{subject}: atendimento em {when}, status "{booking.status}".\n\n'
+        'Saúde Connect'
+    )
+    return Notification(to=user.email, subject=subject, body=body)
+
+
+def backoff_delay(attempts, base_seconds, max_seconds):
+    """Backoff exponencial com jitter: base * 2^(tentativas-1), limitado a max_seconds."""
+    delay = min(base_seconds * 2 ** (attempts - 1), max_seconds)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+class NotificationWorkerPool:
+    """Threads que drenam o outbox concorrentemente."""
+
+    def __init__(self, app, workers=DEFAULT_WORKERS):
+        self.app = app
+        self.workers = workers
+        self.transport = None
+        self.counters = {'sent': 0, 'retried': 0, 'failed': 0}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _config(self, key, default):
+        return self.app.config.get(key, default)
+
+    def _claim(self, engine, message_id, now):
+        """Toma posse da mensagem: só um worker consegue mudar o available_at dela."""
+        lease = timedelta(seconds=self._config('NOTIFICATION_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+        with engine.begin() as connection:
+            return connection.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message_id,
+                       OutboxMessage.status == 'pending',
+                       OutboxMessage.available_at <= now)
+                .values(available_at=now + lease, attempts=OutboxMessage.attempts + 1)
+            ).rowcount == 1
+
+    def _deliver(self, session, message_id):
+        message = session.get(OutboxMessage, message_id)
+        try:
+            notification = build_notification(session, message)
+            if notification is not None:
+                if self.transport is None:
+                    self.transport = create_transport(self.app.config)
+                self.transport.send(notification)
+        except Exception as e:
+            max_attempts = self._config('NOTIFICATION_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+            message.last_error = str(e)[:1000]
+            if message.attempts >= max_attempts:
+                message.status = 'failed'
+                counter = 'failed'
+            else:
+                message.available_at = datetime.utcnow() + backoff_delay(
+                    message.attempts,
+                    self._config('NOTIFICATION_BACKOFF_SECONDS', DEFAULT_BACKOFF_SECONDS),
+                    self._config('NOTIFICATION_MAX_BACKOFF_SECONDS', DEFAULT_MAX_BACKOFF_SECONDS)
+                )
+                counter = 'retried'
+        else:
+            message.status = 'sent'
+            message.sent_at = datetime.utcnow()
+            counter = 'sent'
+        session.commit()
+        with self._lock:
+            self.counters[counter] += 1
+
+    def drain(self, limit=None):
+        """
+        Entrega as mensagens disponíveis até esvaziar a fila (ou até `limit`).
+        Retorna quantas mensagens este chamador processou.
+        """
+        batch_size = self._config('NOTIFICATION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        processed = 0
+        with self.app.app_context():
+            engine = db.engine
+            while limit is None or processed < limit:
+                now = datetime.utcnow()
+                with engine.connect() as connection:
+                    candidates = list(connection.execute(
+                        select(OutboxMessage.id)
+                        .where(OutboxMessage.status == 'pending', OutboxMessage.available_at <= now)
+                        .order_by(OutboxMessage.available_at, OutboxMessage.id)
+                        .limit(batch_size)
+                    ).scalars())
+                if not candidates:
+                    break
+                claimed_any = False
+                with Session(engine) as session:
+                    for message_id in candidates:
+                        if limit is not None and processed >= limit:
+                            break
+                        # Outro worker pode ter pegado a mensagem entre o SELECT e o claim
+                        if not self._claim(engine, message_id, now):
+                            continue
+                        claimed_any = True
+                        self._deliver(session, message_id)
+                        processed += 1
+                if not claimed_any:
+                    break
+        return processed
+
+    def _run(self):
+        poll_seconds = self._config('NOTIFICATION_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                logger.warning(f'Falha ao drenar o outbox de notificações: {e}')
+            # Acorda no próximo commit com notificação ou, no máximo, a cada poll_seconds
+            self._wakeup.wait(poll_seconds)
+            self._wakeup.clear()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        if self._threads or not self.workers or self.app.testing:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'notification-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+
+def get_notification_pool():
+    return current_app.extensions.get('notification_pool')
+
+
+def init_notifications(app):
+    """
+    Registra o pool e o comando `flask send-notifications`. As threads sobem na primeira
+    requisição, já dentro do worker (depois do fork do gunicorn), sem esperar um commit
+    com notificação: o outbox deixado por processos anteriores é retomado logo.
+    """
+    pool = app.extensions.setdefault(
+        'notification_pool',
+        NotificationWorkerPool(app, app.config.get('NOTIFICATION_WORKERS', DEFAULT_WORKERS))
+    )
+
+    @app.before_request
+    def start_notification_workers():
+        # Depois da primeira chamada, start() só confere que as threads existem
+        get_notification_pool().start()
+
+    @app.cli.command('send-notifications')
+    def send_notifications_command():
+        """Entrega as notificações pendentes do outbox e encerra."""
+        print(f'{pool.drain()} mensagens processadas')
+
+    return pool
@@ -0,0 +1,30 @@
+import base64
+import json
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100
+
+def parse_limit(raw_limit, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """Converte o parâmetro `limit` da query string, limitado a `maximum`. Lança ValueError se inválido."""
+    if raw_limit in (None, ''):
+        return default
+    limit = int(raw_limit)
+    if limit < 1:
+        raise ValueError('limit deve ser maior que zero')
+    return min(limit, maximum)
+
+def encode_cursor(values):
+    """Gera um cursor opaco a partir da chave de ordenação do último item da página."""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decodifica um cursor gerado por `encode_cursor`. Lança ValueError se malformado."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Cursor inválido')
+    if not isinstance(values, dict):
+        raise ValueError('Cursor inválido')
+    return values
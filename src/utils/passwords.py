@@ -0,0 +1,193 @@
+"""
+Hash e verificação de senhas com um limite de concorrência por máquina.
+
+Os algoritmos de senha são caros de propósito (scrypt/pbkdf2), então cada login ou
+cadastro ocupa uma CPU por dezenas de milissegundos. Com workers síncronos do gunicorn
+cada processo atende uma requisição por vez, então um limite por processo nunca seria
+atingido: o limite vale para a máquina inteira. Há PASSWORD_HASH_MAX_CONCURRENT vagas,
+cada uma um arquivo em PASSWORD_HASH_LOCK_DIR (padrão instance/password_slots) travado
+com flock enquanto o hash roda, na própria thread da requisição. Todos os workers da
+máquina disputam as mesmas vagas, e o sistema solta a trava se o processo morrer.
+Sem vaga em PASSWORD_HASH_WAIT_SECONDS, `PasswordHasherBusy` vira um 429 com
+Retry-After, em vez de uma fila que deixaria o resto da API sem CPU. Em sistemas sem
+fcntl (Windows, desenvolvimento) o limite é por processo. O número de workers continua
+sendo o teto de requisições simultâneas; o limite aqui só reserva CPU para as demais
+rotas quando muitas delas são de login ou cadastro.
+
+O algoritmo e o custo vêm de PASSWORD_HASH_METHOD, no formato do werkzeug
+('pbkdf2:sha256:600000', 'scrypt:32768:8:1' a partir do Werkzeug 2.3...). O padrão é
+o pbkdf2 com as iterações padrão da versão instalada, o mesmo que os cadastros já
+usavam. Hashes gravados com parâmetros diferentes dos atuais são refeitos no próximo
+login bem-sucedido.
+"""
+import os
+import threading
+import time
+
+from flask import current_app, jsonify
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_METHOD = 'pbkdf2:sha256'
+# Hashes simultâneos na máquina; acima disso (depois da espera), 429
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_WAIT_SECONDS = 0.25
+WAIT_POLL_SECONDS = 0.01
+DEFAULT_RETRY_AFTER_SECONDS = 1
+
+
+class PasswordHasherBusy(Exception):
+    """Todas as vagas de hash ocupadas: o chamador deve responder 429."""
+
+
+def normalize_method(method):
+    """
+    Completa os parâmetros omitidos com os padrões do werkzeug, para comparar com o
+    prefixo gravado no hash ('scrypt' -> 'scrypt:32768:8:1').
+    """
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        defaults = ['32768', '8', '1']
+    elif name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        raise ValueError(f'Método de hash de senha não suportado: {method}')
+    params = params + defaults[len(params):]
+    return ':'.join([name] + params)
+
+
+class HostSlots:
+    """Vagas compartilhadas pelos processos da máquina: um arquivo travado com flock por vaga."""
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        os.makedirs(directory, exist_ok=True)
+
+    def try_acquire(self):
+        """Descritor da vaga obtida, ou None se todas estiverem ocupadas."""
+        for slot in range(self.size):
+            fd = os.open(os.path.join(self.directory, f'slot-{slot}.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    def release(self, fd):
+        # Fechar o descritor solta a trava
+        os.close(fd)
+
+
+class ProcessSlots:
+    """Vagas do próprio processo, para sistemas sem fcntl."""
+
+    def __init__(self, size):
+        self._semaphore = threading.BoundedSemaphore(size)
+
+    def try_acquire(self):
+        return True if self._semaphore.acquire(blocking=False) else None
+
+    def release(self, token):
+        self._semaphore.release()
+
+
+class PasswordHasher:
+    """generate_password_hash / check_password_hash limitados por PASSWORD_HASH_MAX_CONCURRENT."""
+
+    def __init__(self, app, slots, wait_seconds=DEFAULT_WAIT_SECONDS):
+        self.app = app
+        self.slots = slots
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._dummy = None
+        self.counters = {'hashed': 0, 'verified': 0, 'rehashed': 0, 'rejected': 0}
+
+    @property
+    def method(self):
+        # Lido a cada chamada: mudar o custo não exige recriar o pool
+        return normalize_method(self.app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _run(self, fn, *args):
+        deadline = time.monotonic() + self.wait_seconds
+        token = self.slots.try_acquire()
+        while token is None and time.monotonic() < deadline:
+            time.sleep(WAIT_POLL_SECONDS)
+            token = self.slots.try_acquire()
+        if token is None:
+            self._count('rejected')
+            raise PasswordHasherBusy()
+        try:
+            return fn(*args)
+        finally:
+            self.slots.release(token)
+
+    def hash(self, password):
+        result = self._run(generate_password_hash, password, self.method)
+        self._count('hashed')
+        return result
+
+    def rehash(self, password):
+        result = self.hash(password)
+        self._count('rehashed')
+        return result
+
+    def _dummy_hash(self):
+        method = self.method
+        if self._dummy is None or self._dummy[0] != method:
+            self._dummy = (method, generate_password_hash('', method))
+        return self._dummy[1]
+
+    def verify(self, stored_hash, password):
+        """
+        Com `stored_hash` None (usuário inexistente) verifica contra um hash descartável:
+        o tempo de resposta não revela se o email existe e a fila limita esse caso também.
+        """
+        if stored_hash is None:
+            self._run(check_password_hash, self._dummy_hash(), password)
+            return False
+        result = self._run(check_password_hash, stored_hash, password)
+        self._count('verified')
+        return result
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.method
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def busy_response(error_key='error'):
+    """Resposta 429 para quando a fila de hash está cheia."""
+    retry_after = current_app.config.get('PASSWORD_HASH_RETRY_AFTER', DEFAULT_RETRY_AFTER_SECONDS)
+    response = jsonify({error_key: 'Servidor ocupado. Tente novamente em instantes.'})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+def create_slots(app):
+    size = app.config.get('PASSWORD_HASH_MAX_CONCURRENT', DEFAULT_MAX_CONCURRENT)
+    if fcntl is None:
+        return ProcessSlots(size)
+    directory = app.config.get('PASSWORD_HASH_LOCK_DIR') or os.path.join(app.instance_path, 'password_slots')
+    return HostSlots(directory, size)
+
+
+def init_password_hasher(app):
+    """Cria o limitador de hash de senhas com PASSWORD_HASH_MAX_CONCURRENT vagas na máquina."""
+    # Falha na inicialização se o método configurado for inválido
+    normalize_method(app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+    return app.extensions.setdefault('password_hasher', PasswordHasher(
+        app, create_slots(app), app.config.get('PASSWORD_HASH_WAIT_SECONDS', DEFAULT_WAIT_SECONDS)
+    ))
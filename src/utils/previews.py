@@ -0,0 +1,285 @@
+"""
+Pré-visualizações dos diplomas para a fila de aprovação do admin.
+
+Para cada diploma recebido são gerados, fora da requisição, dois JPEGs pequenos ao lado
+do original, no mesmo armazenamento: '<chave>.preview.jpg' (primeira página, até
+PREVIEW_SIZE pixels) e '<chave>.thumb.jpg' (até THUMBNAIL_SIZE pixels), nessa ordem.
+Como as chaves são endereçadas pelo conteúdo, diplomas idênticos compartilham as mesmas
+pré-visualizações. Quando a miniatura é gravada, StoredFile.previews_ready_at é
+preenchido: as listagens sabem o que está pronto com uma consulta ao banco, sem um HEAD
+no armazenamento (S3) por diploma.
+
+O trabalho roda num pool de processos (PREVIEW_WORKERS): decodificar uma foto de vários
+megapixels ou rasterizar um PDF não disputa o GIL com as requisições. Os processos são
+criados por forkserver (ou spawn, onde não há), nunca por fork: uma cópia do worker
+levaria junto conexões do banco e locks das threads em segundo plano. O envio ao pool
+acontece no commit do cadastro (eventos da sessão); o pool só sobe no primeiro envio,
+já dentro do worker. Enquanto a pré-visualização não existe, `preview_urls` devolve o
+arquivo original. PDFs precisam do `pdftoppm` (poppler-utils); sem ele ficam com o
+original. `flask generate-previews` processa os pendentes que ficaram para trás.
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from PIL import Image, ImageOps
+from sqlalchemy import event, inspect, select, update
+
+from src.models.user import db
+from src.models.professional import Professional
+from src.models.stored_file import StoredFile
+from src.utils.delivery import upload_url
+from src.utils.storage import download, get_storage
+from src.utils.uploads import derivative_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_PREVIEW_SIZE = 1024
+DEFAULT_THUMBNAIL_SIZE = 256
+JPEG_QUALITY = 80
+PDF_RENDER_TIMEOUT_SECONDS = 60
+
+
+# --- Renderização (roda nos processos do pool) ---
+
+def _open_pdf_first_page(source, size, directory):
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        return None
+    prefix = os.path.join(directory, 'page')
+    # Só a primeira página, já rasterizada no tamanho da pré-visualização
+    subprocess.run(
+        [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-jpeg', '-scale-to', str(size), source, prefix],
+        check=True, capture_output=True, timeout=PDF_RENDER_TIMEOUT_SECONDS
+    )
+    return Image.open(f'{prefix}.jpg')
+
+
+def _open_image(source, size):
+    image = Image.open(source)
+    # JPEG: decodifica direto numa escala reduzida, sem montar a foto inteira em memória
+    image.draft('RGB', (size, size))
+    return ImageOps.exif_transpose(image)
+
+
+def render_derivatives(storage, key, targets):
+    """
+    Gera os JPEGs `targets` ([(chave, tamanho máximo)], gravados do maior para o menor)
+    a partir da primeira página de `key`. Retorna False se o formato não é suportado.
+    """
+    size = max(target_size for _, target_size in targets)
+    with tempfile.TemporaryDirectory() as directory:
+        source = storage.local_path(key)
+        if source is None:
+            # Armazenamento remoto: baixa em blocos para um arquivo temporário
+            source = os.path.join(directory, 'source' + os.path.splitext(key)[1])
+            download(storage, key, source)
+        if source.lower().endswith('.pdf'):
+            image = _open_pdf_first_page(source, size, directory)
+            if image is None:
+                return False
+        else:
+            image = _open_image(source, size)
+        with image:
+            image = image.convert('RGB')
+            for number, (target_key, target_size) in enumerate(sorted(targets, key=lambda target: -target[1])):
+                # Reduz a partir da versão anterior: cada passo é menor que o primeiro
+                image.thumbnail((target_size, target_size))
+                path = os.path.join(directory, f'{number}.jpg')
+                image.save(path, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+                storage.put_file(target_key, path)
+    return True
+
+
+# --- Pool ---
+
+def pool_context():
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+
+def mark_ready(engine, key):
+    with engine.begin() as connection:
+        connection.execute(
+            update(StoredFile).where(StoredFile.key == key, StoredFile.previews_ready_at.is_(None))
+            .values(previews_ready_at=datetime.utcnow())
+        )
+
+
+def ready_keys(keys):
+    """As chaves de `keys` com pré-visualizações prontas, numa única consulta."""
+    keys = {key for key in keys if key}
+    if not keys:
+        return set()
+    return set(db.session.execute(
+        select(StoredFile.key).where(StoredFile.key.in_(keys), StoredFile.previews_ready_at.isnot(None))
+    ).scalars())
+
+
+class PreviewGenerator:
+    """Envia os diplomas a um pool de processos e acompanha o que está em andamento."""
+
+    def __init__(self, app, workers=DEFAULT_WORKERS):
+        self.app = app
+        self.workers = workers
+        self.counters = {'generated': 0, 'unsupported': 0, 'failed': 0}
+        self._executor = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = {}
+
+    def _config(self, key, default):
+        return self.app.config.get(key, default)
+
+    def _targets(self, key):
+        return [
+            (derivative_key(key, 'preview'), self._config('PREVIEW_SIZE', DEFAULT_PREVIEW_SIZE)),
+            (derivative_key(key, 'thumb'), self._config('THUMBNAIL_SIZE', DEFAULT_THUMBNAIL_SIZE)),
+        ]
+
+    def is_ready(self, key):
+        # A miniatura é gravada por último
+        return get_storage().exists(derivative_key(key, 'thumb'))
+
+    def submit(self, key):
+        """Agenda a geração para `key`. Retorna o future, ou None se não há o que fazer."""
+        if not self.workers or not self._config('PREVIEW_ENABLED', True):
+            return None
+        storage = get_storage()
+        with self._lock:
+            if key in self._in_flight:
+                return self._in_flight[key]
+            if self.is_ready(key):
+                # Gerada antes da coluna previews_ready_at, ou o registro no banco falhou
+                self._mark_ready(key)
+                return None
+            if not storage.exists(key):
+                return None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+            # O driver vai para o processo do pool (só configuração, sem conexões abertas)
+            future = self._executor.submit(render_derivatives, storage, key, self._targets(key))
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def _finished(self, key, future):
+        try:
+            counter = 'generated' if future.result() else 'unsupported'
+        except Exception as e:
+            logger.warning(f'Falha ao gerar a pré-visualização de {key}: {e}')
+            counter = 'failed'
+        if counter == 'generated':
+            self._mark_ready(key)
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self.counters[counter] += 1
+            self._idle.notify_all()
+
+    def _mark_ready(self, key):
+        try:
+            with self.app.app_context():
+                mark_ready(db.engine, key)
+        except Exception as e:
+            # Os arquivos existem; `flask generate-previews` registra na próxima execução
+            logger.warning(f'Não foi possível registrar a pré-visualização de {key}: {e}')
+
+    def wait(self, timeout=None):
+        """Espera o que está em andamento (comando de linha e testes)."""
+        with self._lock:
+            # Até o registro no banco, feito depois que o future termina
+            self._idle.wait_for(lambda: not self._in_flight, timeout)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def get_preview_generator():
+    return current_app.extensions.get('preview_generator')
+
+
+def preview_urls(key, ready=None):
+    """
+    Links assinados do diploma, da pré-visualização e da miniatura (estes dois apontam
+    para o original enquanto não ficam prontos). Só para quem pode ver o diploma.
+    Listagens passam `ready` de `ready_keys`; sem ele, a situação é consultada no banco.
+    """
+    if ready is None:
+        ready = key in ready_keys([key])
+    ready = bool(key) and ready
+    original = upload_url(key) if key else None
+    return {
+        'diploma_url': original,
+        'preview_url': upload_url(derivative_key(key, 'preview')) if ready else original,
+        'thumbnail_url': upload_url(derivative_key(key, 'thumb')) if ready else original,
+        'preview_ready': ready,
+    }
+
+
+# --- Envio no commit do cadastro ---
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_diplomas(session, flush_context):
+    keys = session.info.setdefault('preview_pending', set())
+    for obj in session.new:
+        if isinstance(obj, Professional) and obj.diploma_file:
+            keys.add(obj.diploma_file)
+    for obj in session.dirty:
+        if isinstance(obj, Professional):
+            keys.update(key for key in inspect(obj).attrs.diploma_file.history.added or () if key)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_diplomas(session):
+    session.info.pop('preview_pending', None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _submit_diplomas(session):
+    keys = session.info.pop('preview_pending', None)
+    if not keys:
+        return
+    generator = current_app.extensions.get('preview_generator')
+    if generator is None:
+        return
+    for key in keys:
+        try:
+            generator.submit(key)
+        except Exception as e:
+            # O cadastro já foi commitado; `flask generate-previews` recupera depois
+            logger.warning(f'Não foi possível agendar a pré-visualização de {key}: {e}')
+
+
+def init_previews(app):
+    """Registra o gerador e o comando `flask generate-previews`."""
+    generator = app.extensions.setdefault(
+        'preview_generator',
+        PreviewGenerator(app, app.config.get('PREVIEW_WORKERS', DEFAULT_WORKERS))
+    )
+
+    @app.cli.command('generate-previews')
+    def generate_previews_command():
+        """Gera as pré-visualizações que faltam para os profissionais pendentes."""
+        with db.engine.connect() as connection:
+            keys = connection.execute(
+                select(Professional.diploma_file).distinct()
+                .join(StoredFile, StoredFile.key == Professional.diploma_file)
+                .where(Professional.approval_status == 'pending', StoredFile.previews_ready_at.is_(None))
+            ).scalars().all()
+        submitted = [key for key in keys if key and generator.submit(key) is not None]
+        generator.wait()
+        generator.shutdown()
+        print(f"{len(submitted)} diplomas processados: {generator.counters}")
+
+    return generator
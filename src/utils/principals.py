@@ -0,0 +1,158 @@
+"""
+Cache do "principal" de cada requisição autenticada: o estado atual do usuário do token.
+
+O token diz quem o usuário era quando fez login; `roles_required` confere com este
+registro se a conta ainda existe, qual é o perfil atual (um admin rebaixado perde o
+acesso de admin) e se o cadastro de profissional não foi rejeitado ou expirado.
+
+Cada registro é pequeno (id, perfil, status de aprovação) e vale PRINCIPAL_CACHE_TTL
+segundos. Alterações e exclusões de User/Professional feitas pela sessão invalidam a
+entrada no commit, via eventos do SQLAlchemy; em outros processos a mudança aparece no
+máximo ao fim do TTL. Numa requisição com o principal em cache não há consulta ao banco.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from flask import current_app
+from sqlalchemy import event, select
+
+from src.models.user import db, User
+from src.models.professional import Professional
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL_SECONDS = 10
+# Profissionais nesses status perdem o acesso de profissional imediatamente
+DEFAULT_BLOCKED_PROFESSIONAL_STATUSES = ('rejected', 'expired')
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int
+    user_type: str
+    approval_status: str = None
+
+
+class PrincipalCache:
+    """LRU com expiração de principais por id de usuário; None marca usuário inexistente."""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, now=None):
+        """Retorna (encontrado, principal)."""
+        now = now or time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, user_id, principal, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            self._entries[user_id] = (principal, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_principal_cache():
+    cache = current_app.extensions.get('principal_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('principal_cache', PrincipalCache(
+            current_app.config.get('PRINCIPAL_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+            current_app.config.get('PRINCIPAL_CACHE_TTL', DEFAULT_CACHE_TTL_SECONDS)
+        ))
+    return cache
+
+
+def load_principal(user_id):
+    # Conexão própria: não interfere na transação da sessão da requisição
+    with db.engine.connect() as connection:
+        row = connection.execute(
+            select(User.id, User.user_type, Professional.approval_status)
+            .outerjoin(Professional, Professional.user_id == User.id)
+            .where(User.id == user_id)
+        ).first()
+    return Principal(row.id, row.user_type, row.approval_status) if row else None
+
+
+def get_principal(user_id):
+    cache = get_principal_cache()
+    found, principal = cache.get(user_id)
+    if not found:
+        principal = load_principal(user_id)
+        cache.put(user_id, principal)
+    return principal
+
+
+def is_blocked(principal):
+    blocked = current_app.config.get('PRINCIPAL_BLOCKED_PROFESSIONAL_STATUSES', DEFAULT_BLOCKED_PROFESSIONAL_STATUSES)
+    return principal.user_type == 'professional' and principal.approval_status in blocked
+
+
+# --- Invalidação via eventos da sessão ---
+
+def _pending(session):
+    return session.info.setdefault('principal_cache_pending', {'user_ids': set(), 'clear': False})
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changes(session, flush_context):
+    pending = _pending(session)
+    # Inclui os novos: um usuário recém-criado pode ter um "inexistente" em cache
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            pending['user_ids'].add(obj.id)
+        elif isinstance(obj, Professional):
+            pending['user_ids'].add(obj.user_id)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    # UPDATE/DELETE em massa não passam pelo flush: descarta o cache inteiro no commit
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mappers = {mapper.class_ for mapper in orm_execute_state.all_mappers}
+        if mappers & {User, Professional}:
+            _pending(orm_execute_state.session)['clear'] = True
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('principal_cache_pending', None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_changes(session):
+    pending = session.info.pop('principal_cache_pending', None)
+    if not pending:
+        return
+    cache = current_app.extensions.get('principal_cache')
+    if cache is None:
+        return
+    if pending['clear']:
+        cache.clear()
+    else:
+        cache.invalidate(pending['user_ids'])
@@ -0,0 +1,290 @@
+"""
+Limite de tentativas de login e cadastro, aplicado antes de qualquer acesso ao banco.
+
+Cada rota protegida consome, por requisição, uma unidade de cada regra do seu grupo:
+
+- por IP, um token bucket (`limit` tokens repostos ao longo de `period` segundos):
+  tolera rajadas de vários usuários atrás do mesmo NAT;
+- por email, uma janela deslizante (no máximo `limit` tentativas em `period` segundos,
+  estimadas a partir da janela fixa atual e da anterior): limite rígido por conta.
+
+O estado de cada chave tem tamanho fixo (dois ou três números) e as chaves ficam num
+LRU limitado a RATE_LIMIT_MAX_KEYS. Com RATE_LIMIT_STORAGE='memory' cada processo tem
+o seu; com 'shared://host:porta' todos os workers consultam o mesmo armazenamento,
+servido por `flask rate-limit-store`. Se o armazenamento compartilhado cair, recusar
+a conexão ou a authkey, as requisições passam (fail open) e o problema vai para o log
+uma vez por indisponibilidade.
+
+As regras por IP são verificadas antes de ler o corpo: um cliente bloqueado por IP não
+chega a ter o formulário (e o diploma enviado em multipart) lido e gravado em disco.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from multiprocessing import ProcessError
+from multiprocessing.managers import BaseManager, RemoteError
+
+import click
+from flask import current_app, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORAGE = 'memory'
+DEFAULT_MAX_KEYS = 100000
+DEFAULT_STORE_PORT = 6390
+# Falhas do cliente do armazenamento compartilhado que liberam a requisição: rede
+# (OSError, inclusive ConnectionRefusedError), conexão encerrada (EOFError), authkey
+# diferente (AuthenticationError, um ProcessError) e erros do servidor repassados pelo
+# proxy (RemoteError), como o id do objeto desconhecido após reiniciar o armazenamento
+STORE_ERRORS = (OSError, EOFError, ProcessError, RemoteError)
+TOKEN_BUCKET = 'token_bucket'
+SLIDING_WINDOW = 'sliding_window'
+
+# Grupo -> [(configuração, dimensão, algoritmo, limite padrão, período padrão)]
+DEFAULT_RULES = {
+    'login': [
+        ('RATE_LIMIT_LOGIN_IP', 'ip', TOKEN_BUCKET, 30, 60),
+        ('RATE_LIMIT_LOGIN_EMAIL', 'email', SLIDING_WINDOW, 10, 300),
+    ],
+    'register': [
+        ('RATE_LIMIT_REGISTER_IP', 'ip', TOKEN_BUCKET, 20, 3600),
+        ('RATE_LIMIT_REGISTER_EMAIL', 'email', SLIDING_WINDOW, 5, 3600),
+    ],
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    dimension: str
+    algorithm: str
+    limit: int
+    period: float
+
+
+def _token_bucket(state, limit, period, now):
+    if state is None:
+        state = [float(limit), now]
+    rate = limit / period
+    tokens = min(float(limit), state[0] + (now - state[1]) * rate)
+    state[1] = now
+    if tokens >= 1:
+        state[0] = tokens - 1
+        return state, True, 0
+    state[0] = tokens
+    return state, False, (1 - tokens) / rate
+
+
+def _sliding_window(state, limit, period, now):
+    window = math.floor(now / period)
+    if state is None:
+        state = [window, 0, 0]
+    if state[0] != window:
+        # Só a janela imediatamente anterior ainda pesa na estimativa
+        state[2] = state[1] if state[0] == window - 1 else 0
+        state[1] = 0
+        state[0] = window
+    elapsed = now / period - window
+    if state[2] * (1 - elapsed) + state[1] + 1 <= limit:
+        state[1] += 1
+        return state, True, 0
+    # Tentativas negadas não contam; espera até a janela anterior pesar o suficiente menos
+    room = limit - state[1] - 1
+    if room < 0 or not state[2]:
+        retry_after = (window + 1) * period - now
+    else:
+        retry_after = ((1 - room / state[2]) - elapsed) * period
+    return state, False, max(retry_after, 0)
+
+
+ALGORITHMS = {TOKEN_BUCKET: _token_bucket, SLIDING_WINDOW: _sliding_window}
+
+
+class MemoryBackend:
+    """Estado dos limites num LRU do próprio processo."""
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, algorithm, limit, period, now=None):
+        """Consome uma unidade de `key`. Retorna (permitido, segundos até a próxima)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            state, allowed, retry_after = ALGORITHMS[algorithm](self._states.get(key), limit, period, now)
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        return allowed, retry_after
+
+    def reset(self):
+        with self._lock:
+            self._states.clear()
+
+    def size(self):
+        return len(self._states)
+
+
+class _StoreManager(BaseManager):
+    pass
+
+
+def _parse_address(url):
+    host, _, port = url[len('shared://'):].partition(':')
+    return host or '127.0.0.1', int(port or DEFAULT_STORE_PORT)
+
+
+def _authkey(config):
+    return (config.get('RATE_LIMIT_STORE_AUTHKEY') or config['SECRET_KEY']).encode()
+
+
+def serve_store(address, authkey, max_keys=DEFAULT_MAX_KEYS):
+    """Cria o servidor do armazenamento compartilhado (chame `serve_forever()` nele)."""
+    store = MemoryBackend(max_keys)
+
+    class Manager(BaseManager):
+        pass
+
+    Manager.register('store', callable=lambda: store)
+    return Manager(address=address, authkey=authkey).get_server()
+
+
+class SharedBackend:
+    """Cliente do armazenamento servido por `flask rate-limit-store`."""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self._store = None
+        self._lock = threading.Lock()
+        self._unavailable = False
+
+    def _connect(self):
+        with self._lock:
+            if self._store is None:
+                manager = _StoreManager(address=self.address, authkey=self.authkey)
+                manager.connect()
+                self._store = manager.store()
+            return self._store
+
+    def hit(self, key, algorithm, limit, period, now=None):
+        try:
+            # O relógio é o do armazenamento: os workers não precisam estar sincronizados
+            result = self._connect().hit(key, algorithm, limit, period, now)
+        except STORE_ERRORS as e:
+            # Descarta o proxy: a próxima requisição reconecta
+            self._store = None
+            if not self._unavailable:
+                self._unavailable = True
+                logger.warning(f'Armazenamento de limites indisponível, liberando as requisições: {e!r}')
+            return True, 0
+        if self._unavailable:
+            self._unavailable = False
+            logger.info('Armazenamento de limites disponível novamente')
+        return result
+
+    def reset(self):
+        self._connect().reset()
+
+
+_StoreManager.register('store')
+
+
+def create_backend(config):
+    storage = config.get('RATE_LIMIT_STORAGE', DEFAULT_STORAGE)
+    if storage == 'memory':
+        return MemoryBackend(config.get('RATE_LIMIT_MAX_KEYS', DEFAULT_MAX_KEYS))
+    if storage.startswith('shared://'):
+        return SharedBackend(_parse_address(storage), _authkey(config))
+    raise ValueError(f'RATE_LIMIT_STORAGE inválido: {storage}')
+
+
+class RateLimiter:
+    def __init__(self, app, backend):
+        self.app = app
+        self.backend = backend
+
+    def rules(self, group):
+        rules = []
+        for config_key, dimension, algorithm, limit, period in DEFAULT_RULES[group]:
+            # Configuração no formato (limite, período em segundos); None desliga a regra
+            value = self.app.config.get(config_key, (limit, period))
+            if value:
+                rules.append(Rule(f'{group}:{dimension}', dimension, algorithm, value[0], value[1]))
+        return rules
+
+    def check(self, group, identities):
+        """
+        Consome uma unidade de cada regra do grupo para as identidades informadas
+        ({'ip': ..., 'email': ...}). Retorna 0 se permitido ou os segundos de espera.
+        """
+        retry_after = 0
+        for rule in self.rules(group):
+            identity = identities.get(rule.dimension)
+            if not identity:
+                continue
+            # Digest curto: o tamanho da chave não depende do que o cliente enviou
+            key = f'{rule.name}:' + hashlib.blake2b(identity.encode(), digest_size=12).hexdigest()
+            allowed, wait = self.backend.hit(key, rule.algorithm, rule.limit, rule.period)
+            if not allowed:
+                retry_after = max(retry_after, wait)
+        return retry_after
+
+
+def get_rate_limiter():
+    return current_app.extensions['rate_limiter']
+
+
+def _client_ip():
+    if current_app.config.get('RATE_LIMIT_TRUST_PROXY', False):
+        return request.access_route[0] if request.access_route else request.remote_addr
+    return request.remote_addr
+
+
+def _request_email():
+    data = request.get_json(silent=True) if request.is_json else request.form
+    email = (data or {}).get('email')
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+def rate_limited(group, error_key='error'):
+    """Decorator que aplica as regras de `group` antes de executar a rota."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if current_app.config.get('RATE_LIMIT_ENABLED', True):
+                limiter = get_rate_limiter()
+                retry_after = limiter.check(group, {'ip': _client_ip()})
+                if not retry_after:
+                    retry_after = limiter.check(group, {'email': _request_email()})
+                if retry_after:
+                    response = jsonify({error_key: 'Muitas tentativas. Tente novamente mais tarde.'})
+                    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                    return response, 429
+            return f(*args, **kwargs)
+
+        return decorated
+    return decorator
+
+
+def init_rate_limiter(app):
+    """Cria o limitador conforme RATE_LIMIT_STORAGE e registra `flask rate-limit-store`."""
+    limiter = app.extensions.setdefault('rate_limiter', RateLimiter(app, create_backend(app.config)))
+
+    @app.cli.command('rate-limit-store')
+    @click.option('--host', default='127.0.0.1', help='Endereço de escuta.')
+    @click.option('--port', type=int, default=DEFAULT_STORE_PORT, help='Porta de escuta.')
+    def rate_limit_store_command(host, port):
+        """Serve o armazenamento de limites compartilhado pelos workers."""
+        server = serve_store((host, port), _authkey(app.config), app.config.get('RATE_LIMIT_MAX_KEYS', DEFAULT_MAX_KEYS))
+        print(f'Armazenamento de limites em {host}:{port}')
+        server.serve_forever()
+
+    return limiter
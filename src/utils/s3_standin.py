@@ -0,0 +1,193 @@
+"""
+Servidor S3 mínimo, em processo, para testes e desenvolvimento sem nuvem.
+
+Implementa o subconjunto usado por S3Storage, com endereçamento por caminho
+(/bucket/chave): PUT, GET (com Range), HEAD e DELETE de objetos, multipart upload
+(criar, enviar parte, concluir, abortar) e GET por URL pré-assinada. Confere a
+assinatura V4 de cada requisição
+com as credenciais configuradas e exige partes de pelo menos `min_part_size` bytes,
+como o S3. Os objetos ficam em arquivos sob `directory`, gravados em blocos.
+"""
+import hashlib
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import xml.etree.ElementTree as ElementTree
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl
+
+from werkzeug.serving import make_server
+from werkzeug.utils import send_file
+from werkzeug.wrappers import Request, Response
+
+from src.utils.storage import DEFAULT_CHUNK_SIZE, DEFAULT_S3_REGION, UNSIGNED_PAYLOAD, _uri_encode, signature_v4
+
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+AUTHORIZATION_PATTERN = re.compile(
+    r'AWS4-HMAC-SHA256 Credential=(?P<access_key>[^/]+)/(?P<date>\d{8})/(?P<region>[^/]+)/s3/aws4_request, '
+    r'SignedHeaders=(?P<signed>[^,]+), Signature=(?P<signature>[0-9a-f]{64})'
+)
+
+
+def _error(status, code):
+    body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code></Error>'
+    return Response(body, status=status, mimetype='application/xml')
+
+
+class S3StandIn:
+    def __init__(self, directory, access_key, secret_key, region=DEFAULT_S3_REGION, min_part_size=S3_MIN_PART_SIZE):
+        self.directory = directory
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.min_part_size = min_part_size
+        self.requests = Counter()
+        self._server = None
+
+    # --- Armazenamento ---
+
+    def _object_path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.directory, bucket, 'objects', key))
+        if not path.startswith(os.path.normpath(self.directory) + os.sep):
+            raise ValueError(key)
+        return path
+
+    def _upload_path(self, bucket, upload_id):
+        return os.path.join(self.directory, bucket, 'uploads', os.path.basename(upload_id))
+
+    def _receive(self, request, path):
+        """Grava o corpo em `path` em blocos; devolve o MD5 (ETag do S3)."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        md5 = hashlib.md5()
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as f:
+            while True:
+                chunk = request.stream.read(DEFAULT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                md5.update(chunk)
+                f.write(chunk)
+        os.replace(temporary, path)
+        return md5.hexdigest()
+
+    # --- Requisições ---
+
+    def _presigned(self, request):
+        query = dict(parse_qsl(request.query_string.decode(), keep_blank_values=True))
+        signature = query.pop('X-Amz-Signature')
+        amz_date = query.get('X-Amz-Date', '')
+        try:
+            expires_at = datetime.strptime(amz_date, '%Y%m%dT%H%M%SZ') + timedelta(seconds=int(query['X-Amz-Expires']))
+        except (KeyError, ValueError):
+            return False
+        if request.method != 'GET' or expires_at < datetime.utcnow() or \
+                query.get('X-Amz-Credential', '').split('/')[0] != self.access_key:
+            return False
+        expected = signature_v4(
+            self.secret_key, self.region, request.method, _uri_encode(request.path, safe='/-_.~'), query,
+            {'host': request.host}, ['host'], UNSIGNED_PAYLOAD, amz_date
+        )
+        return secrets.compare_digest(expected, signature)
+
+    def _authorized(self, request):
+        if 'X-Amz-Signature' in request.args:
+            return self._presigned(request)
+        match = AUTHORIZATION_PATTERN.fullmatch(request.headers.get('Authorization', ''))
+        if not match or match['access_key'] != self.access_key or match['region'] != self.region:
+            return False
+        signed = match['signed'].split(';')
+        headers = {name: request.headers.get(name, '') for name in signed}
+        query = dict(parse_qsl(request.query_string.decode(), keep_blank_values=True))
+        expected = signature_v4(
+            self.secret_key, self.region, request.method, _uri_encode(request.path, safe='/-_.~'), query,
+            headers, signed, request.headers.get('x-amz-content-sha256', ''), request.headers.get('x-amz-date', '')
+        )
+        return secrets.compare_digest(expected, match['signature'])
+
+    def dispatch(self, request):
+        if not self._authorized(request):
+            return _error(403, 'SignatureDoesNotMatch')
+        bucket, _, key = request.path.lstrip('/').partition('/')
+        if not bucket or not key:
+            return _error(400, 'InvalidRequest')
+        path = self._object_path(bucket, key)
+        args = request.args
+
+        if request.method == 'POST' and 'uploads' in args:
+            self.requests['create_multipart'] += 1
+            upload_id = secrets.token_hex(16)
+            os.makedirs(self._upload_path(bucket, upload_id))
+            body = f'<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>'
+            return Response(body, mimetype='application/xml')
+        if 'uploadId' in args:
+            upload = self._upload_path(bucket, args['uploadId'])
+            if not os.path.isdir(upload):
+                return _error(404, 'NoSuchUpload')
+            if request.method == 'PUT':
+                self.requests['upload_part'] += 1
+                etag = self._receive(request, os.path.join(upload, f"{int(args['partNumber']):05d}"))
+                return Response(headers={'ETag': f'"{etag}"'})
+            if request.method == 'POST':
+                self.requests['complete_multipart'] += 1
+                return self._complete(request, upload, path)
+            if request.method == 'DELETE':
+                self.requests['abort_multipart'] += 1
+                shutil.rmtree(upload, ignore_errors=True)
+                return Response(status=204)
+
+        if request.method == 'PUT':
+            self.requests['put'] += 1
+            etag = self._receive(request, path)
+            return Response(headers={'ETag': f'"{etag}"'})
+        if request.method in ('GET', 'HEAD'):
+            self.requests[request.method.lower()] += 1
+            if not os.path.isfile(path):
+                return _error(404, 'NoSuchKey')
+            # Range, 206 e Content-Length ficam por conta do Werkzeug
+            return send_file(path, request.environ, mimetype='application/octet-stream', conditional=True)
+        if request.method == 'DELETE':
+            self.requests['delete'] += 1
+            if os.path.exists(path):
+                os.remove(path)
+            return Response(status=204)
+        return _error(405, 'MethodNotAllowed')
+
+    def _complete(self, request, upload, path):
+        numbers = [int(element.text) for element in ElementTree.fromstring(request.get_data()).iter('PartNumber')]
+        parts = [os.path.join(upload, f'{number:05d}') for number in numbers]
+        if not numbers or numbers != sorted(numbers) or not all(os.path.exists(part) for part in parts):
+            return _error(400, 'InvalidPart')
+        if any(os.path.getsize(part) < self.min_part_size for part in parts[:-1]):
+            return _error(400, 'EntityTooSmall')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as target:
+            for part in parts:
+                with open(part, 'rb') as source:
+                    shutil.copyfileobj(source, target, DEFAULT_CHUNK_SIZE)
+        os.replace(temporary, path)
+        shutil.rmtree(upload, ignore_errors=True)
+        return Response('<CompleteMultipartUploadResult/>', mimetype='application/xml')
+
+    def __call__(self, environ, start_response):
+        return self.dispatch(Request(environ))(environ, start_response)
+
+    # --- Servidor ---
+
+    def start(self, host='127.0.0.1', port=0):
+        """Sobe o servidor numa thread; devolve a URL do endpoint."""
+        self._server = make_server(host, port, self, threaded=True)
+        threading.Thread(target=self._server.serve_forever, name='s3-standin', daemon=True).start()
+        return f'http://{host}:{self._server.server_port}'
+
+    def serve(self, host, port):
+        make_server(host, port, self, threaded=True).serve_forever()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
@@ -0,0 +1,383 @@
+import re
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from src.models.user import db, User
+from src.models.category import Category
+from src.models.professional import Professional, Activity, ProfessionalActivity
+from src.utils.text import fold_text
+
+TOKEN_RE = re.compile(r'\w+')
+# Cada worker do gunicorn tem o seu índice e só vê os commits que ele mesmo fez;
+# a reconstrução periódica, numa thread em segundo plano, faz os demais convergirem
+DEFAULT_REFRESH_SECONDS = 60
+# Palavras muito curtas da bio não ajudam a filtrar e só aumentam o índice
+MIN_BIO_TOKEN_LENGTH = 2
+
+
+def tokenize(text, min_length=1):
+    """Quebra um texto em termos sem acento e em minúsculas."""
+    if not text:
+        return set()
+    return {t for t in TOKEN_RE.findall(fold_text(text)) if len(t) >= min_length}
+
+
+class _Field:
+    """Listas invertidas de um campo: termo -> conjunto de ids de profissionais."""
+
+    def __init__(self, substring_search=False):
+        self.postings = {}
+        self.substring_search = substring_search
+
+    def add(self, term, doc_id):
+        self.postings.setdefault(term, set()).add(doc_id)
+
+    def remove(self, term, doc_id):
+        ids = self.postings.get(term)
+        if ids is None:
+            return
+        ids.discard(doc_id)
+        if not ids:
+            del self.postings[term]
+
+    def lookup(self, term):
+        if not self.substring_search:
+            return self.postings.get(term, set())
+        # Une as listas de todos os termos que contêm `term`, como o LIKE '%termo%' do banco
+        result = set()
+        for indexed, ids in self.postings.items():
+            if term in indexed:
+                result |= ids
+        return result
+
+
+class ProfessionalSearchIndex:
+    """
+    Índice invertido em memória dos profissionais aprovados. Indexa tokens do nome,
+    ids de atividades, nomes de categorias e palavras da bio, e responde filtros
+    combinados pela interseção das listas invertidas.
+
+    Nome e palavras-chave seguem a mesma regra da consulta no banco (`_filtered_query`
+    em src/routes/search.py): substring do texto normalizado. As listas dos tokens que
+    contêm cada parte da busca reduzem os candidatos, e o texto normalizado guardado no
+    documento confirma cada um; o resultado não depende de o índice estar ligado.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Uma reconstrução por vez; quem não consegue o lock continua com o índice atual
+        self._build_lock = threading.Lock()
+        self.ready = False
+        self.built_at = None
+        # Ids alterados durante uma reconstrução, reaplicados depois da troca
+        self._building = False
+        self._touched = set()
+        self.documents, self.fields = self._empty()
+
+    @staticmethod
+    def _empty():
+        return {}, {
+            'name': _Field(substring_search=True),
+            'activity': _Field(),
+            'category': _Field(),
+            'bio': _Field(substring_search=True),
+        }
+
+    @staticmethod
+    def document_for(prof):
+        """Termos indexados de um profissional (com user/atividades/categorias carregados)."""
+        activities = set()
+        categories = set()
+        for pa in prof.activities:
+            activities.add(pa.activity_id)
+            if pa.activity and pa.activity.category:
+                categories.add(fold_text(pa.activity.category.name))
+        name = prof.user.name if prof.user else None
+        return {
+            'name': tokenize(name),
+            'activity': activities,
+            'category': categories,
+            'bio': tokenize(prof.bio, min_length=MIN_BIO_TOKEN_LENGTH),
+            # Textos comparados por substring, como User.name_normalized e Professional.bio_normalized
+            'name_text': fold_text(name) or '',
+            'bio_text': fold_text(prof.bio) or '',
+        }
+
+    def build(self, session):
+        """
+        Monta um índice novo fora do lock e o troca de uma vez: as buscas continuam
+        respondidas pelo índice anterior enquanto isso.
+        """
+        with self._lock:
+            self._building = True
+            self._touched = set()
+        try:
+            professionals = _approved_professionals_query(session).all()
+            documents, fields = self._empty()
+            for prof in professionals:
+                self._add(documents, fields, prof.id, self.document_for(prof))
+        except BaseException:
+            with self._lock:
+                self._building = False
+            raise
+        with self._lock:
+            self.documents, self.fields = documents, fields
+            self._building = False
+            touched, self._touched = self._touched, set()
+            self.ready = True
+            self.built_at = time.monotonic()
+        if touched:
+            # Commits feitos durante a leitura acima podem não estar no índice novo
+            session.commit()
+            sync_professionals(self, session, touched)
+
+    @staticmethod
+    def _add(documents, fields, doc_id, document):
+        documents[doc_id] = document
+        for field_name, field in fields.items():
+            for term in document[field_name]:
+                field.add(term, doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            if self._building:
+                self._touched.add(doc_id)
+            document = self.documents.pop(doc_id, None)
+            if document is None:
+                return
+            for field_name, field in self.fields.items():
+                for term in document[field_name]:
+                    field.remove(term, doc_id)
+
+    def upsert(self, prof):
+        document = self.document_for(prof)
+        with self._lock:
+            self.remove(prof.id)
+            self._add(self.documents, self.fields, prof.id, document)
+
+    def lookup(self, field_name, term):
+        with self._lock:
+            return set(self.fields[field_name].lookup(term))
+
+    def search(self, activity_id=None, category=None, name=None, keywords=None):
+        """Retorna os ids, em ordem crescente, que atendem a todos os filtros informados."""
+        # Mesmos termos da consulta no banco: o nome inteiro e cada palavra-chave
+        checks = []
+        folded_name = fold_text(name) if name else None
+        if folded_name:
+            checks.append(('name', folded_name, 1))
+        for term in (fold_text(keywords).split() if keywords else ()):
+            checks.append(('bio', term, MIN_BIO_TOKEN_LENGTH))
+
+        with self._lock:
+            candidates = []
+            if activity_id is not None:
+                candidates.append(self.fields['activity'].lookup(activity_id))
+            if category:
+                candidates.append(self.fields['category'].lookup(fold_text(category)))
+            for field_name, text, min_length in checks:
+                # Cada trecho de letras/dígitos da busca está dentro de um token do texto
+                for part in TOKEN_RE.findall(text):
+                    if len(part) >= min_length:
+                        candidates.append(self.fields[field_name].lookup(part))
+
+            if candidates:
+                # Intersecta começando pela menor lista
+                candidates.sort(key=len)
+                result = set(candidates[0])
+                for ids in candidates[1:]:
+                    if not result:
+                        break
+                    result &= ids
+            else:
+                result = set(self.documents)
+            if checks:
+                result = {
+                    doc_id for doc_id in result
+                    if all(text in self.documents[doc_id][f'{field_name}_text'] for field_name, text, _ in checks)
+                }
+            return sorted(result)
+
+
+def _approved_professionals_query(session):
+    return session.query(Professional).options(
+        joinedload(Professional.user),
+        selectinload(Professional.activities)
+            .joinedload(ProfessionalActivity.activity)
+            .joinedload(Activity.category),
+    ).filter(Professional.approval_status == 'approved')
+
+
+def sync_professionals(index, session, professional_ids, user_ids=()):
+    """Reindexa os profissionais informados (e os dos usuários informados) a partir do banco."""
+    professional_ids = {i for i in professional_ids if i is not None}
+    user_ids = {i for i in user_ids if i is not None}
+    if not professional_ids and not user_ids:
+        return
+    if user_ids:
+        professional_ids |= {
+            prof_id for (prof_id,) in session.query(Professional.id).filter(Professional.user_id.in_(user_ids))
+        }
+
+    approved = _approved_professionals_query(session)\
+        .filter(or_(Professional.id.in_(professional_ids), Professional.user_id.in_(user_ids)))\
+        .all()
+    for prof in approved:
+        index.upsert(prof)
+    # Excluídos, rejeitados ou voltados para pendente saem do índice
+    for prof_id in professional_ids - {prof.id for prof in approved}:
+        index.remove(prof_id)
+
+
+def _refresh(app, index):
+    try:
+        with app.app_context(), Session(db.engine) as session:
+            index.build(session)
+    except Exception as e:
+        app.logger.warning(f'Falha ao reconstruir o índice de busca: {e}')
+    finally:
+        index._build_lock.release()
+
+
+def refresh_in_background(app, index):
+    """
+    Reconstrói o índice numa thread, se nenhuma reconstrução estiver em andamento.
+    Retorna False se outra já estiver rodando.
+    """
+    if not index._build_lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=_refresh, args=(app, index), name='search-index-refresh', daemon=True).start()
+    return True
+
+
+def get_search_index():
+    """
+    Retorna o índice da aplicação atual. Só a primeira construção bloqueia a
+    requisição (e uma única vez, mesmo com requisições simultâneas); depois de
+    SEARCH_INDEX_REFRESH_SECONDS a reconstrução roda em segundo plano e o índice atual
+    continua respondendo. Retorna None se o índice estiver desabilitado
+    (SEARCH_INDEX_ENABLED = False).
+    """
+    index = current_app.extensions.get('search_index')
+    if index is None:
+        return None
+    if not index.ready:
+        with index._build_lock:
+            if not index.ready:
+                with Session(db.engine) as session:
+                    index.build(session)
+        return index
+    refresh_seconds = current_app.config.get('SEARCH_INDEX_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+    if refresh_seconds and time.monotonic() - index.built_at > refresh_seconds:
+        refresh_in_background(current_app._get_current_object(), index)
+    return index
+
+
+def check_consistency(index):
+    """
+    Compara o índice com o banco de dados. Retorna um dicionário com os ids que
+    faltam no índice, os que sobram e os que estão desatualizados.
+    """
+    expected = ProfessionalSearchIndex()
+    with Session(db.engine) as session:
+        expected.build(session)
+    with index._lock:
+        indexed = dict(index.documents)
+    return {
+        'missing': sorted(set(expected.documents) - set(indexed)),
+        'extra': sorted(set(indexed) - set(expected.documents)),
+        'stale': sorted(
+            doc_id for doc_id in set(expected.documents) & set(indexed)
+            if expected.documents[doc_id] != indexed[doc_id]
+        ),
+    }
+
+
+# --- Manutenção incremental via eventos da sessão ---
+
+def _pending(session):
+    return session.info.setdefault('search_index_pending', {
+        'professional_ids': set(), 'user_ids': set(), 'activity_ids': set(), 'category_names': set(),
+        'category_ids': set()
+    })
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changes(session, flush_context):
+    pending = _pending(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Professional):
+            pending['professional_ids'].add(obj.id)
+        elif isinstance(obj, ProfessionalActivity):
+            pending['professional_ids'].add(obj.professional_id)
+        elif isinstance(obj, User):
+            pending['user_ids'].add(obj.id)
+        elif isinstance(obj, Activity):
+            pending['activity_ids'].add(obj.id)
+        elif isinstance(obj, Category):
+            # Nome antigo e novo: o índice guarda as categorias pelo nome
+            history = inspect(obj).attrs.name.history
+            names = list(history.deleted or ()) + list(history.unchanged or ()) + list(history.added or ())
+            pending['category_names'].update(fold_text(name) for name in names if name)
+            pending['category_ids'].add(obj.id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('search_index_pending', None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_changes(session):
+    pending = session.info.pop('search_index_pending', None)
+    if not pending:
+        return
+    index = current_app.extensions.get('search_index')
+    if index is None or not index.ready:
+        return
+
+    # Mudanças no catálogo reindexam só os profissionais afetados: os que o índice
+    # associa à atividade/categoria (estado anterior) e os que o banco associa agora
+    professional_ids = set(pending['professional_ids'])
+    for activity_id in pending['activity_ids']:
+        professional_ids |= index.lookup('activity', activity_id)
+    for name in pending['category_names']:
+        professional_ids |= index.lookup('category', name)
+
+    # A sessão que fez o commit não pode mais emitir SQL aqui; usa uma sessão própria
+    with Session(db.engine) as fresh_session:
+        activity_ids = {i for i in pending['activity_ids'] if i is not None}
+        category_ids = {i for i in pending['category_ids'] if i is not None}
+        if activity_ids or category_ids:
+            professional_ids |= {
+                prof_id for (prof_id,) in fresh_session.query(ProfessionalActivity.professional_id)
+                .join(Activity, Activity.id == ProfessionalActivity.activity_id)
+                .filter(or_(Activity.id.in_(activity_ids), Activity.category_id.in_(category_ids)))
+            }
+        sync_professionals(index, fresh_session, professional_ids, pending['user_ids'])
+
+
+def init_search_index(app):
+    """Registra o índice na aplicação e o constrói na inicialização, se possível."""
+    if not app.config.get('SEARCH_INDEX_ENABLED', True):
+        return
+    index = app.extensions.setdefault('search_index', ProfessionalSearchIndex())
+
+    @app.cli.command('check-search-index')
+    def check_search_index_command():
+        """Compara o índice de busca em memória com o banco de dados."""
+        report = check_consistency(get_search_index())
+        for key, ids in report.items():
+            print(f'{key}: {ids}')
+
+    with app.app_context():
+        try:
+            with Session(db.engine) as session:
+                index.build(session)
+        except Exception as e:
+            # O índice será construído no primeiro uso
+            app.logger.warning(f'Índice de busca não construído na inicialização: {e}')
@@ -0,0 +1,310 @@
+"""
+Chaves assimétricas de assinatura dos access tokens (EdDSA ou RS256) com rotação.
+
+Todas as instâncias e todos os deploys precisam das mesmas chaves; elas nunca são
+criadas sozinhas em produção. Duas origens:
+
+- JWT_SIGNING_KEYS: objeto JSON {kid: PEM da chave privada} (variável de ambiente ou
+  segredo do provedor). `flask generate-signing-key` gera uma entrada; a rotação é
+  acrescentar a entrada nova e, depois que os tokens da antiga expirarem, removê-la.
+- JWT_KEYS_DIR: diretório compartilhado (disco persistente, volume montado), com um
+  arquivo PEM `<kid>.pem` por chave. `flask rotate-signing-key` cria a primeira chave e
+  as seguintes.
+
+Sem nenhuma chave a aplicação não sobe (SigningKeysMissing). Só com
+JWT_KEYS_AUTOGENERATE (desenvolvimento e testes) a chave inicial é criada no diretório,
+padrão instance/jwt_keys, sob um lock de arquivo para que workers que sobem juntos
+não criem uma cada.
+
+O `kid` começa pelo instante de criação, então a ordem dos nomes é a ordem
+cronológica. Os tokens levam o `kid` no cabeçalho e qualquer serviço pode validá-los
+com as chaves públicas de /api/auth/jwks.json, sem conhecer o SECRET_KEY.
+
+- Uma chave nova só passa a assinar depois de JWT_KEY_ACTIVATION_DELAY_SECONDS (por
+  padrão o mesmo tempo de cache do JWKS): validadores com o JWKS em cache já a conhecem
+  quando o primeiro token com ela aparece.
+- Chaves substituídas continuam no JWKS e validando até que os tokens assinados com elas
+  expirem; só então `flask rotate-signing-key` as remove.
+- As chaves são lidas e convertidas em objetos uma única vez; o diretório é verificado a
+  cada JWT_KEYS_RELOAD_SECONDS para enxergar rotações feitas por outro processo.
+  Verificar um token não relê nem reconverte PEM.
+"""
+import glob
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import click
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from flask import current_app
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_ALGORITHM = 'EdDSA'
+ALGORITHMS = ('EdDSA', 'RS256')
+DEFAULT_RELOAD_SECONDS = 30
+# Intervalo mínimo entre releituras provocadas por um kid desconhecido
+UNKNOWN_KID_RELOAD_SECONDS = 1
+DEFAULT_JWKS_MAX_AGE = 3600
+RSA_KEY_SIZE = 2048
+KID_TIME_FORMAT = '%Y%m%d%H%M%S'
+
+
+class SigningKeysMissing(RuntimeError):
+    """Nenhuma chave de assinatura provisionada."""
+
+    def __init__(self):
+        super().__init__(
+            'Nenhuma chave de assinatura de tokens: defina JWT_SIGNING_KEYS '
+            '(`flask generate-signing-key`) ou aponte JWT_KEYS_DIR para um diretório '
+            'compartilhado com chaves (`flask rotate-signing-key`)'
+        )
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    algorithm: str
+    created_at: datetime
+    private_key: object
+    public_key: object
+
+    def jwk(self):
+        to_jwk = OKPAlgorithm.to_jwk if self.algorithm == 'EdDSA' else RSAAlgorithm.to_jwk
+        jwk = json.loads(to_jwk(self.public_key))
+        jwk.update({'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'})
+        return jwk
+
+
+def generate_private_key(algorithm):
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == 'RS256':
+        return rsa.generate_private_key(public_exponent=65537, key_size=RSA_KEY_SIZE)
+    raise ValueError(f'Algoritmo de assinatura não suportado: {algorithm}')
+
+
+def new_key_pem(algorithm, now=None):
+    """(kid, PEM) de uma chave privada nova."""
+    now = now or datetime.utcnow()
+    kid = f'{now.strftime(KID_TIME_FORMAT)}-{secrets.token_hex(4)}'
+    pem = generate_private_key(algorithm).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    return kid, pem
+
+
+def _load_key(path):
+    with open(path, 'rb') as f:
+        return _parse_key(os.path.basename(path)[:-len('.pem')], f.read())
+
+
+def _parse_key(kid, pem):
+    private_key = serialization.load_pem_private_key(pem, password=None)
+    algorithm = 'EdDSA' if isinstance(private_key, ed25519.Ed25519PrivateKey) else 'RS256'
+    created_at = datetime.strptime(kid.split('-', 1)[0], KID_TIME_FORMAT)
+    return SigningKey(kid, algorithm, created_at, private_key, private_key.public_key())
+
+
+class KeySet:
+    """
+    Chaves de assinatura carregadas de `pems` ({kid: PEM}, fixas) ou de um diretório,
+    com o JWKS pré-serializado.
+    """
+
+    def __init__(self, directory=None, algorithm=DEFAULT_ALGORITHM, activation_delay=DEFAULT_JWKS_MAX_AGE,
+                 reload_seconds=DEFAULT_RELOAD_SECONDS, pems=None, autogenerate=False):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f'Algoritmo de assinatura não suportado: {algorithm}')
+        self.directory = directory
+        self.pems = pems
+        self.autogenerate = autogenerate
+        self.algorithm = algorithm
+        self.activation_delay = timedelta(seconds=activation_delay)
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._jwks = None
+        self._mtime = None
+        self._checked_at = None
+
+    def _set_keys(self, keys):
+        body = json.dumps({'keys': [key.jwk() for key in keys.values()]}, separators=(',', ':')).encode()
+        self._keys = keys
+        self._jwks = (body, hashlib.sha256(body).hexdigest()[:32])
+
+    def _reload(self):
+        keys = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.pem'))):
+            key = _load_key(path)
+            keys[key.kid] = key
+        self._set_keys(keys)
+
+    def _directory_mtime(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _create_initial_key(self):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # Workers que sobem juntos disputam o lock; só o primeiro encontra o diretório vazio
+        with open(os.path.join(self.directory, '.create.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if not glob.glob(os.path.join(self.directory, '*.pem')):
+                self._write_key(self.algorithm)
+
+    def refresh(self, force=False):
+        """
+        Recarrega as chaves se o diretório mudou (verificado no máximo a cada
+        reload_seconds). Levanta SigningKeysMissing se não houver nenhuma.
+        """
+        monotonic = time.monotonic()
+        if not force and self._checked_at is not None and monotonic - self._checked_at < self.reload_seconds:
+            return
+        with self._lock:
+            if self.pems is not None:
+                if not self._keys:
+                    self._set_keys({
+                        kid: _parse_key(kid, pem.encode() if isinstance(pem, str) else pem)
+                        for kid, pem in sorted(self.pems.items())
+                    })
+            else:
+                mtime = self._directory_mtime()
+                if mtime != self._mtime or not self._keys:
+                    if self.autogenerate and not glob.glob(os.path.join(self.directory, '*.pem')):
+                        self._create_initial_key()
+                        mtime = self._directory_mtime()
+                    self._reload()
+                    self._mtime = mtime
+            if not self._keys:
+                raise SigningKeysMissing()
+            self._checked_at = monotonic
+
+    def _write_key(self, algorithm, now=None):
+        kid, pem = new_key_pem(algorithm, now)
+        # Escrita atômica: outro processo nunca lê um PEM pela metade
+        path = os.path.join(self.directory, f'{kid}.pem')
+        temporary = f'{path}.tmp'
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(pem)
+        os.replace(temporary, path)
+        return kid
+
+    def keys(self):
+        self.refresh()
+        return sorted(self._keys.values(), key=lambda key: key.kid)
+
+    def active(self, now=None):
+        """Chave mais nova já publicada há pelo menos activation_delay (ou a mais antiga, se nenhuma)."""
+        now = now or datetime.utcnow()
+        keys = self.keys()
+        published = [key for key in keys if key.created_at + self.activation_delay <= now]
+        return published[-1] if published else keys[0]
+
+    def get(self, kid):
+        self.refresh()
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - (self._checked_at or 0) >= UNKNOWN_KID_RELOAD_SECONDS:
+            # Chave criada por outro processo depois da última leitura do diretório
+            self.refresh(force=True)
+            key = self._keys.get(kid)
+        return key
+
+    def jwks(self):
+        """(corpo JSON, ETag) do conjunto de chaves públicas."""
+        self.refresh()
+        return self._jwks
+
+    def rotate(self, max_token_age, algorithm=None, now=None):
+        """
+        Cria uma chave nova e remove as que já não validam nenhum token vivo: substituídas
+        (a sucessora já assina) há mais de `max_token_age`. Retorna (kid novo, kids removidos).
+        """
+        if self.pems is not None:
+            raise ValueError('Chaves vindas de JWT_SIGNING_KEYS: gere uma com `flask generate-signing-key`')
+        now = now or datetime.utcnow()
+        with self._lock:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            kid = self._write_key(algorithm or self.algorithm, now)
+        self.refresh(force=True)
+
+        keys = self.keys()
+        active = self.active(now)
+        removed = []
+        for key, successor in zip(keys, keys[1:]):
+            retired_at = successor.created_at + self.activation_delay
+            if key.kid != active.kid and retired_at + max_token_age <= now:
+                os.remove(os.path.join(self.directory, f'{key.kid}.pem'))
+                removed.append(key.kid)
+        if removed:
+            self.refresh(force=True)
+        return kid, removed
+
+
+def create_key_set(app):
+    config = app.config
+    pems = config.get('JWT_SIGNING_KEYS')
+    if isinstance(pems, str):
+        pems = json.loads(pems)
+    return KeySet(
+        config.get('JWT_KEYS_DIR') or os.path.join(app.instance_path, 'jwt_keys'),
+        config.get('JWT_ALGORITHM', DEFAULT_ALGORITHM),
+        config.get('JWT_KEY_ACTIVATION_DELAY_SECONDS', config.get('JWKS_MAX_AGE', DEFAULT_JWKS_MAX_AGE)),
+        config.get('JWT_KEYS_RELOAD_SECONDS', DEFAULT_RELOAD_SECONDS),
+        pems=pems or None,
+        autogenerate=config.get('JWT_KEYS_AUTOGENERATE', False)
+    )
+
+
+def get_key_set():
+    key_set = current_app.extensions.get('jwt_key_set')
+    if key_set is None:
+        key_set = current_app.extensions.setdefault('jwt_key_set', create_key_set(current_app))
+    return key_set
+
+
+def init_signing_keys(app):
+    """
+    Carrega as chaves de assinatura, falhando na inicialização se não houver nenhuma, e
+    registra `flask rotate-signing-key` e `flask generate-signing-key`. Nos comandos do
+    flask a verificação fica para o primeiro uso: é com eles que as chaves são criadas.
+    """
+    key_set = app.extensions.setdefault('jwt_key_set', create_key_set(app))
+    if os.environ.get('FLASK_RUN_FROM_CLI') != 'true':
+        key_set.refresh(force=True)
+
+    @app.cli.command('rotate-signing-key')
+    @click.option('--algorithm', type=click.Choice(ALGORITHMS), default=None, help='Algoritmo da chave nova.')
+    def rotate_signing_key_command(algorithm):
+        """Cria uma chave de assinatura nova em JWT_KEYS_DIR e remove as que já não validam tokens vivos."""
+        from src.utils.tokens import DEFAULT_ACCESS_TTL_SECONDS
+        max_token_age = timedelta(seconds=app.config.get('ACCESS_TOKEN_TTL_SECONDS', DEFAULT_ACCESS_TTL_SECONDS))
+        try:
+            kid, removed = key_set.rotate(max_token_age, algorithm)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        print(f'Nova chave: {kid}')
+        for old_kid in removed:
+            print(f'Removida: {old_kid}')
+
+    @app.cli.command('generate-signing-key')
+    @click.option('--algorithm', type=click.Choice(ALGORITHMS), default=DEFAULT_ALGORITHM, help='Algoritmo da chave.')
+    def generate_signing_key_command(algorithm):
+        """Imprime uma entrada {kid: PEM} para acrescentar a JWT_SIGNING_KEYS."""
+        kid, pem = new_key_pem(algorithm)
+        print(json.dumps({kid: pem.decode()}))
+
+    return key_set
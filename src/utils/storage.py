@@ -0,0 +1,390 @@
+"""
+Armazenamento dos arquivos enviados, com drivers plugáveis (UPLOAD_STORAGE).
+
+- 'local' (padrão): arquivos em UPLOAD_FOLDER, no disco da instância.
+- 's3': bucket S3 compatível (AWS, MinIO, Cloudflare R2...), configurado pelas
+  chaves S3_*; vale para várias instâncias e sobrevive a discos efêmeros como o do
+  Render. As requisições são assinadas com AWS Signature V4 por este módulo, sem SDK.
+  src/utils/s3_standin.py tem um servidor S3 mínimo em processo para testes e
+  desenvolvimento (`flask s3-standin`).
+
+Nenhum caminho passa o arquivo inteiro pela memória do worker: `put_file` envia a
+partir de um arquivo em disco (o spool do upload) em blocos, usando multipart upload
+acima de S3_MULTIPART_THRESHOLD; `iter_range` lê em blocos, opcionalmente só um
+intervalo de bytes; `send_stored_file` responde com suporte a Range (206/416).
+"""
+import errno
+import hashlib
+import hmac
+import http.client
+import mimetypes
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+import click
+from flask import Response, abort, current_app, request
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_S3_REGION = 'us-east-1'
+# O S3 exige partes de pelo menos 5 MiB (exceto a última)
+DEFAULT_MULTIPART_THRESHOLD = 16 * 1024 * 1024
+DEFAULT_MULTIPART_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_S3_TIMEOUT_SECONDS = 30
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+EMPTY_PAYLOAD_SHA256 = hashlib.sha256(b'').hexdigest()
+
+
+class StorageError(Exception):
+    pass
+
+
+def upload_folder(app=None):
+    app = app or current_app
+    return app.config.get('UPLOAD_FOLDER') or os.path.join(app.root_path, 'static', 'uploads')
+
+
+@dataclass(frozen=True)
+class ObjectInfo:
+    size: int
+    etag: str
+
+
+def _chunks(file, length, chunk_size):
+    while length is None or length > 0:
+        chunk = file.read(chunk_size if length is None else min(chunk_size, length))
+        if not chunk:
+            break
+        if length is not None:
+            length -= len(chunk)
+        yield chunk
+
+
+# --- Disco local ---
+
+class LocalStorage:
+    def __init__(self, root, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def local_path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f'Chave inválida: {key}')
+        return path
+
+    def stat(self, key):
+        try:
+            stat = os.stat(self.local_path(key))
+        except FileNotFoundError:
+            return None
+        return ObjectInfo(stat.st_size, f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def put_file(self, key, path):
+        """Grava o arquivo `path` (consumido) em `key`."""
+        target = self.local_path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(path, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Outro sistema de arquivos: copia ao lado do destino e troca de uma vez
+            descriptor, temporary = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(target))
+            os.close(descriptor)
+            shutil.copyfile(path, temporary)
+            os.replace(temporary, target)
+            os.remove(path)
+
+    def iter_range(self, key, start=0, end=None):
+        """Bytes de [start, end) em blocos de chunk_size."""
+        with open(self.local_path(key), 'rb') as f:
+            f.seek(start)
+            yield from _chunks(f, None if end is None else end - start, self.chunk_size)
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+
+# --- S3 compatível ---
+
+def _uri_encode(value, safe='-_.~'):
+    return quote(value, safe=safe)
+
+
+def canonical_query(query):
+    return '&'.join(f'{_uri_encode(name)}={_uri_encode(value)}' for name, value in sorted(query.items()))
+
+
+def signature_v4(secret_key, region, method, path, query, headers, signed_headers, payload_hash, amz_date):
+    """Assinatura AWS V4 ('s3') de uma requisição; `path` já codificado."""
+    canonical_headers = ''.join(f'{name}:{headers[name].strip()}\n' for name in signed_headers)
+    canonical_request = '\n'.join([
+        method, path, canonical_query(query), canonical_headers, ';'.join(signed_headers), payload_hash
+    ])
+    scope = f'{amz_date[:8]}/{region}/s3/aws4_request'
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+    ])
+    key = f'AWS4{secret_key}'.encode()
+    for part in (amz_date[:8], region, 's3', 'aws4_request'):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+class _FileSlice:
+    """Leitura de `length` bytes de um arquivo, como corpo de requisição do http.client."""
+
+    def __init__(self, file, length):
+        self._file = file
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+class S3Storage:
+    """Bucket S3 compatível, com endereçamento por caminho (endpoint/bucket/chave)."""
+
+    def __init__(self, endpoint_url, bucket, access_key, secret_key, region=DEFAULT_S3_REGION, prefix='',
+                 multipart_threshold=DEFAULT_MULTIPART_THRESHOLD, part_size=DEFAULT_MULTIPART_PART_SIZE,
+                 chunk_size=DEFAULT_CHUNK_SIZE, timeout=DEFAULT_S3_TIMEOUT_SECONDS):
+        url = urlsplit(endpoint_url)
+        self.scheme = url.scheme
+        self.host = url.netloc
+        self.base_path = url.path.rstrip('/')
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+
+    def local_path(self, key):
+        return None
+
+    def _path(self, key):
+        return _uri_encode(f'{self.base_path}/{self.bucket}/{self.prefix}{key}', safe='/-_.~')
+
+    def _request(self, method, key, query=None, headers=None, body=None):
+        """Envia a requisição assinada; devolve (conexão, resposta) com o corpo ainda por ler."""
+        query = query or {}
+        amz_date = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        payload_hash = UNSIGNED_PAYLOAD if body is not None else EMPTY_PAYLOAD_SHA256
+        signed = {'host': self.host, 'x-amz-content-sha256': payload_hash, 'x-amz-date': amz_date}
+        path = self._path(key)
+        signature = signature_v4(self.secret_key, self.region, method, path, query, signed, sorted(signed),
+                                 payload_hash, amz_date)
+        headers = {
+            **(headers or {}),
+            'x-amz-content-sha256': payload_hash,
+            'x-amz-date': amz_date,
+            'Authorization': (
+                f'AWS4-HMAC-SHA256 Credential={self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request, '
+                f'SignedHeaders={";".join(sorted(signed))}, Signature={signature}'
+            ),
+        }
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(self.host, timeout=self.timeout)
+        try:
+            url = path + (f'?{canonical_query(query)}' if query else '')
+            connection.request(method, url, body=body, headers=headers)
+            return connection, connection.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise StorageError(f'{method} {key}: {e}') from e
+
+    def _call(self, method, key, query=None, headers=None, body=None, allow_missing=False):
+        connection, response = self._request(method, key, query, headers, body)
+        try:
+            data = response.read()
+            if allow_missing and response.status == 404:
+                return None, None
+            if response.status >= 300:
+                raise StorageError(f'{method} {key}: HTTP {response.status} {data[:200]!r}')
+            return response, data
+        finally:
+            connection.close()
+
+    def stat(self, key):
+        response, _ = self._call('HEAD', key, allow_missing=True)
+        if response is None:
+            return None
+        return ObjectInfo(int(response.getheader('Content-Length', 0)), response.getheader('ETag', '').strip('"'))
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def put_file(self, key, path):
+        """Envia o arquivo `path` (consumido) para `key`; multipart acima do limite."""
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if size <= self.multipart_threshold:
+                self._call('PUT', key, headers={'Content-Length': str(size)}, body=_FileSlice(f, size))
+            else:
+                self._put_multipart(key, f, size)
+        os.remove(path)
+
+    def _put_multipart(self, key, f, size):
+        _, data = self._call('POST', key, query={'uploads': ''})
+        upload_id = next(element.text for element in ElementTree.fromstring(data).iter()
+                         if element.tag.endswith('UploadId'))
+        try:
+            parts = []
+            for number, offset in enumerate(range(0, size, self.part_size), start=1):
+                length = min(self.part_size, size - offset)
+                f.seek(offset)
+                response, _ = self._call(
+                    'PUT', key, query={'partNumber': str(number), 'uploadId': upload_id},
+                    headers={'Content-Length': str(length)}, body=_FileSlice(f, length)
+                )
+                parts.append((number, response.getheader('ETag')))
+            body = '<CompleteMultipartUpload>' + ''.join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>' for number, etag in parts
+            ) + '</CompleteMultipartUpload>'
+            self._call('POST', key, query={'uploadId': upload_id}, body=body.encode())
+        except Exception:
+            # Partes abandonadas ocupam espaço no bucket até o abort
+            try:
+                self._call('DELETE', key, query={'uploadId': upload_id})
+            except StorageError:
+                pass
+            raise
+
+    def iter_range(self, key, start=0, end=None):
+        """Bytes de [start, end) em blocos, lidos da resposta à medida que são consumidos."""
+        headers = {}
+        if start or end is not None:
+            headers['Range'] = f"bytes={start}-{'' if end is None else end - 1}"
+        connection, response = self._request('GET', key, headers=headers)
+        try:
+            if response.status >= 300:
+                raise StorageError(f'GET {key}: HTTP {response.status}')
+            yield from _chunks(response, None, self.chunk_size)
+        finally:
+            connection.close()
+
+    def delete(self, key):
+        self._call('DELETE', key, allow_missing=True)
+
+    def presigned_url(self, key, expires_in):
+        """URL de GET assinada na query string, válida por `expires_in` segundos."""
+        amz_date = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        query = {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f'{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request',
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(int(expires_in)),
+            'X-Amz-SignedHeaders': 'host',
+        }
+        path = self._path(key)
+        query['X-Amz-Signature'] = signature_v4(self.secret_key, self.region, 'GET', path, query,
+                                                {'host': self.host}, ['host'], UNSIGNED_PAYLOAD, amz_date)
+        return f'{self.scheme}://{self.host}{path}?{canonical_query(query)}'
+
+
+def download(storage, key, path):
+    """Copia `key` para o arquivo local `path`, em blocos."""
+    with open(path, 'wb') as f:
+        for chunk in storage.iter_range(key):
+            f.write(chunk)
+
+
+def create_storage(app):
+    config = app.config
+    driver = config.get('UPLOAD_STORAGE', 'local')
+    chunk_size = config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    if driver == 'local':
+        return LocalStorage(upload_folder(app), chunk_size)
+    if driver == 's3':
+        return S3Storage(
+            config['S3_ENDPOINT_URL'], config['S3_BUCKET'], config['S3_ACCESS_KEY_ID'], config['S3_SECRET_ACCESS_KEY'],
+            region=config.get('S3_REGION', DEFAULT_S3_REGION),
+            prefix=config.get('S3_PREFIX', ''),
+            multipart_threshold=config.get('S3_MULTIPART_THRESHOLD', DEFAULT_MULTIPART_THRESHOLD),
+            part_size=config.get('S3_MULTIPART_PART_SIZE', DEFAULT_MULTIPART_PART_SIZE),
+            chunk_size=chunk_size,
+        )
+    raise ValueError(f'UPLOAD_STORAGE inválido: {driver}')
+
+
+def get_storage():
+    storage = current_app.extensions.get('upload_storage')
+    if storage is None:
+        storage = current_app.extensions.setdefault('upload_storage', create_storage(current_app))
+    return storage
+
+
+def send_stored_file(storage, key, max_age=0):
+    """Resposta em streaming de `key`, com ETag e requisições Range (206/416)."""
+    try:
+        info = storage.stat(key)
+    except ValueError:
+        info = None
+    if info is None:
+        abort(404)
+    etag = info.etag or f'{info.size:x}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    start, end, status = 0, info.size, 200
+    if request.range:
+        byte_range = request.range.range_for_length(info.size)
+        if byte_range is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{info.size}'
+            return response
+        start, end = byte_range
+        status = 206
+
+    mimetype = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+    response = Response(storage.iter_range(key, start, end), status=status, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = end - start
+    response.accept_ranges = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{end - 1}/{info.size}'
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+def init_storage(app):
+    """Cria o driver de UPLOAD_STORAGE e registra `flask s3-standin`."""
+    from src.utils.s3_standin import S3StandIn
+
+    @app.cli.command('s3-standin')
+    @click.option('--host', default='127.0.0.1', help='Endereço de escuta.')
+    @click.option('--port', type=int, default=9000, help='Porta de escuta.')
+    @click.option('--directory', default=None, help='Pasta dos buckets (padrão: instance/s3).')
+    def s3_standin_command(host, port, directory):
+        """Serve um S3 mínimo local, com as credenciais S3_* da configuração."""
+        standin = S3StandIn(
+            directory or os.path.join(app.instance_path, 's3'),
+            app.config.get('S3_ACCESS_KEY_ID', 'local'), app.config.get('S3_SECRET_ACCESS_KEY', 'local'),
+            app.config.get('S3_REGION', DEFAULT_S3_REGION)
+        )
+        print(f'S3 local em http://{host}:{port}')
+        standin.serve(host, port)
+
+    return app.extensions.setdefault('upload_storage', create_storage(app))
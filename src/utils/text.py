@@ -0,0 +1,15 @@
+import unicodedata
+
+def fold_text(value):
+    """
+    Normaliza um texto para comparação: remove acentos e converte para minúsculas.
+    Ex.: 'João Conceição' -> 'joao conceicao'
+    """
+    if value is None:
+        return None
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+def escape_like(value, escape_char='\\'):
+    """Escapa os curingas do LIKE para que o termo seja tratado literalmente."""
+    return value.replace(escape_char, escape_char * 2).replace('%', escape_char + '%').replace('_', escape_char + '_')
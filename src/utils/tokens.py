@@ -0,0 +1,326 @@
+"""
+Emissão de access/refresh tokens e revogação.
+
+- Access token: JWT curto (ACCESS_TOKEN_TTL_SECONDS, padrão 15 minutos) com `jti` e `iat`,
+  assinado com a chave ativa de src/utils/signing_keys.py.
+- Refresh token: valor opaco guardado só como hash, válido por REFRESH_TOKEN_TTL_DAYS.
+  Cada uso em /api/auth/refresh o troca por um novo da mesma família; reapresentar um
+  token já trocado revoga a família inteira (sinal de token vazado).
+- Revogação: as linhas vigentes de token_revocations ficam num filtro de Bloom em
+  memória. A verificação de cada requisição consulta só o filtro; o banco é lido quando
+  o filtro responde "talvez" (token de fato revogado ou falso positivo, cujo resultado
+  fica em cache) e, uma vez a cada TOKEN_REVOCATION_SYNC_SECONDS, para trazer as
+  revogações feitas por outros workers. Uma revogação vale pelo maior tempo de vida
+  entre os tokens aceitos (os HS256 antigos, sem `iat`, duram 24 horas). As linhas
+  vencidas são apagadas pelo agendador de src/utils/expiration.py ou por
+  `flask purge-token-revocations`, nunca por uma requisição.
+"""
+import hashlib
+import math
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from flask import current_app
+from sqlalchemy import delete, select, update
+
+from src.models.user import db
+from src.models.auth_token import RefreshToken, TokenRevocation
+from src.utils.signing_keys import get_key_set
+
+DEFAULT_ACCESS_TTL_SECONDS = 900
+# Tokens HS256 emitidos antes dos access tokens curtos (sem `jti` nem `iat`)
+LEGACY_TOKEN_TTL_SECONDS = 24 * 3600
+DEFAULT_REFRESH_TTL_DAYS = 30
+DEFAULT_SYNC_SECONDS = 5
+# Revogações relidas a cada sincronização: cobre transações que commitaram fora de ordem
+SYNC_OVERLAP = timedelta(seconds=60)
+# Reconstrução do filtro sem as revogações já vencidas
+DEFAULT_REBUILD_SECONDS = 3600
+DEFAULT_FILTER_CAPACITY = 100000
+DEFAULT_FILTER_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """Filtro de Bloom com `capacity` itens e taxa de falso positivo `error_rate`."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Dupla hash (Kirsch-Mitzenmacher): k posições a partir de um único digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        new = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                self._bits[position >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def _timestamp(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RevocationList:
+    """Filtro de Bloom das revogações vigentes, sincronizado periodicamente com o banco."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _config(self, key, default):
+        return self.app.config.get(key, default)
+
+    def _new_filter(self):
+        return BloomFilter(
+            self._config('TOKEN_REVOCATION_FILTER_CAPACITY', DEFAULT_FILTER_CAPACITY),
+            self._config('TOKEN_REVOCATION_FILTER_ERROR_RATE', DEFAULT_FILTER_ERROR_RATE)
+        )
+
+    def _reset(self):
+        self.filter = self._new_filter()
+        # 'kind:value' -> instante de corte (timestamp) ou None para falso positivo
+        self._confirmed = {}
+        self._synced_until = None
+        self._synced_at = None
+        self._rebuilt_at = None
+
+    def reset(self):
+        """Descarta o estado em memória; a próxima verificação recarrega tudo do banco."""
+        with self._lock:
+            self._reset()
+
+    def added(self, kind, value):
+        """Registra uma revogação feita neste processo, sem esperar a próxima sincronização."""
+        key = f'{kind}:{value}'
+        with self._lock:
+            self.filter.add(key)
+            self._confirmed.pop(key, None)
+
+    def sync(self, force=False):
+        monotonic = time.monotonic()
+        interval = self._config('TOKEN_REVOCATION_SYNC_SECONDS', DEFAULT_SYNC_SECONDS)
+        if not force and self._synced_at is not None and monotonic - self._synced_at < interval:
+            return
+        # Se outra thread já está sincronizando, segue com o filtro atual
+        if not self._lock.acquire(blocking=force):
+            return
+        try:
+            now = datetime.utcnow()
+            rebuild = (
+                self._rebuilt_at is None
+                or monotonic - self._rebuilt_at >= self._config('TOKEN_REVOCATION_REBUILD_SECONDS', DEFAULT_REBUILD_SECONDS)
+                or self.filter.count >= self.filter.capacity
+            )
+            query = select(TokenRevocation.kind, TokenRevocation.value).where(TokenRevocation.expires_at > now)
+            if rebuild:
+                # Montado à parte e trocado de uma vez: nenhuma verificação vê um filtro vazio
+                target = self._new_filter()
+            else:
+                query = query.where(TokenRevocation.created_at >= self._synced_until - SYNC_OVERLAP)
+                target = self.filter
+            with db.engine.connect() as connection:
+                keys = [f'{kind}:{value}' for kind, value in connection.execute(query)]
+            for key in keys:
+                target.add(key)
+            if rebuild:
+                self.filter = target
+                self._confirmed = {}
+                self._rebuilt_at = monotonic
+            else:
+                for key in keys:
+                    self._confirmed.pop(key, None)
+            self._synced_until = now
+            self._synced_at = monotonic
+        finally:
+            self._lock.release()
+
+    def _cutoff(self, kind, value):
+        """Instante de corte da revogação (só lido do banco quando o filtro acusa)."""
+        key = f'{kind}:{value}'
+        if key in self._confirmed:
+            return self._confirmed[key]
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(TokenRevocation.not_before, TokenRevocation.expires_at)
+                .where(TokenRevocation.kind == kind, TokenRevocation.value == value,
+                       TokenRevocation.expires_at > datetime.utcnow())
+            ).all()
+        cutoff = None
+        if rows:
+            # Para um jti qualquer token com ele é revogado; para um usuário, os emitidos antes do corte
+            cutoff = math.inf if kind == 'jti' else max(_timestamp(row.not_before) for row in rows)
+        with self._lock:
+            self._confirmed[key] = cutoff
+        return cutoff
+
+    def is_revoked(self, claims):
+        self.sync()
+        checks = [('user', str(claims['user_id']))]
+        if claims.get('jti'):
+            checks.append(('jti', claims['jti']))
+        for kind, value in checks:
+            if f'{kind}:{value}' not in self.filter:
+                continue
+            cutoff = self._cutoff(kind, value)
+            if cutoff is not None and claims.get('iat', 0) < cutoff:
+                return True
+        return False
+
+
+def get_revocation_list():
+    revocations = current_app.extensions.get('token_revocations')
+    if revocations is None:
+        revocations = current_app.extensions.setdefault('token_revocations', RevocationList(current_app._get_current_object()))
+    return revocations
+
+
+def access_token_ttl():
+    return current_app.config.get('ACCESS_TOKEN_TTL_SECONDS', DEFAULT_ACCESS_TTL_SECONDS)
+
+
+def accepts_legacy_tokens():
+    return current_app.config.get('JWT_ACCEPT_HS256', False)
+
+
+def longest_token_lifetime():
+    """Maior tempo de vida, em segundos, de um access token que ainda pode ser aceito."""
+    if accepts_legacy_tokens():
+        return max(access_token_ttl(), LEGACY_TOKEN_TTL_SECONDS)
+    return access_token_ttl()
+
+
+def issue_access_token(user):
+    now = time.time()
+    payload = {
+        'user_id': user.id,
+        'user_type': user.user_type,
+        'jti': uuid.uuid4().hex,
+        # Com fração de segundo: um token emitido logo após revogar o usuário continua válido
+        'iat': now,
+        'exp': int(now + access_token_ttl()),
+    }
+    key = get_key_set().active()
+    return jwt.encode(payload, key.private_key, algorithm=key.algorithm, headers={'kid': key.kid})
+
+
+def _hash_refresh_token(raw):
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def issue_refresh_token(session, user_id, family_id=None):
+    raw = secrets.token_urlsafe(32)
+    session.add(RefreshToken(
+        user_id=user_id,
+        token_hash=_hash_refresh_token(raw),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.utcnow() + timedelta(
+            days=current_app.config.get('REFRESH_TOKEN_TTL_DAYS', DEFAULT_REFRESH_TTL_DAYS)
+        )
+    ))
+    return raw
+
+
+def rotate_refresh_token(session, raw):
+    """
+    Troca um refresh token válido por um novo da mesma família. Retorna
+    (user_id, novo token) ou None. O chamador faz o commit também no caso None:
+    a reutilização de um token já trocado revoga a família.
+    """
+    token = session.execute(
+        select(RefreshToken).where(RefreshToken.token_hash == _hash_refresh_token(raw))
+    ).scalar_one_or_none()
+    now = datetime.utcnow()
+    if token is None or token.revoked_at is not None or token.expires_at <= now:
+        return None
+    # UPDATE condicional: de dois refresh simultâneos com o mesmo token, só um vence
+    claimed = session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == token.id, RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+    ).rowcount
+    if not claimed:
+        revoke_refresh_family(session, token.family_id)
+        return None
+    return token.user_id, issue_refresh_token(session, token.user_id, token.family_id)
+
+
+def revoke_refresh_family(session, family_id):
+    session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+
+def revoke_refresh_token(session, raw):
+    """Revoga a família do refresh token informado (logout). Retorna False se ele não existir."""
+    family_id = session.execute(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == _hash_refresh_token(raw))
+    ).scalar()
+    if family_id is None:
+        return False
+    revoke_refresh_family(session, family_id)
+    return True
+
+
+def revoke_access_token(session, claims):
+    session.add(TokenRevocation(
+        kind='jti', value=claims['jti'], expires_at=datetime.utcfromtimestamp(claims['exp'])
+    ))
+    get_revocation_list().added('jti', claims['jti'])
+
+
+def revoke_user_tokens(session, user_id):
+    """Revoga todos os access tokens já emitidos para o usuário e os seus refresh tokens."""
+    now = datetime.utcnow()
+    session.add(TokenRevocation(
+        kind='user', value=str(user_id), not_before=now,
+        # Depois disso todo token emitido antes do corte já expirou sozinho; tokens sem
+        # `iat` contam como emitidos antes de qualquer corte
+        expires_at=now + timedelta(seconds=longest_token_lifetime())
+    ))
+    session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    get_revocation_list().added('user', str(user_id))
+
+
+def purge_expired_revocations(engine, now=None):
+    """Apaga as revogações vencidas; retorna quantas linhas saíram."""
+    with engine.begin() as connection:
+        return connection.execute(
+            delete(TokenRevocation).where(TokenRevocation.expires_at <= (now or datetime.utcnow()))
+        ).rowcount
+
+
+def init_tokens(app):
+    """Cria a lista de revogações do processo e registra `flask purge-token-revocations`."""
+
+    @app.cli.command('purge-token-revocations')
+    def purge_token_revocations_command():
+        """Apaga da tabela token_revocations as revogações já vencidas."""
+        print(f'{purge_expired_revocations(db.engine)} revogações vencidas removidas')
+
+    return app.extensions.setdefault('token_revocations', RevocationList(app))
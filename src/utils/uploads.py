@@ -0,0 +1,248 @@
+"""
+Recebimento e armazenamento dos arquivos enviados (diplomas).
+
+- Streaming: `UploadRequest` faz o parser multipart gravar cada arquivo direto num
+  `UploadSpool` em UPLOAD_SPOOL_FOLDER (padrão <UPLOAD_FOLDER>/.incoming), no disco
+  local, que calcula o SHA-256 e conta os bytes à
+  medida que os pedaços chegam. A memória por upload fica limitada ao buffer do parser
+  e ao UPLOAD_CHUNK_SIZE, não ao tamanho do arquivo; passar de UPLOAD_MAX_SIZE
+  interrompe a leitura com 413 e apaga o parcial.
+- Endereçamento por conteúdo: o arquivo vai para '<aa>/<sha256>.<extensão>' no
+  armazenamento de src/utils/storage.py (no disco local, com um rename, sem nova
+  cópia); diplomas idênticos ficam gravados uma única vez.
+- Contagem de referências: stored_files.ref_count acompanha Professional.diploma_file
+  por eventos da sessão, na mesma transação da alteração. Arquivos sem referência
+  (e uploads interrompidos) são removidos por `flask uploads-gc` depois de
+  UPLOAD_GC_GRACE_SECONDS, o que cobre o intervalo entre gravar o arquivo e commitar
+  o cadastro.
+"""
+import glob
+import hashlib
+import os
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import Request, current_app
+from sqlalchemy import delete, event, func, inspect, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+from src.models.user import db
+from src.models.professional import Professional
+from src.models.stored_file import StoredFile
+from src.utils.storage import get_storage, upload_folder
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_GC_GRACE_SECONDS = 24 * 3600
+INCOMING_DIRECTORY = '.incoming'
+# Arquivos derivados guardados ao lado do original como '<chave>.<tipo>.jpg'
+DERIVATIVE_KINDS = ('preview', 'thumb')
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    description = 'Arquivo maior que o tamanho máximo permitido.'
+
+
+def derivative_key(key, kind):
+    return f'{key}.{kind}.jpg'
+
+
+def spool_folder(app=None):
+    app = app or current_app
+    folder = app.config.get('UPLOAD_SPOOL_FOLDER') or os.path.join(upload_folder(app), INCOMING_DIRECTORY)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+class UploadSpool:
+    """Arquivo temporário que calcula o SHA-256 e limita o tamanho enquanto é gravado."""
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+        descriptor, self.path = tempfile.mkstemp(suffix='.part', dir=directory)
+        # Gravado em blocos de chunk_size, qualquer que seja o tamanho de cada write()
+        self._file = os.fdopen(descriptor, 'w+b', buffering=chunk_size)
+        self._sha256 = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            self.close()
+            raise UploadTooLarge()
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def persist(self, storage, key):
+        """Grava o arquivo em `key`; se o conteúdo já estiver lá, descarta a cópia."""
+        self._file.flush()
+        if storage.exists(key):
+            os.remove(self.path)
+        else:
+            storage.put_file(key, self.path)
+        self.path = None
+
+    def close(self):
+        self._file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __getattr__(self, name):
+        # read/seek/tell etc. para o FileStorage do Werkzeug
+        return getattr(self._file, name)
+
+
+def _new_spool():
+    config = current_app.config
+    return UploadSpool(
+        spool_folder(),
+        config.get('UPLOAD_MAX_SIZE', DEFAULT_MAX_SIZE),
+        config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    )
+
+
+class UploadRequest(Request):
+    """Request cujos arquivos multipart são gravados direto num UploadSpool."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_size = current_app.config.get('UPLOAD_MAX_SIZE', DEFAULT_MAX_SIZE)
+        if max_size and content_length and content_length > max_size:
+            raise UploadTooLarge()
+        return _new_spool()
+
+
+def _spool_upload(upload):
+    # Upload recebido por outra classe de Request: copia em blocos para um spool
+    chunk_size = current_app.config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    spool = _new_spool()
+    upload.stream.seek(0)
+    while True:
+        chunk = upload.stream.read(chunk_size)
+        if not chunk:
+            break
+        spool.write(chunk)
+    return spool
+
+
+def _extension(filename):
+    filename = secure_filename(filename or '')
+    return filename.rsplit('.', 1)[1].lower()[:10] if '.' in filename else 'bin'
+
+
+def _register(connection, key, sha256, size):
+    now = datetime.utcnow()
+    row = {'key': key, 'sha256': sha256, 'size': size, 'ref_count': 0, 'created_at': now, 'updated_at': now}
+    dialect_name = connection.dialect.name
+    if dialect_name in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(StoredFile)
+        connection.execute(stmt.on_conflict_do_update(index_elements=['key'], set_={'updated_at': now}), row)
+    elif connection.execute(update(StoredFile).where(StoredFile.key == key).values(updated_at=now)).rowcount == 0:
+        connection.execute(insert(StoredFile), row)
+
+
+def store_upload(upload):
+    """
+    Grava o arquivo enviado (FileStorage) pelo conteúdo e retorna a chave a guardar no
+    registro. A referência é contada quando o registro que a usa for commitado.
+    """
+    spool = upload.stream if isinstance(upload.stream, UploadSpool) else _spool_upload(upload)
+    sha256 = spool.hexdigest()
+    key = f'{sha256[:2]}/{sha256}.{_extension(upload.filename)}'
+    # Linha primeiro, em transação própria: a coleta nunca apaga um arquivo recém-enviado,
+    # e um cadastro desfeito depois disso deixa só um arquivo sem referência para a coleta
+    with db.engine.begin() as connection:
+        _register(connection, key, sha256, spool.size)
+    spool.persist(get_storage(), key)
+    return key
+
+
+def collect_garbage(engine, storage, spool_directory, grace, now=None):
+    """Remove arquivos sem referência e uploads interrompidos mais velhos que `grace`."""
+    now = now or datetime.utcnow()
+    cutoff = now - grace
+    removed = []
+    with engine.begin() as connection:
+        candidates = connection.execute(
+            select(StoredFile.key).where(StoredFile.ref_count <= 0, StoredFile.updated_at < cutoff)
+        ).scalars().all()
+        # Confere com a tabela de origem: alterações em massa não passam pelos eventos
+        referenced = dict(connection.execute(
+            select(Professional.diploma_file, func.count())
+            .where(Professional.diploma_file.in_(candidates))
+            .group_by(Professional.diploma_file)
+        ).all()) if candidates else {}
+        for key in candidates:
+            if key in referenced:
+                connection.execute(update(StoredFile).where(StoredFile.key == key).values(ref_count=referenced[key]))
+                continue
+            # Condicional: um novo envio do mesmo conteúdo atualiza updated_at e salva o arquivo
+            deleted = connection.execute(delete(StoredFile).where(
+                StoredFile.key == key, StoredFile.ref_count <= 0, StoredFile.updated_at < cutoff
+            )).rowcount
+            if deleted:
+                # Ainda dentro da transação: um envio concorrente espera o commit para gravar
+                for stored_key in (key, *(derivative_key(key, kind) for kind in DERIVATIVE_KINDS)):
+                    storage.delete(stored_key)
+                removed.append(key)
+
+    partials = 0
+    cutoff_timestamp = time.time() - grace.total_seconds()
+    for path in glob.glob(os.path.join(spool_directory, '*.part')):
+        try:
+            if os.path.getmtime(path) < cutoff_timestamp:
+                os.remove(path)
+                partials += 1
+        except FileNotFoundError:
+            pass
+    return {'files_removed': len(removed), 'partials_removed': partials}
+
+
+# --- Contagem de referências via eventos da sessão ---
+
+@event.listens_for(db.session, 'after_flush')
+def _count_references(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Professional) and obj.diploma_file:
+            deltas[obj.diploma_file] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Professional) and obj.diploma_file:
+            deltas[obj.diploma_file] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Professional):
+            history = inspect(obj).attrs.diploma_file.history
+            for key in history.added or ():
+                deltas[key] += 1
+            for key in history.deleted or ():
+                deltas[key] -= 1
+    connection = None
+    for key, delta in sorted((key, delta) for key, delta in deltas.items() if key and delta):
+        connection = connection or session.connection()
+        # Diplomas antigos (anteriores ao armazenamento por conteúdo) não têm linha
+        connection.execute(
+            update(StoredFile).where(StoredFile.key == key).values(ref_count=StoredFile.ref_count + delta)
+        )
+
+
+def init_uploads(app):
+    """Grava os uploads em streaming e registra o comando `flask uploads-gc`."""
+    app.request_class = UploadRequest
+
+    @app.cli.command('uploads-gc')
+    def uploads_gc_command():
+        """Remove arquivos enviados sem referência e uploads interrompidos."""
+        grace = timedelta(seconds=app.config.get('UPLOAD_GC_GRACE_SECONDS', DEFAULT_GC_GRACE_SECONDS))
+        metrics = collect_garbage(db.engine, get_storage(), spool_folder(app), grace)
+        print(f"Arquivos removidos: {metrics['files_removed']}, uploads interrompidos: {metrics['partials_removed']}")
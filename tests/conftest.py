@@ -1,26 +1,87 @@
 # tests/conftest.py
 
+import io
+import os
+import shutil
+import tempfile
+
 import pytest
-from src.main import create_app # Import the application factory
-from src.models.user import db # Import the SQLAlchemy db instance
+
+# Banco e arquivos temporários; precisa vir antes do import da aplicação, que lê
+# DATABASE_URL e cria as tabelas ao ser importada
+_TEST_ROOT = tempfile.mkdtemp(prefix='saude-connect-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TEST_ROOT, 'test.db')}"
+# A aplicação não sobe sem chaves de assinatura: os testes criam a primeira num diretório temporário
+os.environ['JWT_KEYS_DIR'] = os.path.join(_TEST_ROOT, 'jwt_keys')
+os.environ['JWT_KEYS_AUTOGENERATE'] = 'true'
+
+from src.main import app as flask_app  # noqa: E402
+from src.models.user import db  # noqa: E402
+from src.utils.storage import LocalStorage, create_storage  # noqa: E402
+
+# Caches em memória criados sob demanda; recriados a cada teste, já que o banco também é
+PER_TEST_EXTENSIONS = ('auth_token_cache', 'principal_cache', 'catalog_cache', 'token_revocations')
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(
+        TESTING=True,
+        SECRET_KEY='test_secret_key_for_conftest',  # Consistent test secret key
+        TEST_USER_PASSWORD='senha-de-teste',
+        RATE_LIMIT_ENABLED=False,  # Fixtures register the same users over and over; rate-limit tests enable it
+        JWT_ACCEPT_HS256=True,  # Os testes montam tokens HS256 diretamente; test_auth cobre o desligado
+        UPLOAD_FOLDER=os.path.join(_TEST_ROOT, 'uploads'),
+        ASSETS_FOLDER=os.path.join(_TEST_ROOT, 'assets'),
+    )
+    flask_app.extensions['upload_storage'] = create_storage(flask_app)
+    # Sem build: os estáticos saem de src/static, como em desenvolvimento
+    flask_app.extensions.pop('static_assets', None)
+    yield flask_app
+    shutil.rmtree(_TEST_ROOT, ignore_errors=True)
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context() as ctx:
+        yield ctx
+
 
 @pytest.fixture
-def client():
-    # Create an app instance using the factory
-    # We can pass a specific test config object/name if create_app supports it.
-    # For now, we'll configure it after creation.
-    app = create_app() 
-
-    # Apply test-specific configurations
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['SECRET_KEY'] = 'test_secret_key_for_conftest' # Consistent test secret key
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['WTF_CSRF_ENABLED'] = False # Disable CSRF for tests if Flask-WTF is used
+def client(app, app_context):
+    # Cada teste começa com as tabelas vazias
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    for name in PER_TEST_EXTENSIONS:
+        app.extensions.pop(name, None)
+    index = app.extensions.get('search_index')
+    if index is not None:
+        index.ready = False
 
     with app.test_client() as client:
-        with app.app_context():
-            db.create_all() # Create database tables for tests
         yield client
-        with app.app_context():
-            db.drop_all() # Drop database tables after tests
+    db.session.remove()
+
+
+# Uploads num diretório próprio do teste (uploads, pré-visualizações e entrega)
+@pytest.fixture
+def uploads(app, app_context, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.extensions, 'upload_storage', LocalStorage(str(tmp_path)))
+    yield tmp_path
+    app.config.pop('UPLOAD_MAX_SIZE', None)
+
+
+@pytest.fixture
+def register_professional():
+    """Cadastra um profissional pela rota, com `content` como arquivo do diploma."""
+    def register(client, email, content, filename='diploma.pdf'):
+        return client.post('/api/auth/register/professional', data={
+            'email': email,
+            'password': 'segredo',
+            'name': 'Profissional Upload',
+            'document': '123',
+            'diploma': (io.BytesIO(content), filename),
+        }, content_type='multipart/form-data')
+    return register
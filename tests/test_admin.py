@@ -1,33 +1,34 @@
 import pytest
 from flask import current_app
+from werkzeug.security import generate_password_hash
 from datetime import datetime
 from src.models.user import User, db
 from src.models.professional import Professional, Activity
 from src.models.category import Category
 from src.models.professional_activity import ProfessionalActivity
 
-@pytest.fixture(scope='module')
-def test_data_admin(app_context):
+@pytest.fixture
+def test_data_admin(client, app_context):
     """Creates initial data for admin tests."""
     with app_context:
         admin_user = User.query.filter_by(email='admin_adm@test.com').first()
         if not admin_user:
-            admin_user = User(email='admin_adm@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Admin User Admin', user_type='admin', approval_status='approved')
+            admin_user = User(email='admin_adm@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Admin User Admin', user_type='admin')
             db.session.add(admin_user)
 
         pending_prof_user = User.query.filter_by(email='pending_prof_adm@test.com').first()
         if not pending_prof_user:
-            pending_prof_user = User(email='pending_prof_adm@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Pending Prof Admin', user_type='professional', approval_status='pending')
+            pending_prof_user = User(email='pending_prof_adm@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Pending Prof Admin', user_type='professional')
             db.session.add(pending_prof_user)
         
         approved_prof_user = User.query.filter_by(email='approved_prof_adm@test.com').first()
         if not approved_prof_user:
-            approved_prof_user = User(email='approved_prof_adm@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Approved Prof Admin', user_type='professional', approval_status='approved')
+            approved_prof_user = User(email='approved_prof_adm@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Approved Prof Admin', user_type='professional')
             db.session.add(approved_prof_user)
 
         patient_user_adm = User.query.filter_by(email='patient_adm@test.com').first()
         if not patient_user_adm:
-            patient_user_adm = User(email='patient_adm@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Patient User Admin', user_type='patient', approval_status='approved')
+            patient_user_adm = User(email='patient_adm@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Patient User Admin', user_type='patient')
             db.session.add(patient_user_adm)
 
         db.session.flush() # Ensure IDs are available
@@ -70,7 +71,7 @@ def test_data_admin(app_context):
             "category1_id": category1.id
         }
 
-@pytest.fixture(scope='module')
+@pytest.fixture
 def auth_headers_admin(client, test_data_admin): # Depends on test_data_admin
     admin_login_res = client.post('/api/auth/login', json={'email': 'admin_adm@test.com', 'password': current_app.config['TEST_USER_PASSWORD']})
     admin_token = admin_login_res.json['token']
@@ -93,13 +94,10 @@ def test_admin_lists_pending_professionals(client, auth_headers_admin, test_data
 
 def test_admin_approves_pending_professional(client, auth_headers_admin, test_data_admin):
     prof_id = test_data_admin['pending_prof_id']
-    user_id = test_data_admin['pending_prof_user_id']
 
     # Ensure it's pending before test
     prof_before = Professional.query.get(prof_id)
     assert prof_before.approval_status == 'pending'
-    user_before = User.query.get(user_id)
-    assert user_before.approval_status == 'pending'
     
     response = client.post(f'/admin/professionals/{prof_id}/approve', headers=auth_headers_admin['admin'])
     assert response.status_code == 200
@@ -107,13 +105,11 @@ def test_admin_approves_pending_professional(client, auth_headers_admin, test_da
     
     prof_after = Professional.query.get(prof_id)
     assert prof_after.approval_status == 'approved'
-    user_after = User.query.get(user_id)
-    assert user_after.approval_status == 'approved'
 
 def test_admin_rejects_pending_professional(client, auth_headers_admin, app_context):
     # Create a fresh pending professional for this test to avoid state issues
     with app_context:
-        temp_user = User(email='temp_reject_adm@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Temp Reject Admin', user_type='professional', approval_status='pending')
+        temp_user = User(email='temp_reject_adm@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Temp Reject Admin', user_type='professional')
         db.session.add(temp_user)
         db.session.flush()
         temp_prof = Professional(user_id=temp_user.id, document_number='TRJADM01', diploma_file='trjadm.pdf', approval_status='pending')
@@ -190,6 +186,24 @@ def test_admin_updates_activity(client, auth_headers_admin, test_data_admin):
     assert response.json['name'] == 'Updated Activity Name Admin'
     assert response.json['description'] == 'Updated description for admin.'
 
+def test_admin_activity_change_invalidates_catalog_etag(client, auth_headers_admin, test_data_admin):
+    first = client.get('/api/search/activities', headers=auth_headers_admin['admin'])
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    not_modified = client.get('/api/search/activities', headers={**auth_headers_admin['admin'], 'If-None-Match': etag})
+    assert not_modified.status_code == 304
+
+    response = client.post('/admin/activities', headers=auth_headers_admin['admin'], json={
+        'name': 'Catalog Cache Activity Admin'
+    })
+    assert response.status_code == 201
+
+    refreshed = client.get('/api/search/activities', headers={**auth_headers_admin['admin'], 'If-None-Match': etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers['ETag'] != etag
+    assert any(act['name'] == 'Catalog Cache Activity Admin' for act in refreshed.json)
+
 def test_admin_deletes_unused_activity(client, auth_headers_admin, test_data_admin):
     activity_id_to_delete = test_data_admin['activity2_id'] 
     response = client.delete(f'/admin/activities/{activity_id_to_delete}', headers=auth_headers_admin['admin'])
@@ -237,46 +251,3 @@ def test_admin_lists_categories_from_search_route(client, auth_headers_admin, te
 
 # Note: Full CRUD for Categories by Admin would require dedicated /admin/categories routes.
 # These tests assume only the existing routes are being tested.
-
-@pytest.fixture(scope="module", autouse=True)
-def cleanup_admin_test_data(app_context, test_data_admin):
-    yield # allow tests to run
-
-    with app_context:
-        # Delete ProfessionalActivities linked for cleanup
-        ProfessionalActivity.query.filter_by(professional_id=test_data_admin['approved_prof_id'], activity_id=test_data_admin['activity1_id']).delete()
-        
-        # Delete specific activities created by tests if their names are known and unique
-        Activity.query.filter(Activity.name.in_([
-            'New Activity With Cat Admin', 
-            'New Activity No Cat Admin',
-            'Updated Activity Name Admin' # if update changed name from original fixture
-        ])).delete()
-        
-        # Attempt to delete fixture activities (they might have been deleted by tests)
-        for act_id_key in ['activity1_id', 'activity2_id']:
-            try:
-                act = Activity.query.get(test_data_admin[act_id_key])
-                if act: db.session.delete(act)
-            except: pass # Ignore if already deleted
-
-        # Attempt to delete fixture category
-        try:
-            cat = Category.query.get(test_data_admin['category1_id'])
-            if cat: db.session.delete(cat)
-        except: pass
-
-        # Delete users
-        emails_to_delete = [
-            'admin_adm@test.com', 
-            'pending_prof_adm@test.com', 
-            'approved_prof_adm@test.com', 
-            'patient_adm@test.com', 
-            'temp_reject_adm@test.com'
-        ]
-        users = User.query.filter(User.email.in_(emails_to_delete)).all()
-        for user in users:
-            Professional.query.filter_by(user_id=user.id).delete() # Delete linked professionals
-            db.session.delete(user)
-        
-        db.session.commit()
@@ -0,0 +1,74 @@
+import gzip
+
+import brotli
+import pytest
+from flask import current_app
+
+@pytest.fixture
+def static_build(app_context, tmp_path, monkeypatch):
+    source = tmp_path / 'static'
+    (source / 'css').mkdir(parents=True)
+    (source / 'uploads').mkdir()
+    (source / 'css' / 'styles.css').write_text('body { color: #333; }\n' * 50)
+    (source / 'logo.png').write_bytes(b'\x89PNG' + bytes(range(256)))
+    (source / 'uploads' / 'diploma.pdf').write_bytes(b'%PDF-1.4')
+    (source / 'index.html').write_text(
+        '<link rel="stylesheet" href="css/styles.css?v=1">'
+        '<link rel="stylesheet" href="https://cdn.example.com/css/styles.css">'
+        "<img src='/static/logo.png'><a href=\"#topo\">" + 'x' * 500
+    )
+    monkeypatch.setattr(current_app, 'static_folder', str(source))
+    monkeypatch.setitem(current_app.config, 'ASSETS_FOLDER', str(tmp_path / 'assets'))
+
+    def build():
+        result = current_app.test_cli_runner().invoke(args=['build-assets'])
+        assert result.exit_code == 0, result.output
+        return current_app.extensions['static_assets']
+
+    yield source, build
+    current_app.extensions.pop('static_assets', None)
+
+def test_static_assets_are_fingerprinted_and_precompressed(client, static_build):
+    source, build = static_build
+    assets = build()
+    styles = assets.fingerprints['css/styles.css']
+    assert styles.startswith('css/styles.') and styles.endswith('.css')
+    assert 'uploads/diploma.pdf' not in assets.files
+    assert assets.files['logo.png']['encodings'] == []  # Não ficaria menor
+
+    page = client.get('/', headers={'Accept-Encoding': 'identity'})
+    html = page.data.decode()
+    assert f'href="{styles}?v=1"' in html
+    assert 'href="https://cdn.example.com/css/styles.css"' in html
+    assert f"src='/static/{assets.fingerprints['logo.png']}'" in html
+    assert 'immutable' not in page.headers['Cache-Control'] and 'no-cache' in page.headers['Cache-Control']
+
+    css = (source / 'css' / 'styles.css').read_bytes()
+    response = client.get(f'/{styles}', headers={'Accept-Encoding': 'gzip, deflate, br'})
+    assert response.headers['Content-Encoding'] == 'br' and response.mimetype == 'text/css'
+    assert brotli.decompress(response.data) == css
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    response = client.get(f'/static/{styles}', headers={'Accept-Encoding': 'gzip, br;q=0'})
+    assert response.headers['Content-Encoding'] == 'gzip' and gzip.decompress(response.data) == css
+    response = client.get(f'/{styles}', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers and response.data == css
+    assert client.get('/uploads/diploma.pdf').status_code == 404
+
+    # Conteúdo novo, nome novo; o build anterior é substituído
+    (source / 'css' / 'styles.css').write_text('body { color: #000; }\n' * 50)
+    assert build().fingerprints['css/styles.css'] != styles
+    assert client.get(f'/{styles}').status_code == 404
+
+def test_static_assets_are_handed_to_the_web_server(client, static_build):
+    _, build = static_build
+    styles = build().fingerprints['css/styles.css']
+    current_app.config['FILE_DELIVERY'] = 'x-accel'
+    try:
+        response = client.get(f'/{styles}', headers={'Accept-Encoding': 'gzip'})
+    finally:
+        current_app.config.pop('FILE_DELIVERY')
+    assert response.data == b'' and response.mimetype == 'text/css'
+    assert response.headers['X-Accel-Redirect'] == f'/_protected/assets/{styles}.gz'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
@@ -4,10 +4,14 @@ from src.models.user import User, db
 from src.models.professional import Professional, Activity, ProfessionalActivity
 from src.models.category import Category
 import os # For file path checks
+import json
+import jwt
+from datetime import datetime, timedelta
+from src.utils.auth import decode_token
 
 # --- Test Data Setup for Auth Tests ---
-@pytest.fixture(scope='module')
-def test_data_auth(app_context):
+@pytest.fixture
+def test_data_auth(client, app_context):
     with app_context:
         # Category for activities
         category_auth = Category.query.filter_by(name='Auth Test Category').first()
@@ -130,9 +134,9 @@ def test_register_professional_success_with_activities(client, test_data_auth, d
         'activity_descriptions[]': ['Custom desc for activity 1', 'Custom desc for activity 2'],
         'activity_prices[]': ['150.00', '200.50']
     }
-    files = {'diploma': (dummy_diploma_file.name, dummy_diploma_file.open('rb'), 'application/pdf')}
-    
-    response = client.post('/api/auth/register/professional', data=data, files=files, content_type='multipart/form-data')
+    data['diploma'] = (dummy_diploma_file.open('rb'), dummy_diploma_file.name, 'application/pdf')
+
+    response = client.post('/api/auth/register/professional', data=data, content_type='multipart/form-data')
     
     assert response.status_code == 201
     json_data = response.get_json()
@@ -171,9 +175,9 @@ def test_register_professional_success_no_activities(client, test_data_auth, dum
         'bio': 'Bio for prof auth two.'
         # No activity_ids[], descriptions, or prices
     }
-    files = {'diploma': (dummy_diploma_file.name, dummy_diploma_file.open('rb'), 'application/pdf')}
-    
-    response = client.post('/api/auth/register/professional', data=data, files=files, content_type='multipart/form-data')
+    data['diploma'] = (dummy_diploma_file.open('rb'), dummy_diploma_file.name, 'application/pdf')
+
+    response = client.post('/api/auth/register/professional', data=data, content_type='multipart/form-data')
     
     assert response.status_code == 201
     json_data = response.get_json()
@@ -201,9 +205,9 @@ def test_register_professional_invalid_activity_id(client, test_data_auth, dummy
         'activity_descriptions[]': ['Desc for valid activity', 'Desc for invalid'],
         'activity_prices[]': ['100.00', '50.00']
     }
-    files = {'diploma': (dummy_diploma_file.name, dummy_diploma_file.open('rb'), 'application/pdf')}
-    
-    response = client.post('/api/auth/register/professional', data=data, files=files, content_type='multipart/form-data')
+    data['diploma'] = (dummy_diploma_file.open('rb'), dummy_diploma_file.name, 'application/pdf')
+
+    response = client.post('/api/auth/register/professional', data=data, content_type='multipart/form-data')
     
     assert response.status_code == 201 # Registration itself should succeed
     json_data = response.get_json()
@@ -235,65 +239,562 @@ def test_register_professional_missing_diploma(client, test_data_auth):
     assert 'Diploma é obrigatório' in json_data['error']
 
 
-@pytest.fixture(scope="module", autouse=True)
-def cleanup_auth_test_data(app_context, test_data_auth):
-    yield # allow tests to run
-    with app_context:
-        # Clean up users created in these tests
-        emails_to_delete = [
-            'patient_auth@example.com', 
-            'patient_auth_missing@example.com', # This one was not created
-            'patient_auth_dup@example.com',
-            'login_auth_patient@example.com',
-            'login_fail_auth@example.com',
-            'prof_auth1@example.com',
-            'prof_auth2@example.com',
-            'prof_auth3@example.com',
-            'prof_auth4@example.com' # This one was not created
-        ]
-        users = User.query.filter(User.email.in_(emails_to_delete)).all()
-        for user in users:
-            # Delete associated Professional and ProfessionalActivity entries
-            prof = Professional.query.filter_by(user_id=user.id).first()
-            if prof:
-                ProfessionalActivity.query.filter_by(professional_id=prof.id).delete()
-                db.session.delete(prof)
-            db.session.delete(user)
-
-        # Clean up activities and category
-        Activity.query.filter_by(id=test_data_auth['activity1_id']).delete()
-        Activity.query.filter_by(id=test_data_auth['activity2_id']).delete()
-        Category.query.filter(Category.name == 'Auth Test Category').delete()
-        
+
+# --- Verified-token cache and role checks ---
+
+def _token(user_id, user_type, expires_in=timedelta(hours=1)):
+    return jwt.encode({'user_id': user_id, 'user_type': user_type, 'exp': datetime.utcnow() + expires_in},
+                      current_app.config['SECRET_KEY'], algorithm='HS256')
+
+def _create_user(email, user_type='patient'):
+    user = User(email=email, password='x', name='Usuário de teste', user_type=user_type)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def test_verified_tokens_are_served_from_cache(client):
+    from src.utils.auth import get_token_cache
+    cache = get_token_cache()
+    cache.clear()
+    user = _create_user('cached@example.com')
+    headers = {'Authorization': f"Bearer {_token(user.id, 'patient')}"}
+
+    hits = cache.hits
+    assert client.get('/api/booking/', headers=headers).status_code == 200
+    assert len(cache) == 1
+    assert client.get('/api/booking/', headers=headers).status_code == 200
+    assert cache.hits == hits + 1
+
+    # Um token adulterado nunca coincide com a entrada em cache
+    tampered = headers['Authorization'][:-2] + ('AA' if not headers['Authorization'].endswith('AA') else 'BB')
+    assert client.get('/api/booking/', headers={'Authorization': tampered}).status_code == 401
+
+def test_cached_token_expires_with_its_exp(client):
+    from src.utils.auth import TokenCache
+    cache = TokenCache(max_size=2, ttl=300)
+    now = 1000.0
+    cache.put(b'a', {'exp': now + 5}, now=now)
+    assert cache.get(b'a', now=now + 4) is not None
+    assert cache.get(b'a', now=now + 5) is None
+
+    # LRU: a entrada menos usada sai quando o limite é atingido
+    cache.put(b'b', {'exp': now + 60}, now=now)
+    cache.put(b'c', {'exp': now + 60}, now=now)
+    cache.get(b'b', now=now)
+    cache.put(b'd', {'exp': now + 60}, now=now)
+    assert cache.get(b'c', now=now) is None
+    assert cache.get(b'b', now=now) is not None
+
+def test_role_checks_are_declarative(client):
+    user = _create_user('roles@example.com')
+    patient_headers = {'Authorization': f"Bearer {_token(user.id, 'patient')}"}
+    response = client.get('/admin/activities', headers=patient_headers)
+    assert response.status_code == 403
+    assert 'error' in response.get_json()
+
+    expired_headers = {'Authorization': f"Bearer {_token(user.id, 'admin', expires_in=timedelta(seconds=-1))}"}
+    assert client.get('/admin/activities', headers=expired_headers).status_code == 401
+    assert client.put('/api/professional/1', headers=patient_headers, json={'bio': 'x'}).status_code == 403
+    assert client.get('/api/booking/').status_code == 401
+
+# --- Current principal (deleted, demoted and rejected users) ---
+
+@pytest.fixture
+def principals(client):
+    from src.utils.principals import get_principal_cache
+    cache = get_principal_cache()
+    cache.clear()
+    yield cache
+    # Os ids se repetem entre testes porque as tabelas são recriadas
+    cache.clear()
+
+def test_cached_principal_needs_no_query(client, principals):
+    from sqlalchemy import event
+    user = _create_user('principal@example.com')
+    headers = {'Authorization': f"Bearer {_token(user.id, 'patient')}"}
+    assert client.get('/api/booking/', headers=headers).status_code == 200
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert client.get('/api/booking/', headers=headers).status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert not any('FROM users' in statement and 'professionals' in statement for statement in statements)
+    assert principals.hits >= 1
+
+def test_deleted_user_loses_access_on_commit(client, principals):
+    user = _create_user('deleted@example.com')
+    headers = {'Authorization': f"Bearer {_token(user.id, 'patient')}"}
+    assert client.get('/api/booking/', headers=headers).status_code == 200
+    db.session.delete(user)
+    db.session.commit()
+    response = client.get('/api/booking/', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json()['message'] == 'Usuário não encontrado'
+
+def test_demoted_admin_loses_admin_routes(client, principals):
+    admin = _create_user('demoted@example.com', 'admin')
+    headers = {'Authorization': f"Bearer {_token(admin.id, 'admin')}"}
+    assert client.get('/admin/activities', headers=headers).status_code == 200
+    admin.user_type = 'patient'
+    db.session.commit()
+    assert client.get('/admin/activities', headers=headers).status_code == 403
+    # O perfil atual vale mesmo com o token antigo
+    assert client.get('/api/booking/', headers=headers).status_code == 200
+
+def test_rejected_professional_is_blocked(client, principals):
+    admin = _create_user('approver@example.com', 'admin')
+    user = _create_user('rejected@example.com', 'professional')
+    professional = Professional(user_id=user.id, document_number='123', diploma_file='diploma.pdf')
+    db.session.add(professional)
+    db.session.commit()
+    headers = {'Authorization': f"Bearer {_token(user.id, 'professional')}"}
+    assert client.get('/api/booking/', headers=headers).status_code == 200
+
+    admin_headers = {'Authorization': f"Bearer {_token(admin.id, 'admin')}"}
+    response = client.post(f'/admin/professionals/{professional.id}/reject', headers=admin_headers, json={'reason': 'x'})
+    assert response.status_code == 200
+    assert client.get('/api/booking/', headers=headers).status_code == 403
+
+def test_bulk_updates_clear_the_principal_cache(client, principals):
+    user = _create_user('bulk@example.com', 'admin')
+    headers = {'Authorization': f"Bearer {_token(user.id, 'admin')}"}
+    assert client.get('/admin/activities', headers=headers).status_code == 200
+    assert len(principals) == 1
+    User.query.filter_by(id=user.id).update({'user_type': 'patient'})
+    db.session.commit()
+    assert len(principals) == 0
+    assert client.get('/admin/activities', headers=headers).status_code == 403
+
+def test_rolled_back_changes_keep_the_cache(client, principals):
+    user = _create_user('rollback@example.com')
+    headers = {'Authorization': f"Bearer {_token(user.id, 'patient')}"}
+    assert client.get('/api/booking/', headers=headers).status_code == 200
+    db.session.delete(user)
+    db.session.flush()
+    db.session.rollback()
+    assert len(principals) == 1
+
+# --- Password hashing pool ---
+
+def test_login_rehashes_outdated_password_hash(client):
+    from werkzeug.security import generate_password_hash
+    user = User(email='rehash@example.com', password=generate_password_hash('segredo', 'pbkdf2:sha256:1000'),
+                name='Rehash User', user_type='patient')
+    db.session.add(user)
+    db.session.commit()
+
+    current_app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+    try:
+        response = client.post('/api/auth/login', json={'email': 'rehash@example.com', 'password': 'segredo'})
+        assert response.status_code == 200
+        db.session.expire_all()
+        assert db.session.get(User, user.id).password.startswith('pbkdf2:sha256:2000$')
+
+        # O novo hash continua válido e já está atualizado
+        assert client.post('/api/auth/login', json={'email': 'rehash@example.com', 'password': 'segredo'}).status_code == 200
+        assert client.post('/api/auth/login', json={'email': 'rehash@example.com', 'password': 'errada'}).status_code == 401
+    finally:
+        current_app.config.pop('PASSWORD_HASH_METHOD')
+
+def test_hashing_slots_are_shared_by_every_worker_on_the_host(client, tmp_path):
+    import subprocess
+    import sys
+    from src.utils.passwords import HostSlots, PasswordHasher
+    original = current_app.extensions['password_hasher']
+    hasher = PasswordHasher(current_app._get_current_object(), HostSlots(str(tmp_path), 1), wait_seconds=0.05)
+    current_app.extensions['password_hasher'] = hasher
+    # Outro processo (outro worker do gunicorn) ocupa a única vaga da máquina
+    holder = subprocess.Popen([sys.executable, '-c', (
+        'import fcntl, os, sys, time\n'
+        f'fd = os.open({str(tmp_path / "slot-0.lock")!r}, os.O_RDWR | os.O_CREAT)\n'
+        'fcntl.flock(fd, fcntl.LOCK_EX)\n'
+        'print("ok", flush=True)\n'
+        'sys.stdin.read()\n'
+    )], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == 'ok'
+        response = client.post('/api/auth/login', json={'email': 'any@example.com', 'password': 'x'})
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '1'
+        response = client.post('/api/auth/register/patient', json={
+            'email': 'busy@example.com', 'password': 'x', 'name': 'Busy', 'document': '1'
+        })
+        assert response.status_code == 429
+        assert User.query.filter_by(email='busy@example.com').first() is None
+        assert hasher.counters['rejected'] == 2
+
+        # O processo termina e a vaga volta
+        holder.stdin.close()
+        holder.wait(timeout=10)
+        response = client.post('/api/auth/register/patient', json={
+            'email': 'busy@example.com', 'password': 'x', 'name': 'Busy', 'document': '1'
+        })
+        assert response.status_code == 201
+    finally:
+        holder.kill()
+        current_app.extensions['password_hasher'] = original
+
+# --- Rate limiting ---
+
+@pytest.fixture
+def rate_limits():
+    from src.utils.rate_limit import get_rate_limiter
+    limiter = get_rate_limiter()
+    limiter.backend.reset()
+    current_app.config['RATE_LIMIT_ENABLED'] = True
+    keys = []
+
+    def configure(**limits):
+        for key, value in limits.items():
+            current_app.config[key] = value
+            keys.append(key)
+    yield configure
+    for key in keys:
+        current_app.config.pop(key, None)
+    current_app.config['RATE_LIMIT_ENABLED'] = False
+    limiter.backend.reset()
+
+def test_login_attempts_per_email_are_limited_before_touching_the_database(client, rate_limits):
+    from sqlalchemy import event
+    rate_limits(RATE_LIMIT_LOGIN_EMAIL=(3, 300))
+    credentials = {'email': 'Target@example.com', 'password': 'errada'}
+    for _ in range(3):
+        assert client.post('/api/auth/login', json=credentials).status_code == 401
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        # O email é normalizado: variar maiúsculas não contorna o limite
+        response = client.post('/api/auth/login', json={'email': ' target@EXAMPLE.com', 'password': 'x'})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert 'message' in response.get_json()
+    assert statements == []
+
+    # Outra conta, mesmo IP: o token bucket por IP ainda tem folga
+    assert client.post('/api/auth/login', json={'email': 'other@example.com', 'password': 'x'}).status_code == 401
+
+def test_registrations_per_ip_use_a_token_bucket(client, rate_limits):
+    rate_limits(RATE_LIMIT_REGISTER_IP=(2, 3600))
+    for number in range(2):
+        response = client.post('/api/auth/register/patient', json={
+            'email': f'bucket{number}@example.com', 'password': 'x', 'name': 'Bucket', 'document': str(number)
+        })
+        assert response.status_code == 201
+    response = client.post('/api/auth/register/patient', json={
+        'email': 'bucket2@example.com', 'password': 'x', 'name': 'Bucket', 'document': '2'
+    }, environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 429
+    assert 'error' in response.get_json()
+    # Outro IP tem o seu próprio bucket
+    response = client.post('/api/auth/register/patient', json={
+        'email': 'bucket2@example.com', 'password': 'x', 'name': 'Bucket', 'document': '2'
+    }, environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert response.status_code == 201
+
+def test_throttled_ip_is_rejected_before_the_upload_is_read(client, rate_limits, monkeypatch):
+    import io
+    from src.utils.uploads import UploadRequest
+    rate_limits(RATE_LIMIT_REGISTER_IP=(1, 3600))
+    assert client.post('/api/auth/register/patient', json={
+        'email': 'first@example.com', 'password': 'x', 'name': 'First', 'document': '1'
+    }).status_code == 201
+
+    parsed = []
+    original = UploadRequest._load_form_data
+    monkeypatch.setattr(UploadRequest, '_load_form_data', lambda self: parsed.append(True) or original(self))
+    response = client.post('/api/auth/register/professional', content_type='multipart/form-data', data={
+        'email': 'second@example.com', 'password': 'x', 'name': 'Second', 'document_number': '2',
+        'diploma': (io.BytesIO(b'%PDF-1.4' + b'0' * 100000), 'diploma.pdf')
+    })
+    assert response.status_code == 429
+    assert parsed == []
+
+def test_sliding_window_and_token_bucket_algorithms():
+    from src.utils.rate_limit import MemoryBackend, SLIDING_WINDOW, TOKEN_BUCKET
+    backend = MemoryBackend(max_keys=2)
+    # Janela deslizante: 4 por 10 s; metade da janela anterior ainda pesa aos 15 s
+    assert [backend.hit('w', SLIDING_WINDOW, 4, 10, now=1.0)[0] for _ in range(5)] == [True] * 4 + [False]
+    assert backend.hit('w', SLIDING_WINDOW, 4, 10, now=15.0) == (True, 0)
+    assert backend.hit('w', SLIDING_WINDOW, 4, 10, now=15.0) == (True, 0)
+    allowed, retry_after = backend.hit('w', SLIDING_WINDOW, 4, 10, now=15.0)
+    assert not allowed and retry_after == pytest.approx(2.5)
+
+    # Token bucket: 2 tokens repostos em 10 s (um a cada 5 s)
+    assert [backend.hit('b', TOKEN_BUCKET, 2, 10, now=0.0)[0] for _ in range(3)] == [True, True, False]
+    assert backend.hit('b', TOKEN_BUCKET, 2, 10, now=5.0) == (True, 0)
+
+    # Chaves além do limite saem pela ordem de uso
+    backend.hit('c', TOKEN_BUCKET, 2, 10, now=5.0)
+    assert backend.size() == 2
+
+def test_shared_store_is_consistent_across_clients():
+    import threading
+    from src.utils.rate_limit import SharedBackend, SLIDING_WINDOW, serve_store
+    server = serve_store(('127.0.0.1', 0), b'chave-de-teste')
+
+    def serve():
+        # serve_forever encerra com sys.exit ao parar
+        with pytest.raises(SystemExit):
+            server.serve_forever()
+    threading.Thread(target=serve, daemon=True).start()
+    try:
+        # Dois clientes fazem o papel de dois workers do gunicorn
+        workers = [SharedBackend(server.address, b'chave-de-teste') for _ in range(2)]
+        results = [workers[i % 2].hit('login:email:x', SLIDING_WINDOW, 3, 60)[0] for i in range(6)]
+        assert results == [True, True, True, False, False, False]
+    finally:
+        server.stop_event.set()
+
+    # Armazenamento fora do ar: a requisição passa
+    assert SharedBackend(('127.0.0.1', 1), b'x').hit('k', SLIDING_WINDOW, 1, 60) == (True, 0)
+
+def test_shared_store_failures_fail_open_and_log_once_per_outage(caplog):
+    import threading
+    from multiprocessing.managers import RemoteError
+    from src.utils.rate_limit import SharedBackend, SLIDING_WINDOW, serve_store
+    server = serve_store(('127.0.0.1', 0), b'chave-de-teste')
+
+    def serve():
+        with pytest.raises(SystemExit):
+            server.serve_forever()
+    threading.Thread(target=serve, daemon=True).start()
+    try:
+        # authkey diferente: AuthenticationError na conexão
+        wrong_key = SharedBackend(server.address, b'outra-chave')
+        with caplog.at_level('INFO', logger='src.utils.rate_limit'):
+            assert [wrong_key.hit('k', SLIDING_WINDOW, 1, 60) for _ in range(3)] == [(True, 0)] * 3
+        assert len([r for r in caplog.records if r.levelname == 'WARNING']) == 1
+
+        # Erro do servidor repassado pelo proxy (ex.: armazenamento reiniciado)
+        caplog.clear()
+        backend = SharedBackend(server.address, b'chave-de-teste')
+
+        class RestartedStore:
+            def hit(self, *args):
+                raise RemoteError('KeyError: id desconhecido')
+        backend._store = RestartedStore()
+        with caplog.at_level('INFO', logger='src.utils.rate_limit'):
+            assert backend.hit('k', SLIDING_WINDOW, 1, 60) == (True, 0)
+            # Reconecta na requisição seguinte e volta a limitar
+            assert backend.hit('k', SLIDING_WINDOW, 1, 60) == (True, 0)
+            assert backend.hit('k', SLIDING_WINDOW, 1, 60)[0] is False
+        assert [r.levelname for r in caplog.records] == ['WARNING', 'INFO']
+    finally:
+        server.stop_event.set()
+
+# --- Access/refresh tokens and revocation ---
+
+def _login(client, email, password='segredo'):
+    from werkzeug.security import generate_password_hash
+    if not User.query.filter_by(email=email).first():
+        db.session.add(User(email=email, password=generate_password_hash(password, 'pbkdf2:sha256:1000'),
+                            name='Token User', user_type='patient'))
         db.session.commit()
+    response = client.post('/api/auth/login', json={'email': email, 'password': password})
+    assert response.status_code == 200
+    return response.get_json()
 
-        # Clean up dummy diploma files if any were "saved" (though they are in tmp_path usually)
-        # For the UPLOAD_FOLDER, manual cleanup might be needed if files are actually written there by tests.
-        # This part is tricky without knowing the exact file saving mock strategy.
-        # If files are saved to UPLOAD_FOLDER, they should be cleaned.
-        # Example:
-        # for root, dirs, files_in_dir in os.walk(test_data_auth['upload_folder']):
-        #    for f_name in files_in_dir:
-        #        if "dummy_diploma" in f_name or "PROF_AUTH" in f_name: # Be careful with patterns
-        #            try:
-        #                os.remove(os.path.join(root, f_name))
-        #            except OSError:
-        #                pass # File might have been removed by another test or not created
-    
-    # The dummy_diploma_file fixture handles its own cleanup due to tmp_path.
-    # We need to handle cleanup of files in the actual UPLOAD_FOLDER if the app writes there.
-    # The test `test_register_professional_success_with_activities` checks `os.path.exists`
-    # which implies it expects the app to write to `UPLOAD_FOLDER`.
-    # Let's add a basic cleanup for that, assuming `professional.diploma_file` stores only the filename.
-    with app_context:
-        professionals_for_cleanup = Professional.query.join(User).filter(User.email.like('prof_auth%@example.com')).all()
-        upload_folder = test_data_auth['upload_folder']
-        for prof in professionals_for_cleanup:
-            if prof.diploma_file:
-                file_path_to_remove = os.path.join(upload_folder, prof.diploma_file)
-                if os.path.exists(file_path_to_remove):
-                    try:
-                        os.remove(file_path_to_remove)
-                    except Exception as e:
-                        print(f"Warning: Could not remove test diploma file {file_path_to_remove}: {e}")
-        db.session.commit() # Commit any session changes from querying above
+def test_refresh_tokens_rotate_and_reuse_revokes_the_family(client):
+    session = _login(client, 'refresh@example.com')
+    assert session['expires_in'] == 900
+    claims = decode_token(session['token'])
+    assert claims['exp'] - claims['iat'] <= 900 and claims['jti']
+
+    response = client.post('/api/auth/refresh', json={'refresh_token': session['refresh_token']})
+    assert response.status_code == 200
+    rotated = response.get_json()
+    assert rotated['refresh_token'] != session['refresh_token']
+    assert client.get('/api/booking/', headers={'Authorization': f"Bearer {rotated['token']}"}).status_code == 200
+
+    # Reapresentar o token já trocado derruba também o que foi emitido no lugar dele
+    assert client.post('/api/auth/refresh', json={'refresh_token': session['refresh_token']}).status_code == 401
+    assert client.post('/api/auth/refresh', json={'refresh_token': rotated['refresh_token']}).status_code == 401
+    assert client.post('/api/auth/refresh', json={'refresh_token': 'desconhecido'}).status_code == 401
+    assert client.post('/api/auth/refresh', json={}).status_code == 400
+
+def test_logout_revokes_the_access_token_without_per_request_queries(client):
+    from sqlalchemy import event
+    session = _login(client, 'logout@example.com')
+    headers = {'Authorization': f"Bearer {session['token']}"}
+    assert client.get('/api/booking/', headers=headers).status_code == 200
+
+    # Entre as sincronizações, verificar um token não revogado não consulta token_revocations
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert client.get('/api/booking/', headers=headers).status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert not any('token_revocations' in statement for statement in statements)
+
+    response = client.post('/api/auth/logout', headers=headers, json={'refresh_token': session['refresh_token']})
+    assert response.status_code == 200
+    response = client.get('/api/booking/', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json()['message'] == 'Token revogado!'
+    assert client.post('/api/auth/refresh', json={'refresh_token': session['refresh_token']}).status_code == 401
+
+@pytest.fixture
+def revocations():
+    from src.utils.tokens import get_revocation_list
+    yield get_revocation_list()
+    # As tabelas são recriadas a cada teste, mas o filtro vive no processo
+    get_revocation_list().reset()
+
+def test_revoking_a_user_reaches_other_workers_on_sync(client, revocations):
+    from src.utils.tokens import RevocationList
+    # Lista "de outro worker", já sincronizada antes da revogação
+    other_worker = RevocationList(current_app._get_current_object())
+    other_worker.sync(force=True)
+
+    session = _login(client, 'revoked@example.com')
+    user = User.query.filter_by(email='revoked@example.com').first()
+    claims = decode_token(session['token'])
+    admin = _create_user('revoker@example.com', 'admin')
+    admin_headers = {'Authorization': f"Bearer {_token(admin.id, 'admin')}"}
+    assert client.post(f'/admin/users/{user.id}/revoke-tokens', headers=admin_headers).status_code == 200
+
+    assert client.get('/api/booking/', headers={'Authorization': f"Bearer {session['token']}"}).status_code == 401
+    assert client.post('/api/auth/refresh', json={'refresh_token': session['refresh_token']}).status_code == 401
+    assert not other_worker.is_revoked(claims)
+    other_worker.sync(force=True)
+    assert other_worker.is_revoked(claims)
+
+    # Um login depois da revogação volta a funcionar
+    fresh = _login(client, 'revoked@example.com')
+    assert client.get('/api/booking/', headers={'Authorization': f"Bearer {fresh['token']}"}).status_code == 200
+    assert not revocations.is_revoked(
+        decode_token(fresh['token'])
+    )
+
+def test_user_revocations_outlive_legacy_tokens_without_iat(client, revocations):
+    from src.models.auth_token import TokenRevocation
+    from src.utils.tokens import LEGACY_TOKEN_TTL_SECONDS, revoke_user_tokens
+    user = _create_user('legacy-revoked@example.com')
+    legacy = _token(user.id, 'patient', expires_in=timedelta(hours=24))
+    assert 'iat' not in jwt.decode(legacy, options={'verify_signature': False})
+    revoke_user_tokens(db.session, user.id)
+    db.session.commit()
+
+    revocation = TokenRevocation.query.filter_by(kind='user', value=str(user.id)).one()
+    assert revocation.expires_at - revocation.not_before >= timedelta(seconds=LEGACY_TOKEN_TTL_SECONDS)
+    assert client.get('/api/booking/', headers={'Authorization': f'Bearer {legacy}'}).status_code == 401
+    # Passados os 15 minutos do access token, a revogação continua valendo para o token antigo
+    revocations.reset()
+    assert revocations.is_revoked(decode_token(legacy))
+
+def test_expired_revocations_are_purged_outside_requests(client, revocations):
+    from src.models.auth_token import TokenRevocation
+    from src.utils.expiration import get_expiration_scheduler
+    db.session.add(TokenRevocation(kind='jti', value='vencido', expires_at=datetime.utcnow() - timedelta(minutes=1)))
+    db.session.commit()
+    # A reconstrução do filtro só lê a tabela
+    current_app.config['TOKEN_REVOCATION_REBUILD_SECONDS'] = 0
+    try:
+        revocations.sync(force=True)
+    finally:
+        current_app.config.pop('TOKEN_REVOCATION_REBUILD_SECONDS')
+    assert TokenRevocation.query.count() == 1
+
+    metrics = get_expiration_scheduler().run_once()
+    assert metrics['token_revocations_purged'] == 1
+    assert TokenRevocation.query.count() == 0
+
+def test_bloom_filter_has_no_false_negatives():
+    from src.utils.tokens import BloomFilter
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for number in range(1000):
+        bloom.add(f'jti:{number}')
+    assert all(f'jti:{number}' in bloom for number in range(1000))
+    false_positives = sum(f'jti:outro-{number}' in bloom for number in range(10000))
+    assert false_positives < 300
+
+# --- Asymmetric signing keys ---
+
+def test_jwks_lets_other_services_validate_tokens(client):
+    session = _login(client, 'jwks@example.com')
+    response = client.get('/api/auth/jwks.json')
+    assert response.status_code == 200
+    assert response.cache_control.public and response.cache_control.max_age == 3600
+    assert client.get('/api/auth/jwks.json', headers={'If-None-Match': response.headers['ETag'].strip('"')}).status_code == 304
+
+    # Validador externo: só o JWKS, sem o SECRET_KEY
+    header = jwt.get_unverified_header(session['token'])
+    assert header['alg'] == 'EdDSA'
+    key = jwt.PyJWKSet.from_dict(response.get_json())[header['kid']]
+    claims = jwt.decode(session['token'], key.key, algorithms=['EdDSA'])
+    assert claims['user_id'] == User.query.filter_by(email='jwks@example.com').first().id
+
+def test_hs256_tokens_are_rejected_unless_enabled(client, monkeypatch):
+    user = _create_user('legacy@example.com')
+    headers = {'Authorization': f"Bearer {_token(user.id, 'patient')}"}
+    # Desligado por padrão: a conftest liga só porque os testes montam tokens HS256
+    monkeypatch.delitem(current_app.config, 'JWT_ACCEPT_HS256')
+    assert client.get('/api/booking/', headers=headers).status_code == 401
+
+def test_signing_keys_come_from_env_or_fail_fast(tmp_path):
+    from src.utils.signing_keys import KeySet, SigningKeysMissing, new_key_pem
+    # Sem chaves provisionadas nada é criado em silêncio
+    with pytest.raises(SigningKeysMissing):
+        KeySet(str(tmp_path / 'empty')).refresh()
+    assert not (tmp_path / 'empty').exists()
+
+    # JWT_SIGNING_KEYS: as mesmas chaves em todas as instâncias, sem disco
+    kid, pem = new_key_pem('EdDSA')
+    key_set = KeySet(str(tmp_path / 'unused'), 'EdDSA', activation_delay=0, pems={kid: pem.decode()})
+    assert key_set.active().kid == kid
+    assert [key['kid'] for key in json.loads(key_set.jwks()[0])['keys']] == [kid]
+    with pytest.raises(ValueError):
+        key_set.rotate(timedelta(minutes=15))
+
+def test_workers_starting_together_create_a_single_key(tmp_path):
+    import threading
+    from src.utils.signing_keys import KeySet
+    barrier = threading.Barrier(8)
+    kids = []
+
+    def start_worker():
+        key_set = KeySet(str(tmp_path), 'EdDSA', autogenerate=True)
+        barrier.wait()
+        kids.append(key_set.active().kid)
+
+    workers = [threading.Thread(target=start_worker) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(set(kids)) == 1
+    assert len(list(tmp_path.glob('*.pem'))) == 1
+
+def test_rotated_keys_validate_until_their_tokens_expire(tmp_path):
+    from src.utils.signing_keys import KeySet
+    key_set = KeySet(str(tmp_path), 'EdDSA', activation_delay=600, reload_seconds=0, autogenerate=True)
+    # A chave inicial é criada no primeiro uso, com o relógio real
+    first = key_set.active()
+    start = first.created_at
+    token = jwt.encode({'sub': '1'}, first.private_key, algorithm='EdDSA', headers={'kid': first.kid})
+
+    # A chave nova é publicada no JWKS, mas só assina depois do atraso de ativação
+    new_kid, removed = key_set.rotate(timedelta(minutes=15), now=start + timedelta(days=1))
+    assert removed == []
+    assert new_kid in key_set.jwks()[0].decode()
+    assert key_set.active(start + timedelta(days=1)).kid != new_kid
+    assert key_set.active(start + timedelta(days=1, minutes=10)).kid == new_kid
+
+    # A antiga continua validando os tokens que assinou
+    old = key_set.get(first.kid)
+    assert jwt.decode(token, old.public_key, algorithms=['RS256', 'EdDSA'])['sub'] == '1'
+
+    # Sai na rotação seguinte, quando nenhum token dela pode estar vivo
+    _, removed = key_set.rotate(timedelta(minutes=15), algorithm='RS256', now=start + timedelta(days=1, minutes=30))
+    assert removed == [first.kid]
+    assert key_set.get(first.kid) is None
+    assert sorted(key['alg'] for key in json.loads(key_set.jwks()[0])['keys']) == ['EdDSA', 'RS256']
@@ -20,6 +20,13 @@ def generate_token(user_id, user_type='patient'): # Removed hardcoded secret
     secret = current_app.config.get('SECRET_KEY', 'test_secret_key_for_conftest')
     return jwt.encode(payload, secret, algorithm='HS256')
 
+def create_user_headers(user_type, email):
+    # O token precisa ser de um usuário existente, com o perfil atual dele
+    user = User(email=email, password='x', name='Usuário de teste', user_type=user_type)
+    db.session.add(user)
+    db.session.commit()
+    return user.id, {'Authorization': f'Bearer {generate_token(user.id, user_type)}'}
+
 @pytest.fixture
 def auth_headers(client): # client is from conftest.py
     # Criar usuário
@@ -117,3 +124,349 @@ def test_delete_booking(client, auth_headers):
     assert response.status_code == 200
     data = response.get_json()
     assert 'message' in data
+
+def test_list_bookings_is_scoped_to_caller(client, auth_headers):
+    client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 1,
+        'scheduled_date': '2024-01-10T10:00:00'
+    })
+    other_id, other_headers = create_user_headers('patient', 'other_patient@example.com')
+    client.post('/api/booking/', headers=other_headers, json={
+        'professional_id': 1,
+        'scheduled_date': '2024-01-10T11:00:00'
+    })
+
+    own = client.get('/api/booking/', headers=auth_headers).get_json()
+    others = client.get('/api/booking/', headers=other_headers).get_json()
+    assert own and others
+    assert not {b['id'] for b in own} & {b['id'] for b in others}
+    assert all(b['patient_id'] == other_id for b in others)
+
+    _, admin_headers = create_user_headers('admin', 'admin@example.com')
+    filtered = client.get(f'/api/booking/?patient_id={other_id}', headers=admin_headers).get_json()
+    assert {b['id'] for b in filtered} == {b['id'] for b in others}
+
+def test_list_bookings_keyset_pagination_and_filters(client, auth_headers):
+    for day in range(1, 6):
+        client.post('/api/booking/', headers=auth_headers, json={
+            'professional_id': 1,
+            'scheduled_date': f'2024-02-0{day}T09:00:00',
+            'status': 'confirmed' if day % 2 else 'pending'
+        })
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/booking/?limit=2&from=2024-02-01T00:00:00&to=2024-03-01T00:00:00'
+        if cursor:
+            url += f'&cursor={cursor}'
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        assert len(response.get_json()) <= 2
+        seen.extend(b['scheduled_date'] for b in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert seen == [f'2024-02-0{day}T09:00:00' for day in range(1, 6)]
+
+    confirmed = client.get('/api/booking/?status=confirmed&from=2024-02-01T00:00:00', headers=auth_headers).get_json()
+    assert [b['scheduled_date'][:10] for b in confirmed] == ['2024-02-01', '2024-02-03', '2024-02-05']
+
+def test_list_bookings_invalid_cursor(client, auth_headers):
+    response = client.get('/api/booking/?cursor=invalido', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_create_booking_conflict_returns_alternatives(client, auth_headers):
+    first = client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 1,
+        'scheduled_date': '2024-03-04T10:00:00'
+    })
+    assert first.status_code == 201
+
+    # Começa durante o agendamento anterior (que ocupa 60 minutos)
+    overlapping = client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 1,
+        'scheduled_date': '2024-03-04T10:30:00'
+    })
+    assert overlapping.status_code == 409
+    assert 'alternatives' in overlapping.get_json()
+
+    # Cancelados não ocupam o horário
+    client.put(f"/api/booking/{first.get_json()['id']}", headers=auth_headers, json={'status': 'cancelled'})
+    retry = client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 1,
+        'scheduled_date': '2024-03-04T10:30:00'
+    })
+    assert retry.status_code == 201
+
+def test_create_booking_missing_fields(client, auth_headers):
+    response = client.post('/api/booking/', headers=auth_headers, json={'professional_id': 1})
+    assert response.status_code == 400
+
+def test_create_and_update_booking_reject_unknown_status(client, auth_headers):
+    response = client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 1, 'scheduled_date': '2024-03-04T10:00:00', 'status': 'aprovado'
+    })
+    assert response.status_code == 400
+    assert Booking.query.count() == 0
+    booking_id = client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 1, 'scheduled_date': '2024-03-04T10:00:00'
+    }).get_json()['id']
+    response = client.put(f'/api/booking/{booking_id}', headers=auth_headers, json={'status': 'aprovado'})
+    assert response.status_code == 400
+    assert db.session.get(Booking, booking_id).status == 'pending'
+
+def test_concurrent_bookings_for_same_slot(tmp_path):
+    # Banco em arquivo: cada thread usa a própria conexão, como workers reais
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import Flask
+    from src.routes.booking import booking_bp
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'bookings.db'}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    app.config['SECRET_KEY'] = 'concurrency_test_secret'
+    app.config['JWT_ACCEPT_HS256'] = True
+    db.init_app(app)
+    app.register_blueprint(booking_bp, url_prefix='/api/booking')
+    with app.app_context():
+        db.create_all()
+        # Os tokens só valem para usuários existentes
+        db.session.add_all([User(id=patient_id, email=f'patient{patient_id}@example.com', password='x',
+                                 name='Paciente', user_type='patient') for patient_id in range(1, 201)])
+        db.session.commit()
+
+    def book(patient_id):
+        token = jwt.encode({'user_id': patient_id, 'user_type': 'patient',
+                            'exp': datetime.utcnow() + timedelta(minutes=5)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+        with app.test_client() as test_client:
+            return test_client.post('/api/booking/', headers={'Authorization': f'Bearer {token}'}, json={
+                'professional_id': 1,
+                'scheduled_date': '2024-04-01T15:00:00'
+            }).status_code
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        statuses = list(executor.map(book, range(1, 201)))
+
+    assert statuses.count(201) == 1
+    assert statuses.count(409) == 199
+    with app.app_context():
+        assert Booking.query.filter_by(professional_id=1).count() == 1
+
+def test_create_bookings_batch_reports_each_item(client, auth_headers):
+    client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 2,
+        'scheduled_date': '2024-05-06T09:00:00'
+    })
+    response = client.post('/api/booking/batch', headers=auth_headers, json={'bookings': [
+        {'professional_id': 2, 'scheduled_date': '2024-05-06T11:00:00'},
+        {'professional_id': 2, 'scheduled_date': '2024-05-06T09:30:00'},  # conflita com o existente
+        {'professional_id': 2, 'scheduled_date': '2024-05-06T11:15:00'},  # conflita com o primeiro item
+        {'professional_id': 2, 'scheduled_date': 'amanhã'},
+        {'professional_id': 3, 'scheduled_date': '2024-05-06T11:00:00', 'status': 'confirmed'},
+    ]})
+    assert response.status_code == 207
+    data = response.get_json()
+    assert [r['result'] for r in data['results']] == ['ok', 'conflict', 'conflict', 'invalid', 'ok']
+    assert data['succeeded'] == 2 and data['failed'] == 3
+    created = data['results'][4]['booking']
+    assert set(created) == {'id', 'patient_id', 'professional_id', 'activity_id', 'scheduled_date', 'status', 'created_at', 'updated_at'}
+    assert created['status'] == 'confirmed'
+    assert client.get(f"/api/booking/{created['id']}", headers=auth_headers).status_code == 200
+
+def test_create_bookings_batch_rejects_empty_payload(client, auth_headers):
+    assert client.post('/api/booking/batch', headers=auth_headers, json={'bookings': []}).status_code == 400
+
+def test_update_bookings_status_batch(client, auth_headers):
+    created = client.post('/api/booking/batch', headers=auth_headers, json={'bookings': [
+        {'professional_id': 4, 'scheduled_date': '2024-06-03T09:00:00'},
+        {'professional_id': 4, 'scheduled_date': '2024-06-03T10:00:00'},
+    ]}).get_json()
+    first, second = (r['booking']['id'] for r in created['results'])
+
+    response = client.put('/api/booking/batch/status', headers=auth_headers, json={'updates': [
+        {'id': first, 'status': 'confirmed'},
+        {'id': second, 'status': 'cancelled'},
+        {'id': 999999, 'status': 'confirmed'},
+        {'id': first, 'status': 'desconhecido'},
+    ]})
+    assert response.status_code == 207
+    results = response.get_json()['results']
+    assert [r['result'] for r in results] == ['ok', 'ok', 'not_found', 'invalid']
+    assert results[0]['booking']['status'] == 'confirmed'
+    assert client.get(f'/api/booking/{second}', headers=auth_headers).get_json()['status'] == 'cancelled'
+
+    # Agendamentos de outro paciente não são encontrados
+    _, other_headers = create_user_headers('patient', 'other_patient@example.com')
+    response = client.put('/api/booking/batch/status', headers=other_headers, json={'updates': [
+        {'id': first, 'status': 'cancelled'}
+    ]})
+    assert response.get_json()['results'][0]['result'] == 'not_found'
+
+def test_admin_exports_bookings_as_ndjson_and_csv(client, auth_headers):
+    for day in (1, 2, 3):
+        client.post('/api/booking/', headers=auth_headers, json={
+            'professional_id': 5,
+            'scheduled_date': f'2024-08-0{day}T14:00:00'
+        })
+    _, admin_headers = create_user_headers('admin', 'admin@example.com')
+
+    response = client.get('/admin/bookings/export?from=2024-08-02T00:00:00&to=2024-09-01T00:00:00',
+                          headers=admin_headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [r['scheduled_date'] for r in records] == ['2024-08-02T14:00:00', '2024-08-03T14:00:00']
+    assert set(records[0]) == {'id', 'patient_id', 'professional_id', 'scheduled_date', 'status', 'created_at', 'updated_at'}
+
+    response = client.get('/admin/bookings/export?format=csv', headers=admin_headers)
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.mimetype == 'text/csv'
+    assert lines[0].startswith('id,patient_id,professional_id')
+    assert len(lines) == 4
+
+    assert client.get('/admin/bookings/export', headers=auth_headers).status_code == 403
+    assert client.get('/admin/bookings/export?format=xml', headers=admin_headers).status_code == 400
+
+def test_expiration_moves_past_pending_bookings_in_batches(client, auth_headers):
+    from src.utils.expiration import expire_stale_records
+
+    past = [
+        client.post('/api/booking/', headers=auth_headers, json={
+            'professional_id': 6,
+            'scheduled_date': f'2024-09-0{day}T08:00:00'
+        }).get_json()['id']
+        for day in range(1, 6)
+    ]
+    future = client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 6,
+        'scheduled_date': (datetime.utcnow() + timedelta(days=2)).replace(microsecond=0).isoformat()
+    }).get_json()['id']
+    client.put(f'/api/booking/{past[0]}', headers=auth_headers, json={'status': 'confirmed'})
+
+    config = dict(current_app.config, EXPIRATION_BATCH_SIZE=2, PROFESSIONAL_PENDING_MAX_AGE_DAYS=None)
+    metrics = expire_stale_records(db.engine, config)
+    assert metrics['bookings_expired'] == 4
+    assert metrics['batches'] == 3
+
+    statuses = {b['id']: b['status'] for b in client.get('/api/booking/?limit=100', headers=auth_headers).get_json()}
+    assert statuses[past[0]] == 'confirmed'
+    assert all(statuses[i] == 'expired' for i in past[1:])
+    assert statuses[future] == 'pending'
+    assert expire_stale_records(db.engine, config)['bookings_expired'] == 0
+
+def test_booking_rollups_follow_writes_and_rebuild(client, auth_headers):
+    from sqlalchemy import update
+    from src.models.booking_rollup import BookingDailyRollup
+    from src.utils.booking_rollups import catch_up_rollups, rebuild_rollups
+
+    _, admin_headers = create_user_headers('admin', 'admin@example.com')
+    ids = [client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': 7,
+        'scheduled_date': f'2024-11-0{day}T{hour:02d}:00:00'
+    }).get_json()['id'] for day, hour in ((4, 9), (4, 11), (5, 9))]
+    client.put(f'/api/booking/{ids[1]}', headers=auth_headers, json={'status': 'cancelled'})
+    client.put(f'/api/booking/{ids[2]}', headers=auth_headers, json={'scheduled_date': '2024-11-06T09:00:00'})
+    client.post('/api/booking/batch', headers=auth_headers, json={'bookings': [
+        {'professional_id': 8, 'scheduled_date': '2024-11-04T09:00:00'}
+    ]})
+
+    def stats(query):
+        response = client.get(f'/admin/stats/bookings?from=2024-11-01&to=2024-11-30&{query}', headers=admin_headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    by_day_status = stats('group_by=day,status')
+    assert by_day_status['rows'] == [
+        {'day': '2024-11-04', 'status': 'cancelled', 'count': 1},
+        {'day': '2024-11-04', 'status': 'pending', 'count': 2},
+        {'day': '2024-11-06', 'status': 'pending', 'count': 1},
+    ]
+    assert by_day_status['total'] == 4
+    assert stats('group_by=professional&status=pending')['rows'] == [
+        {'professional_id': 7, 'count': 2}, {'professional_id': 8, 'count': 1}
+    ]
+
+    client.delete(f'/api/booking/{ids[0]}', headers=auth_headers)
+    assert stats('group_by=status&professional_id=7')['rows'] == [
+        {'status': 'cancelled', 'count': 1}, {'status': 'pending', 'count': 1}
+    ]
+
+    # Escrita fora das rotas: a recuperação alinha a consolidação
+    db.session.execute(update(Booking).where(Booking.id == ids[2]).values(
+        status='confirmed', updated_at=datetime.utcnow()))
+    db.session.commit()
+    rebuild_rollups(db.engine, chunk_days=1, date_from=datetime(2024, 10, 1).date(), date_to=datetime(2024, 10, 2).date())
+    catch_up_rollups(db.engine)
+    assert stats('group_by=status&professional_id=7')['rows'] == [
+        {'status': 'cancelled', 'count': 1}, {'status': 'confirmed', 'count': 1}
+    ]
+
+    before = sorted((r.day, r.professional_id, r.status, r.booking_count) for r in BookingDailyRollup.query.all())
+    db.session.query(BookingDailyRollup).delete()
+    db.session.commit()
+    rebuild_rollups(db.engine, chunk_days=1)
+    db.session.expire_all()
+    assert sorted((r.day, r.professional_id, r.status, r.booking_count) for r in BookingDailyRollup.query.all()) == before
+
+    assert client.get('/admin/stats/bookings?from=2024-11-01', headers=admin_headers).status_code == 400
+    assert client.get('/admin/stats/bookings?from=2024-11-01&to=2024-11-30&group_by=patient',
+                      headers=admin_headers).status_code == 400
+
+def test_booking_rollups_count_each_booking_in_its_activity_category(client, auth_headers):
+    from src.models.category import Category
+    from src.models.professional import Professional, Activity
+    from src.models.professional_activity import ProfessionalActivity
+
+    _, admin_headers = create_user_headers('admin', 'admin-categories@example.com')
+    prof_user_id, _ = create_user_headers('professional', 'two-categories@example.com')
+    categories = [Category(name='Rollup Fisioterapia'), Category(name='Rollup Nutrição')]
+    db.session.add_all(categories)
+    db.session.flush()
+    activities = [Activity(name=f'Rollup atividade {c.id}', category_id=c.id) for c in categories]
+    professional = Professional(user_id=prof_user_id, document_number='ROLL001', diploma_file='d.pdf')
+    db.session.add_all(activities + [professional])
+    db.session.flush()
+    db.session.add_all([ProfessionalActivity(professional_id=professional.id, activity_id=a.id) for a in activities])
+    db.session.commit()
+    physio, nutrition = (c.id for c in categories)
+
+    for hour, activity in ((9, activities[0]), (11, activities[1]), (13, None)):
+        response = client.post('/api/booking/', headers=auth_headers, json={
+            'professional_id': professional.id,
+            'scheduled_date': f'2024-12-02T{hour:02d}:00:00',
+            'activity_id': activity.id if activity else None
+        })
+        assert response.status_code == 201
+    unoffered = Activity(name='Rollup atividade não oferecida')
+    db.session.add(unoffered)
+    db.session.commit()
+    assert client.post('/api/booking/', headers=auth_headers, json={
+        'professional_id': professional.id, 'scheduled_date': '2024-12-02T15:00:00', 'activity_id': unoffered.id
+    }).status_code == 400
+    batch = client.post('/api/booking/batch', headers=auth_headers, json={'bookings': [
+        {'professional_id': professional.id, 'scheduled_date': '2024-12-03T09:00:00', 'activity_id': unoffered.id},
+        {'professional_id': professional.id, 'scheduled_date': '2024-12-03T11:00:00', 'activity_id': activities[1].id},
+    ]}).get_json()
+    assert [item['result'] for item in batch['results']] == ['invalid', 'ok']
+
+    def stats(query):
+        response = client.get(f'/admin/stats/bookings?from=2024-12-01&to=2024-12-31&{query}', headers=admin_headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    expected = sorted([
+        {'category_id': None, 'count': 1}, {'category_id': physio, 'count': 1}, {'category_id': nutrition, 'count': 2}
+    ], key=lambda row: row['category_id'] or 0)
+    by_category = stats('group_by=category')
+    assert by_category['rows'] == expected
+    assert by_category['total'] == 4
+    assert stats(f'category_id={physio}')['total'] == 1
+
+    # Mudar as atividades oferecidas não move agendamentos já feitos entre categorias
+    ProfessionalActivity.query.filter_by(professional_id=professional.id, activity_id=activities[1].id).delete()
+    db.session.commit()
+    assert stats('group_by=category')['rows'] == expected
+    assert stats(f'category_id={nutrition}')['total'] == 2
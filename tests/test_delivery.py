@@ -0,0 +1,86 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from flask import current_app
+
+from src.models.user import User, db
+from src.models.professional import Professional
+from src.utils.delivery import upload_url
+
+def _token(user_id, user_type):
+    return jwt.encode({'user_id': user_id, 'user_type': user_type, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                      current_app.config['SECRET_KEY'], algorithm='HS256')
+
+def _create_user(email, user_type='patient'):
+    user = User(email=email, password='x', name='Usuário de teste', user_type=user_type)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def _signed_url(key, **kwargs):
+    with current_app.test_request_context():
+        return upload_url(key, **kwargs)
+
+def test_diplomas_are_served_only_through_signed_links(client, uploads, register_professional):
+    content = b'%PDF-1.4 diploma assinado'
+    assert register_professional(client, 'signed-owner@example.com', content).status_code == 201
+    assert register_professional(client, 'signed-other@example.com', b'outro').status_code == 201
+    owner = User.query.filter_by(email='signed-owner@example.com').first()
+    other = User.query.filter_by(email='signed-other@example.com').first()
+    admin = _create_user('signed-admin@example.com', 'admin')
+    professional = Professional.query.filter_by(user_id=owner.id).first()
+    diploma_path = f'/api/professional/{professional.id}/diploma'
+
+    # Só o admin e o próprio profissional recebem o link
+    owner_links = client.get(diploma_path, headers={'Authorization': f"Bearer {_token(owner.id, 'professional')}"})
+    assert owner_links.status_code == 200
+    admin_links = client.get(diploma_path, headers={'Authorization': f"Bearer {_token(admin.id, 'admin')}"})
+    assert admin_links.get_json()['diploma_url'] == owner_links.get_json()['diploma_url']
+    assert client.get(diploma_path, headers={'Authorization': f"Bearer {_token(other.id, 'professional')}"}).status_code == 403
+
+    url = owner_links.get_json()['diploma_url']
+    response = client.get(url)
+    assert response.status_code == 200 and response.data == content
+    assert 'private' in response.headers['Cache-Control']
+
+    # Assinatura adulterada, chave trocada ou link vencido
+    key = professional.diploma_file
+    assert client.get(url[:-1] + ('0' if url[-1] != '0' else '1')).status_code == 403
+    assert client.get(url.replace(key, Professional.query.filter_by(user_id=other.id).first().diploma_file)).status_code == 403
+    assert client.get(_signed_url(key, now=time.time() - 3600)).status_code == 403
+
+def test_static_routes_never_serve_uploads(client, tmp_path, monkeypatch):
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'uploads' / 'diploma.pdf').write_bytes(b'%PDF-1.4')
+    (tmp_path / 'pagina.html').write_text('<html></html>')
+    monkeypatch.setattr(current_app, 'static_folder', str(tmp_path))
+    assert client.get('/pagina.html').status_code == 200
+    assert client.get('/static/pagina.html').status_code == 200
+    assert client.get('/uploads/diploma.pdf').status_code == 404
+    assert client.get('/static/uploads/diploma.pdf').status_code == 404
+    assert client.get('/static/./uploads/diploma.pdf').status_code == 404
+
+@pytest.mark.parametrize('mode, header', [('x-accel', 'X-Accel-Redirect'), ('x-sendfile', 'X-Sendfile')])
+def test_authorized_files_are_handed_to_the_web_server(client, uploads, register_professional, mode, header):
+    assert register_professional(client, f'{mode}@example.com', b'%PDF-1.4 offload').status_code == 201
+    key = Professional.query.first().diploma_file
+    current_app.config['FILE_DELIVERY'] = mode
+    try:
+        response = client.get(_signed_url(key))
+        static = client.get('/index.html')
+        assert client.get(_signed_url(key)[:-1] + 'x').status_code == 403
+    finally:
+        current_app.config.pop('FILE_DELIVERY')
+    assert response.status_code == 200 and response.data == b''
+    assert response.mimetype == 'application/pdf'
+    assert 'private' in response.headers['Cache-Control']
+    assert static.data == b'' and static.mimetype == 'text/html'
+    if mode == 'x-accel':
+        assert response.headers[header] == f'/_protected/uploads/{key}'
+        assert static.headers[header] == '/_protected/static/index.html'
+    else:
+        assert response.headers[header] == os.path.abspath(uploads / key)
+        assert static.headers[header] == os.path.join(current_app.static_folder, 'index.html')
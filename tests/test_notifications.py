@@ -0,0 +1,177 @@
+import pytest
+import socketserver
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+
+from src.main import db
+from src.models.user import User
+from src.models.professional import Professional
+from src.models.outbox import OutboxMessage
+from src.utils.notifications import SMTPTransport
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo: aceita qualquer remetente e guarda as mensagens recebidas."""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 localhost SMTP de testes')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            if command in ('HELO', 'EHLO'):
+                self.reply('250 localhost')
+            elif command == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipients.append(line.split(':', 1)[1].strip(' <>'))
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    data_line = self.rfile.readline().decode()
+                    if data_line.rstrip('\r\n') == '.':
+                        break
+                    data.append(data_line)
+                self.server.messages.append({'to': recipients, 'data': ''.join(data)})
+                self.reply('250 OK')
+            else:
+                self.reply('250 OK')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _SMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def notification_pool():
+    pool = current_app.extensions['notification_pool']
+    yield pool
+    pool.transport = None
+
+
+@pytest.fixture
+def booking_parties(client):
+    patient = User(email='outbox_patient@example.com', password='x', name='Paciente Outbox', user_type='patient')
+    professional_user = User(email='outbox_prof@example.com', password='x', name='Profissional Outbox', user_type='professional')
+    db.session.add_all([patient, professional_user])
+    db.session.flush()
+    professional = Professional(user_id=professional_user.id, document_number='123', diploma_file='d.pdf', approval_status='approved')
+    db.session.add(professional)
+    db.session.commit()
+    return patient.id, professional.id
+
+
+def _headers(user_id):
+    import jwt
+    token = jwt.encode({'user_id': user_id, 'user_type': 'patient', 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       current_app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_booking_writes_outbox_and_pool_delivers_over_smtp(client, booking_parties, smtp_server, notification_pool):
+    patient_id, professional_id = booking_parties
+    response = client.post('/api/booking/', headers=_headers(patient_id), json={
+        'professional_id': professional_id,
+        'scheduled_date': '2024-10-07T09:00:00'
+    })
+    assert response.status_code == 201
+
+    # Gravadas no mesmo commit, mas nada foi entregue durante a requisição
+    messages = OutboxMessage.query.filter_by(booking_id=response.get_json()['id']).all()
+    assert sorted(m.recipient_role for m in messages) == ['patient', 'professional']
+    assert all(m.status == 'pending' for m in messages)
+    assert smtp_server.messages == []
+
+    notification_pool.transport = SMTPTransport('127.0.0.1', smtp_server.server_address[1])
+    assert notification_pool.drain() == 2
+    assert sorted(m['to'][0] for m in smtp_server.messages) == ['outbox_patient@example.com', 'outbox_prof@example.com']
+    db.session.expire_all()
+    assert all(m.status == 'sent' and m.sent_at for m in OutboxMessage.query.all())
+    assert notification_pool.drain() == 0
+
+
+def test_failed_delivery_is_retried_with_backoff(client, booking_parties, notification_pool):
+    patient_id, professional_id = booking_parties
+    client.post('/api/booking/', headers=_headers(patient_id), json={
+        'professional_id': professional_id,
+        'scheduled_date': '2024-10-08T09:00:00'
+    })
+
+    class BrokenTransport:
+        def send(self, message):
+            raise ConnectionRefusedError('SMTP indisponível')
+
+    notification_pool.transport = BrokenTransport()
+    assert notification_pool.drain() == 2
+    db.session.expire_all()
+    messages = OutboxMessage.query.all()
+    assert all(m.status == 'pending' and m.attempts == 1 for m in messages)
+    assert all(m.available_at > datetime.utcnow() and 'indisponível' in m.last_error for m in messages)
+    # Ainda no backoff: nada a entregar agora
+    assert notification_pool.drain() == 0
+
+    # Na última tentativa a mensagem é marcada como falha definitiva
+    current_app.config['NOTIFICATION_MAX_ATTEMPTS'] = 2
+    try:
+        OutboxMessage.query.update({'available_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        assert notification_pool.drain() == 2
+    finally:
+        current_app.config.pop('NOTIFICATION_MAX_ATTEMPTS')
+    db.session.expire_all()
+    assert all(m.status == 'failed' and m.attempts == 2 for m in OutboxMessage.query.all())
+
+
+def test_pool_starts_on_first_request_and_delivers_leftover_outbox(client, booking_parties, monkeypatch):
+    import time
+    from src.models.booking import Booking
+    from src.utils.notifications import NotificationWorkerPool
+
+    # Mensagens deixadas por um processo anterior: nenhum commit deste processo acorda o pool
+    patient_id, professional_id = booking_parties
+    booking = Booking(patient_id=patient_id, professional_id=professional_id, scheduled_date=datetime(2024, 10, 9, 9))
+    db.session.add(booking)
+    db.session.flush()
+    db.session.add_all([OutboxMessage(event_type='booking_created', booking_id=booking.id, recipient_role=role)
+                        for role in ('patient', 'professional')])
+    db.session.commit()
+
+    class RecordingTransport:
+        sent = []
+
+        def send(self, message):
+            self.sent.append(message.to)
+
+    app = current_app._get_current_object()
+    pool = NotificationWorkerPool(app, workers=1)
+    pool.transport = RecordingTransport()
+    monkeypatch.setitem(app.extensions, 'notification_pool', pool)
+    monkeypatch.setitem(app.config, 'TESTING', False)
+    try:
+        client.get('/')
+        deadline = time.monotonic() + 10
+        while pool.counters['sent'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+        for thread in pool._threads:
+            thread.join(5)
+    assert sorted(RecordingTransport.sent) == ['outbox_patient@example.com', 'outbox_prof@example.com']
@@ -0,0 +1,74 @@
+import io
+from datetime import datetime, timedelta
+
+import jwt
+from flask import current_app
+from PIL import Image
+
+from src.models.user import User, db
+from src.models.stored_file import StoredFile
+from src.utils.previews import get_preview_generator
+from src.utils.storage import get_storage
+
+def _token(user_id, user_type):
+    return jwt.encode({'user_id': user_id, 'user_type': user_type, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                      current_app.config['SECRET_KEY'], algorithm='HS256')
+
+def _admin_headers():
+    admin = User(email='previews-admin@example.com', password='x', name='Admin', user_type='admin')
+    db.session.add(admin)
+    db.session.commit()
+    return {'Authorization': f"Bearer {_token(admin.id, 'admin')}"}
+
+def _jpeg(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (30, 120, 200)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def test_pending_queue_serves_previews_once_generated(client, uploads, register_professional):
+    admin_headers = _admin_headers()
+    generator = get_preview_generator()
+
+    # Sem processamento, a fila aponta para o original
+    current_app.config['PREVIEW_ENABLED'] = False
+    try:
+        assert register_professional(client, 'preview1@example.com', _jpeg(2400, 1600), 'foto.jpg').status_code == 201
+    finally:
+        current_app.config.pop('PREVIEW_ENABLED')
+    [pending] = client.get('/admin/professionals/pending', headers=admin_headers).get_json()
+    assert pending['preview_ready'] is False
+    assert pending['preview_url'] == pending['thumbnail_url'] == pending['diploma_url']
+    assert pending['diploma_url'].startswith(f"/files/uploads/{pending['diploma_file']}?expires=")
+
+    # Um novo cadastro dispara o pool no commit
+    assert register_professional(client, 'preview2@example.com', _jpeg(1200, 3000), 'foto.jpg').status_code == 201
+    generator.wait(timeout=60)
+    assert generator.counters['failed'] == 0
+    pending = client.get('/admin/professionals/pending', headers=admin_headers).get_json()
+    ready = [item for item in pending if item['email'] == 'preview2@example.com'][0]
+    assert ready['preview_ready'] is True
+    assert ready['thumbnail_url'].startswith(f"/files/uploads/{ready['diploma_file']}.thumb.jpg?")
+    assert client.get(ready['thumbnail_url']).mimetype == 'image/jpeg'
+    with Image.open(uploads / f"{ready['diploma_file']}.thumb.jpg") as thumbnail:
+        assert max(thumbnail.size) == 256
+    with Image.open(uploads / f"{ready['diploma_file']}.preview.jpg") as preview:
+        assert preview.size == (410, 1024)
+
+def test_pending_queue_reads_preview_readiness_from_the_database(client, uploads, register_professional, monkeypatch):
+    admin_headers = _admin_headers()
+    generator = get_preview_generator()
+    for number in range(3):
+        photo = _jpeg(300 + number, 200)
+        assert register_professional(client, f'ready{number}@example.com', photo, 'foto.jpg').status_code == 201
+    generator.wait(timeout=60)
+    # Processos do pool sem fork: não herdam conexões nem locks do worker
+    assert generator._executor._mp_context.get_start_method() in ('forkserver', 'spawn')
+    assert StoredFile.query.filter(StoredFile.previews_ready_at.isnot(None)).count() == 3
+
+    # A fila não consulta o armazenamento (um HEAD por diploma no S3)
+    storage = get_storage()
+    def exists(key):
+        raise AssertionError(f'consulta ao armazenamento: {key}')
+    monkeypatch.setattr(storage, 'exists', exists)
+    pending = client.get('/admin/professionals/pending', headers=admin_headers).get_json()
+    assert [item['preview_ready'] for item in pending] == [True, True, True]
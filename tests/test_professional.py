@@ -1,27 +1,30 @@
 import pytest
 from flask import current_app
+from werkzeug.security import generate_password_hash
 from src.models.user import User, db
 from src.models.professional import Professional
+from src.models.booking import Booking
+from datetime import datetime
 
-@pytest.fixture(scope='module')
-def test_data_professional_profile(app_context):
+@pytest.fixture
+def test_data_professional_profile(client, app_context):
     with app_context:
         # Admin User for testing admin updates
         admin_user = User.query.filter_by(email='admin_prof_profile@test.com').first()
         if not admin_user:
-            admin_user = User(email='admin_prof_profile@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Admin ProfProfile', user_type='admin', approval_status='approved')
+            admin_user = User(email='admin_prof_profile@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Admin ProfProfile', user_type='admin')
             db.session.add(admin_user)
 
         # Professional User 1 (for self-update)
         prof_user1 = User.query.filter_by(email='prof1_profile@test.com').first()
         if not prof_user1:
-            prof_user1 = User(email='prof1_profile@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Prof1 Profile', user_type='professional', approval_status='approved')
+            prof_user1 = User(email='prof1_profile@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Prof1 Profile', user_type='professional')
             db.session.add(prof_user1)
         
         # Professional User 2 (for admin to update, and to test unauthorized update by prof1)
         prof_user2 = User.query.filter_by(email='prof2_profile@test.com').first()
         if not prof_user2:
-            prof_user2 = User(email='prof2_profile@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Prof2 Profile', user_type='professional', approval_status='pending') # Starts as pending
+            prof_user2 = User(email='prof2_profile@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Prof2 Profile', user_type='professional') # Starts as pending
             db.session.add(prof_user2)
 
         db.session.flush()
@@ -45,7 +48,7 @@ def test_data_professional_profile(app_context):
             "professional2_id": professional2.id,
         }
 
-@pytest.fixture(scope='module')
+@pytest.fixture
 def auth_headers_professional_profile(client, test_data_professional_profile):
     # Admin Login
     admin_login_res = client.post('/api/auth/login', json={'email': 'admin_prof_profile@test.com', 'password': current_app.config['TEST_USER_PASSWORD']})
@@ -94,13 +97,10 @@ def test_admin_updates_professional_bio(client, auth_headers_professional_profil
 
 def test_admin_updates_professional_approval_status(client, auth_headers_professional_profile, test_data_professional_profile):
     prof2_id = test_data_professional_profile['professional2_id']
-    prof2_user_id = test_data_professional_profile['prof_user2_id']
 
     # Initial check (optional, but good for sanity)
     prof_before = Professional.query.get(prof2_id)
     assert prof_before.approval_status == 'pending'
-    user_before = User.query.get(prof2_user_id)
-    assert user_before.approval_status == 'pending'
 
 
     response = client.put(f'/api/professional/{prof2_id}', headers=auth_headers_professional_profile['admin'], json={
@@ -139,17 +139,95 @@ def test_professional_attempts_to_update_another_professionals_profile(client, a
     assert response.json['error'] == 'Não autorizado a atualizar este perfil'
 
 
-@pytest.fixture(scope="module", autouse=True)
-def cleanup_professional_profile_test_data(app_context, test_data_professional_profile):
-    yield # allow tests to run
-    with app_context:
-        emails_to_delete = [
-            'admin_prof_profile@test.com',
-            'prof1_profile@test.com',
-            'prof2_profile@test.com'
+# --- Availability Tests ---
+
+def test_professional_sets_own_availability(client, auth_headers_professional_profile, test_data_professional_profile):
+    prof1_id = test_data_professional_profile['professional1_id']
+    response = client.put(f'/api/professional/{prof1_id}/availability', headers=auth_headers_professional_profile['prof1'], json={
+        'windows': [
+            {'weekday': 1, 'start': '08:00', 'end': '12:00'},
+            {'weekday': 1, 'start': '12:00', 'end': '18:00'}
+        ],
+        'exceptions': [
+            {'starts_at': '2030-01-01T00:00:00', 'ends_at': '2030-01-02T00:00:00', 'reason': 'Feriado'}
         ]
-        users = User.query.filter(User.email.in_(emails_to_delete)).all()
-        for user in users:
-            Professional.query.filter_by(user_id=user.id).delete()
-            db.session.delete(user)
+    })
+    assert response.status_code == 200
+
+    response = client.get(f'/api/professional/{prof1_id}/availability', headers=auth_headers_professional_profile['prof1'])
+    assert response.status_code == 200
+    # Janelas adjacentes são unidas em uma só
+    assert response.json['windows'] == [{'id': response.json['windows'][0]['id'], 'weekday': 1, 'start': '08:00', 'end': '18:00'}]
+    assert response.json['exceptions'][0]['reason'] == 'Feriado'
+
+def test_windows_across_midnight_round_trip(client, auth_headers_professional_profile, test_data_professional_profile):
+    prof1_id = test_data_professional_profile['professional1_id']
+    url = f'/api/professional/{prof1_id}/availability'
+    headers = auth_headers_professional_profile['prof1']
+    windows = [
+        {'weekday': 0, 'start': '20:00', 'end': '24:00'},
+        {'weekday': 1, 'start': '00:00', 'end': '08:00'},
+        {'weekday': 6, 'start': '22:00', 'end': '24:00'}
+    ]
+    assert client.put(url, headers=headers, json={'windows': windows}).status_code == 200
+
+    # Guardadas numa linha só, devolvidas partidas por dia
+    returned = client.get(url, headers=headers).json['windows']
+    assert returned[0]['id'] == returned[1]['id']
+    assert [{k: w[k] for k in ('weekday', 'start', 'end')} for w in returned] == windows
+
+    # O que o GET devolve é aceito de volta pelo PUT, sem alterar a agenda
+    assert client.put(url, headers=headers, json={'windows': returned}).status_code == 200
+    assert [{k: w[k] for k in ('weekday', 'start', 'end')} for w in client.get(url, headers=headers).json['windows']] == windows
+
+def test_professional_cannot_set_other_availability(client, auth_headers_professional_profile, test_data_professional_profile):
+    prof2_id = test_data_professional_profile['professional2_id']
+    response = client.put(f'/api/professional/{prof2_id}/availability', headers=auth_headers_professional_profile['prof1'], json={
+        'windows': [{'weekday': 0, 'start': '08:00', 'end': '12:00'}]
+    })
+    assert response.status_code == 403
+
+def test_availability_rejects_invalid_window(client, auth_headers_professional_profile, test_data_professional_profile):
+    prof1_id = test_data_professional_profile['professional1_id']
+    response = client.put(f'/api/professional/{prof1_id}/availability', headers=auth_headers_professional_profile['prof1'], json={
+        'windows': [{'weekday': 1, 'start': '18:00', 'end': '08:00'}]
+    })
+    assert response.status_code == 400
+
+def test_professional_free_slots(client, auth_headers_professional_profile, test_data_professional_profile, app_context):
+    prof1_id = test_data_professional_profile['professional1_id']
+    response = client.put(f'/api/professional/{prof1_id}/availability', headers=auth_headers_professional_profile['prof1'], json={
+        'windows': [{'weekday': 1, 'start': '08:00', 'end': '11:00'}],
+        'exceptions': []
+    })
+    assert response.status_code == 200
+
+    with app_context:
+        # 2030-01-01 é uma terça-feira; o agendamento das 09:00 ocupa 09:00-10:00
+        booking = Booking(patient_id=1, professional_id=prof1_id, scheduled_date=datetime(2030, 1, 1, 9, 0), status='pending')
+        db.session.add(booking)
         db.session.commit()
+        booking_id = booking.id
+
+    try:
+        response = client.get(f'/api/professional/{prof1_id}/slots?from=2030-01-01T00:00:00&to=2030-01-08T00:00:00&duration=60',
+                              headers=auth_headers_professional_profile['prof1'])
+        assert response.status_code == 200
+        assert response.json['slots'] == [
+            {'start': '2030-01-01T08:00:00', 'end': '2030-01-01T09:00:00'},
+            {'start': '2030-01-01T10:00:00', 'end': '2030-01-01T11:00:00'},
+        ]
+
+        # Com offset: convertido para UTC, o mesmo intervalo
+        response = client.get(f'/api/professional/{prof1_id}/slots?from=2029-12-31T21:00:00-03:00&to=2030-01-07T21:00:00-03:00&duration=60',
+                              headers=auth_headers_professional_profile['prof1'])
+        assert response.status_code == 200
+        assert [slot['start'] for slot in response.json['slots']] == ['2030-01-01T08:00:00', '2030-01-01T10:00:00']
+
+        response = client.get(f'/api/professional/{prof1_id}/slots?from=2030-01-01T00:00:00&to=2031-01-01T00:00:00',
+                              headers=auth_headers_professional_profile['prof1'])
+        assert response.status_code == 400
+    finally:
+        with app_context:
+            db.session.delete(Booking.query.get(booking_id))
+            db.session.commit()
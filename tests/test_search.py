@@ -1,28 +1,35 @@
 import pytest
 from flask import current_app
+from werkzeug.security import generate_password_hash
 from src.models.user import User, db
 from src.models.professional import Professional, Activity
 from src.models.category import Category
 from src.models.professional_activity import ProfessionalActivity
+from src.models.availability import AvailabilityWindow
+from src.models.booking import Booking
+import time
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.utils.search_index import get_search_index, check_consistency
 
-@pytest.fixture(scope='module')
-def test_data_search(app_context):
+@pytest.fixture
+def test_data_search(client, app_context):
     with app_context:
         # Users
         search_user = User.query.filter_by(email='search_user_main@test.com').first()
         if not search_user: # For auth header if needed by some tests, though many search routes are public
-            search_user = User(email='search_user_main@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Search User Main', user_type='patient', approval_status='approved')
+            search_user = User(email='search_user_main@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Search User Main', user_type='patient')
             db.session.add(search_user)
 
         prof_user_search1 = User.query.filter_by(email='prof_search1@test.com').first()
         if not prof_user_search1:
-            prof_user_search1 = User(email='prof_search1@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Search Prof One', user_type='professional', approval_status='approved')
+            prof_user_search1 = User(email='prof_search1@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Search Prof One', user_type='professional')
             db.session.add(prof_user_search1)
 
         prof_user_search2 = User.query.filter_by(email='prof_search2@test.com').first()
         if not prof_user_search2:
-            prof_user_search2 = User(email='prof_search2@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Search Prof Two', user_type='professional', approval_status='approved')
+            prof_user_search2 = User(email='prof_search2@test.com', password=generate_password_hash(current_app.config['TEST_USER_PASSWORD']), name='Search Prof Two', user_type='professional')
             db.session.add(prof_user_search2)
         
         db.session.flush()
@@ -98,7 +105,7 @@ def test_data_search(app_context):
             "search_user_email": search_user.email
         }
 
-@pytest.fixture(scope='module')
+@pytest.fixture
 def auth_headers_search(client, test_data_search):
     # This token is for routes that might still be protected, though many search routes are public.
     login_res = client.post('/api/auth/login', json={'email': test_data_search['search_user_email'], 'password': current_app.config['TEST_USER_PASSWORD']})
@@ -174,9 +181,311 @@ def test_search_professional_response_structure(client, auth_headers_search, tes
         assert activity_detail['activity_name'] == test_data_search['activity_cardio_name']
 
 
+def test_search_professionals_by_name_ignores_case_and_accents(client, auth_headers_search, test_data_search, app_context):
+    with app_context:
+        user = User(email='prof_search_accent@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='João Conceição', user_type='professional')
+        db.session.add(user)
+        db.session.flush()
+        prof = Professional(user_id=user.id, document_number='SRPS003', diploma_file='srps3.pdf', approval_status='approved')
+        db.session.add(prof)
+        db.session.commit()
+        prof_id = prof.id
+
+        try:
+            response = client.get('/api/search/professionals?name=JOAO conceicao', headers=auth_headers_search)
+            assert response.status_code == 200
+            assert [p['id'] for p in response.json] == [prof_id]
+        finally:
+            db.session.delete(User.query.get(user.id))
+            db.session.commit()
+
+def test_search_professionals_name_wildcards_are_literal(client, auth_headers_search, test_data_search):
+    response = client.get('/api/search/professionals?name=%25', headers=auth_headers_search)
+    assert response.status_code == 200
+    assert response.json == []
+
+def test_search_professionals_keyset_pagination(client, auth_headers_search, test_data_search):
+    full = client.get('/api/search/professionals', headers=auth_headers_search)
+    expected_ids = [prof['id'] for prof in full.json]
+
+    seen_ids = []
+    cursor = None
+    while True:
+        url = '/api/search/professionals?limit=1'
+        if cursor:
+            url += f'&cursor={cursor}'
+        response = client.get(url, headers=auth_headers_search)
+        assert response.status_code == 200
+        assert len(response.json) <= 1
+        seen_ids.extend(prof['id'] for prof in response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+
+    assert seen_ids == expected_ids
+
+def test_search_professionals_invalid_pagination(client, auth_headers_search):
+    assert client.get('/api/search/professionals?cursor=invalido', headers=auth_headers_search).status_code == 400
+    assert client.get('/api/search/professionals?limit=0', headers=auth_headers_search).status_code == 400
+
+def test_search_professionals_in_sql_without_the_index(client, auth_headers_search, test_data_search, app_context, monkeypatch):
+    from src.utils import full_text
+    monkeypatch.delitem(current_app.extensions, 'search_index')
+    prof = db.session.get(Professional, test_data_search['prof1_id'])
+    prof.bio = 'Avaliação física e reabilitação.'
+    db.session.commit()
+
+    # Palavras-chave comparadas com a bio normalizada: acentos e maiúsculas não importam
+    for keywords in ('avaliacao', 'Avaliação', 'fisica', 'FÍSICA reabilitacao'):
+        response = client.get(f'/api/search/professionals?keywords={keywords}', headers=auth_headers_search)
+        assert response.status_code == 200
+        assert [p['id'] for p in response.json] == [test_data_search['prof1_id']], keywords
+
+    # Sem busca textual nativa, `q` cai no mesmo filtro
+    monkeypatch.setattr(full_text, 'is_supported', lambda dialect_name: False)
+    response = client.get('/api/search/professionals?q=avaliação fisica', headers=auth_headers_search)
+    assert [p['id'] for p in response.json] == [test_data_search['prof1_id']]
+
+    # Nome e paginação por chave também saem do SQL
+    response = client.get('/api/search/professionals?name=search prof', headers=auth_headers_search)
+    expected_ids = sorted([test_data_search['prof1_id'], test_data_search['prof2_id']])
+    assert [p['id'] for p in response.json] == expected_ids
+    first = client.get('/api/search/professionals?name=search prof&limit=1', headers=auth_headers_search)
+    assert [p['id'] for p in first.json] == expected_ids[:1]
+    cursor = first.headers['X-Next-Cursor']
+    second = client.get(f'/api/search/professionals?name=search prof&limit=1&cursor={cursor}', headers=auth_headers_search)
+    assert [p['id'] for p in second.json] == expected_ids[1:]
+    assert 'X-Next-Cursor' not in second.headers
+
+@pytest.mark.parametrize('use_index', [True, False])
+def test_name_and_keywords_match_substrings_with_or_without_the_index(client, auth_headers_search, test_data_search, app_context, monkeypatch, use_index):
+    if not use_index:
+        monkeypatch.delitem(current_app.extensions, 'search_index')
+    prof1, prof2 = test_data_search['prof1_id'], test_data_search['prof2_id']
+    # Mesmo resultado nos dois caminhos: substring do texto normalizado, como o LIKE '%termo%'
+    cases = {
+        'name=prof': [prof1, prof2],
+        'name=earch': [prof1, prof2],
+        'name=ne': [prof1],
+        'name=prof one': [prof1],
+        'name=one prof': [],
+        'keywords=ardiolog': [prof1],
+        'keywords=logist': [prof1, prof2],
+        'keywords=generalist. neuro': [prof2],
+        'keywords=st.': [prof1, prof2],
+        'name=%25': [],
+    }
+    for query, expected in cases.items():
+        response = client.get(f'/api/search/professionals?{query}', headers=auth_headers_search)
+        assert response.status_code == 200
+        assert [p['id'] for p in response.json] == sorted(expected), query
+
+def test_search_index_follows_approval_and_deletion(client, auth_headers_search, test_data_search, app_context):
+    with app_context:
+        user = User(email='prof_search_index@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Índice Pendente', user_type='professional')
+        db.session.add(user)
+        db.session.flush()
+        prof = Professional(user_id=user.id, document_number='SRPS004', diploma_file='srps4.pdf', bio='Fisioterapia domiciliar para idosos', approval_status='pending')
+        db.session.add(prof)
+        db.session.commit()
+        prof_id, user_id = prof.id, user.id
+
+        response = client.get('/api/search/professionals?name=indice', headers=auth_headers_search)
+        assert response.json == []
+
+        prof = Professional.query.get(prof_id)
+        prof.approval_status = 'approved'
+        db.session.commit()
+
+        response = client.get('/api/search/professionals?name=indice&keywords=idosos', headers=auth_headers_search)
+        assert [p['id'] for p in response.json] == [prof_id]
+
+        db.session.delete(User.query.get(user_id))
+        db.session.commit()
+
+        response = client.get('/api/search/professionals?name=indice', headers=auth_headers_search)
+        assert response.json == []
+
+def test_search_index_consistency_with_database(client, auth_headers_search, test_data_search, app_context):
+    with app_context:
+        index = get_search_index()
+        assert check_consistency(index) == {'missing': [], 'extra': [], 'stale': []}
+
+        index.remove(test_data_search['prof1_id'])
+        assert check_consistency(index)['missing'] == [test_data_search['prof1_id']]
+
+        with Session(db.engine) as session:
+            index.build(session)
+        assert check_consistency(index) == {'missing': [], 'extra': [], 'stale': []}
+
+def test_stale_search_index_is_rebuilt_once_in_the_background(client, test_data_search, monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    index = get_search_index()
+    builds = []
+    release = threading.Event()
+    original_build = index.build
+
+    def slow_build(session):
+        builds.append(threading.current_thread().name)
+        release.wait(timeout=10)
+        original_build(session)
+    monkeypatch.setattr(index, 'build', slow_build)
+    monkeypatch.setitem(current_app.config, 'SEARCH_INDEX_REFRESH_SECONDS', 1)
+    index.built_at -= 60
+
+    app = current_app._get_current_object()
+
+    def search():
+        with app.app_context():
+            return get_search_index().search(category=test_data_search['category_cardio_name'])
+    # Requisições simultâneas respondem com o índice atual enquanto uma única thread reconstrói
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: search(), range(8)))
+    assert results == [[test_data_search['prof1_id']]] * 8
+    assert builds == ['search-index-refresh']
+
+    release.set()
+    with index._build_lock:
+        pass
+    assert index.built_at > time.monotonic() - 5
+
+def test_catalog_changes_update_only_affected_professionals(client, test_data_search, monkeypatch):
+    index = get_search_index()
+    monkeypatch.setattr(index, 'build', lambda session: pytest.fail('reconstrução completa'))
+    category = Category.query.filter_by(name=test_data_search['category_cardio_name']).first()
+    category.name = 'Cardiologia Renomeada'
+    db.session.commit()
+    assert index.search(category='cardiologia renomeada') == [test_data_search['prof1_id']]
+    assert index.search(category=test_data_search['category_cardio_name']) == []
+
+    activity = db.session.get(Activity, test_data_search['activity_neuro_id'])
+    activity.category_id = category.id
+    db.session.commit()
+    assert index.search(category='Cardiologia Renomeada') == sorted([test_data_search['prof1_id'], test_data_search['prof2_id']])
+    assert check_consistency(index) == {'missing': [], 'extra': [], 'stale': []}
+
+def test_search_professionals_full_text_ranked(client, auth_headers_search, test_data_search, app_context):
+    with app_context:
+        user = User(email='prof_search_fts@test.com', password=current_app.config['TEST_USER_PASSWORD'], name='Full Text Prof', user_type='professional')
+        db.session.add(user)
+        db.session.flush()
+        prof = Professional(user_id=user.id, document_number='SRPS005', diploma_file='srps5.pdf', bio='Fisioterapia domiciliar para idosos acamados', approval_status='approved')
+        db.session.add(prof)
+        db.session.flush()
+        db.session.add(ProfessionalActivity(professional_id=prof.id, activity_id=test_data_search['activity_general_id'], description='Atendimento em domicílio'))
+        db.session.commit()
+        prof_id, user_id = prof.id, user.id
+
+        try:
+            response = client.get('/api/search/professionals?q=fisioterapia domiciliar idosos', headers=auth_headers_search)
+            assert response.status_code == 200
+            assert [p['id'] for p in response.json] == [prof_id]
+
+            # Descrição da atividade do profissional também é indexada, sem acentos
+            response = client.get('/api/search/professionals?q=domicilio', headers=auth_headers_search)
+            assert prof_id in [p['id'] for p in response.json]
+
+            # Descrição global da atividade (General checkup)
+            response = client.get('/api/search/professionals?q=checkup', headers=auth_headers_search)
+            assert {prof_id, test_data_search['prof2_id']} <= {p['id'] for p in response.json}
+        finally:
+            db.session.delete(User.query.get(user_id))
+            db.session.commit()
+
+        response = client.get('/api/search/professionals?q=acamados', headers=auth_headers_search)
+        assert response.json == []
+
+def test_search_professionals_available_at(client, auth_headers_search, test_data_search, app_context):
+    with app_context:
+        # Prof1 atende às terças das 08:00 às 18:00; Prof2 às terças das 13:00 às 15:00
+        db.session.add(AvailabilityWindow(professional_id=test_data_search['prof1_id'], start_week_minute=1440 + 8 * 60, end_week_minute=1440 + 18 * 60))
+        db.session.add(AvailabilityWindow(professional_id=test_data_search['prof2_id'], start_week_minute=1440 + 13 * 60, end_week_minute=1440 + 15 * 60))
+        # Prof1 já tem um agendamento às 14:00 de 2030-01-01 (uma terça-feira)
+        booking = Booking(patient_id=1, professional_id=test_data_search['prof1_id'], scheduled_date=datetime(2030, 1, 1, 14, 0), status='confirmed')
+        db.session.add(booking)
+        db.session.commit()
+
+        try:
+            response = client.get('/api/search/professionals?available_at=2030-01-01T14:00:00', headers=auth_headers_search)
+            assert response.status_code == 200
+            assert [p['id'] for p in response.json] == [test_data_search['prof2_id']]
+            # 11:00 em UTC-3 são 14:00 UTC
+            response = client.get('/api/search/professionals?available_at=2030-01-01T11:00:00-03:00', headers=auth_headers_search)
+            assert response.status_code == 200
+            assert [p['id'] for p in response.json] == [test_data_search['prof2_id']]
+
+            response = client.get('/api/search/professionals?available_at=2030-01-01T09:00:00&duration=30', headers=auth_headers_search)
+            assert [p['id'] for p in response.json] == [test_data_search['prof1_id']]
+
+            # Quarta-feira: ninguém atende
+            response = client.get('/api/search/professionals?available_at=2030-01-02T09:00:00', headers=auth_headers_search)
+            assert response.json == []
+
+            response = client.get('/api/search/professionals?available_at=amanha', headers=auth_headers_search)
+            assert response.status_code == 400
+        finally:
+            db.session.delete(booking)
+            AvailabilityWindow.query.filter(AvailabilityWindow.professional_id.in_([
+                test_data_search['prof1_id'], test_data_search['prof2_id']
+            ])).delete()
+            db.session.commit()
+
+def _count_statements(fn):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return len(statements)
+
+def test_search_professionals_statement_count_is_constant(client, auth_headers_search, test_data_search, app_context):
+    def do_search():
+        response = client.get('/api/search/professionals', headers=auth_headers_search)
+        assert response.status_code == 200
+
+    with app_context:
+        # Aquece o índice e o cache de principais, que só consultam o banco no primeiro uso
+        do_search()
+        baseline = _count_statements(do_search)
+
+        # Adiciona mais profissionais com atividades e categoria; o número de consultas não deve crescer
+        extra_emails = [f'prof_search_bulk{i}@test.com' for i in range(10)]
+        for email in extra_emails:
+            user = User(email=email, password=current_app.config['TEST_USER_PASSWORD'], name=f'Bulk {email}', user_type='professional')
+            db.session.add(user)
+            db.session.flush()
+            prof = Professional(user_id=user.id, document_number='BULK', diploma_file='bulk.pdf', approval_status='approved')
+            db.session.add(prof)
+            db.session.flush()
+            db.session.add(ProfessionalActivity(professional_id=prof.id, activity_id=test_data_search['activity_cardio_id']))
+            db.session.add(ProfessionalActivity(professional_id=prof.id, activity_id=test_data_search['activity_neuro_id']))
+        db.session.commit()
+
+        try:
+            assert _count_statements(do_search) == baseline
+        finally:
+            bulk_users = User.query.filter(User.email.in_(extra_emails)).all()
+            for user in bulk_users:
+                db.session.delete(user)
+            db.session.commit()
+
+def test_get_professional_details_statement_count(client, auth_headers_search, test_data_search, app_context):
+    def do_get():
+        response = client.get(f"/api/search/professional/{test_data_search['prof2_id']}", headers=auth_headers_search)
+        assert response.status_code == 200
+
+    with app_context:
+        do_get()
+        # Profissional + usuário em uma consulta, atividades/atividade/categoria em outra
+        assert _count_statements(do_get) == 2
+
 # --- Test List Global Activities (Public) ---
-def test_list_global_activities_public(client, test_data_search): # No auth_headers
-    response = client.get('/api/search/activities')
+def test_list_global_activities_public(client, auth_headers_search, test_data_search):
+    response = client.get('/api/search/activities', headers=auth_headers_search)
     assert response.status_code == 200
     data = response.json
     assert isinstance(data, list)
@@ -189,8 +498,8 @@ def test_list_global_activities_public(client, test_data_search): # No auth_head
     assert found_general
 
 # --- Test List Categories (Public) ---
-def test_list_categories_public(client, test_data_search): # No auth_headers
-    response = client.get('/api/search/categories')
+def test_list_categories_public(client, auth_headers_search, test_data_search):
+    response = client.get('/api/search/categories', headers=auth_headers_search)
     assert response.status_code == 200
     data = response.json
     assert isinstance(data, list)
@@ -201,6 +510,16 @@ def test_list_categories_public(client, test_data_search): # No auth_headers
     found_neuro_cat = any(cat['name'] == test_data_search['category_neuro_name'] for cat in data)
     assert found_neuro_cat
 
+def test_list_categories_etag_not_modified(client, auth_headers_search, test_data_search):
+    first = client.get('/api/search/categories', headers=auth_headers_search)
+    assert first.status_code == 200
+    etag = first.headers.get('ETag')
+    assert etag and not etag.startswith('W/')
+
+    second = client.get('/api/search/categories', headers={**auth_headers_search, 'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+
 # --- Test Get Professional Details (Public or Protected based on final decision) ---
 # Assuming this route is protected as per original test file structure
 def test_get_professional_details_search(client, auth_headers_search, test_data_search):
@@ -219,44 +538,3 @@ def test_get_professional_details_not_found(client, auth_headers_search):
     assert response.status_code == 404
     assert 'error' in response.json
     assert 'Profissional não encontrado' in response.json['error']
-
-
-@pytest.fixture(scope="module", autouse=True)
-def cleanup_search_test_data(app_context, test_data_search):
-    yield # allow tests to run
-    with app_context:
-        # Delete ProfessionalActivities
-        # Need to be careful here, if other tests created PAs for these professionals/activities
-        # This cleanup is primarily for PAs created *within* test_data_search setup.
-        # A more robust way would be to store IDs of created PAs in test_data_search and delete those.
-        # For now, let's assume this is okay, or rely on cascading deletes if configured.
-        ProfessionalActivity.query.filter(ProfessionalActivity.activity_id.in_([
-            test_data_search['activity_cardio_id'], 
-            test_data_search['activity_neuro_id'],
-            test_data_search['activity_general_id']
-        ])).delete()
-
-        # Delete Professionals
-        Professional.query.filter(Professional.id.in_([test_data_search['prof1_id'], test_data_search['prof2_id']])).delete()
-        
-        # Delete Users
-        User.query.filter(User.email.in_([
-            test_data_search['search_user_email'], 
-            'prof_search1@test.com', 
-            'prof_search2@test.com'
-        ])).delete()
-        
-        # Delete Activities
-        Activity.query.filter(Activity.id.in_([
-            test_data_search['activity_cardio_id'], 
-            test_data_search['activity_neuro_id'],
-            test_data_search['activity_general_id']
-        ])).delete()
-        
-        # Delete Categories
-        Category.query.filter(Category.name.in_([
-            test_data_search['category_cardio_name'], 
-            test_data_search['category_neuro_name']
-        ])).delete()
-        
-        db.session.commit()
@@ -0,0 +1,93 @@
+import io
+import urllib.error
+import urllib.request
+
+import pytest
+from flask import current_app
+from PIL import Image
+
+from src.models.professional import Professional
+from src.utils.delivery import upload_url
+from src.utils.previews import get_preview_generator
+from src.utils.s3_standin import S3StandIn
+from src.utils.storage import S3Storage, StorageError
+
+def _signed_url(key):
+    with current_app.test_request_context():
+        return upload_url(key)
+
+def _jpeg(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (30, 120, 200)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+@pytest.fixture
+def s3_uploads(app_context, tmp_path):
+    standin = S3StandIn(str(tmp_path / 's3'), 'chave', 'segredo', min_part_size=64 * 1024)
+    endpoint = standin.start()
+    current_app.config['UPLOAD_SPOOL_FOLDER'] = str(tmp_path / 'spool')
+    previous = current_app.extensions['upload_storage']
+    # Partes pequenas para exercitar o multipart com arquivos de teste
+    current_app.extensions['upload_storage'] = S3Storage(
+        endpoint, 'diplomas', 'chave', 'segredo', prefix='uploads/',
+        multipart_threshold=128 * 1024, part_size=64 * 1024, chunk_size=16 * 1024
+    )
+    yield standin
+    current_app.extensions['upload_storage'] = previous
+    current_app.config.pop('UPLOAD_SPOOL_FOLDER')
+    standin.stop()
+
+def test_s3_driver_streams_multipart_uploads_and_ranges(client, s3_uploads, register_professional, tmp_path):
+    content = bytes(range(256)) * 1000  # 256 KB: quatro partes de 64 KB
+    assert register_professional(client, 's3@example.com', content).status_code == 201
+    key = Professional.query.first().diploma_file
+    assert (tmp_path / 's3' / 'diplomas' / 'objects' / 'uploads' / key).read_bytes() == content
+    assert s3_uploads.requests['upload_part'] == 4 and s3_uploads.requests['complete_multipart'] == 1
+    assert list((tmp_path / 'spool').iterdir()) == []
+
+    # O mesmo conteúdo não é enviado de novo
+    assert register_professional(client, 's3-dup@example.com', content).status_code == 201
+    assert s3_uploads.requests['upload_part'] == 4
+
+    url = _signed_url(key)
+    response = client.get(url)
+    assert response.status_code == 200 and response.data == content
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+    partial = client.get(url, headers={'Range': 'bytes=1000-1999'})
+    assert partial.status_code == 206
+    assert partial.data == content[1000:2000]
+    assert partial.headers['Content-Range'] == f'bytes 1000-1999/{len(content)}'
+    assert client.get(url, headers={'Range': 'bytes=999999-'}).status_code == 416
+    assert client.get(_signed_url('ab/inexistente.pdf')).status_code == 404
+
+    # As pré-visualizações também são lidas e gravadas no bucket, pelos processos do pool
+    assert register_professional(client, 's3-photo@example.com', _jpeg(800, 600), 'foto.jpg').status_code == 201
+    get_preview_generator().wait(timeout=60)
+    photo = Professional.query.filter(Professional.diploma_file.like('%.jpg')).first().diploma_file
+    assert (tmp_path / 's3' / 'diplomas' / 'objects' / 'uploads' / f'{photo}.thumb.jpg').exists()
+
+def test_s3_delivery_redirects_to_presigned_urls(client, s3_uploads, register_professional):
+    content = b'%PDF-1.4 diploma no bucket'
+    assert register_professional(client, 's3-redirect@example.com', content).status_code == 201
+    key = Professional.query.first().diploma_file
+    current_app.config['FILE_DELIVERY'] = 'x-accel'
+    try:
+        response = client.get(_signed_url(key))
+    finally:
+        current_app.config.pop('FILE_DELIVERY')
+    assert response.status_code == 302
+    location = response.headers['Location']
+    assert 'X-Amz-Signature=' in location and 'X-Amz-Expires=' in location
+    with urllib.request.urlopen(location) as presigned:
+        assert presigned.read() == content
+    with pytest.raises(urllib.error.HTTPError, match='403'):
+        urllib.request.urlopen(location.replace('X-Amz-Expires=', 'X-Amz-Expires=9'))
+
+def test_s3_standin_rejects_bad_signatures(s3_uploads, tmp_path):
+    endpoint = f'http://{current_app.extensions["upload_storage"].host}'
+    intruder = S3Storage(endpoint, 'diplomas', 'chave', 'outro-segredo')
+    path = tmp_path / 'arquivo.txt'
+    path.write_bytes(b'x')
+    with pytest.raises(StorageError, match='403'):
+        intruder.put_file('arquivo.txt', str(path))
@@ -0,0 +1,59 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from src.models.user import User, db
+from src.models.professional import Professional
+from src.models.stored_file import StoredFile
+from src.utils.storage import get_storage
+from src.utils.uploads import collect_garbage
+
+def test_identical_diplomas_are_stored_once(client, uploads, register_professional):
+    content = b'%PDF-1.4 diploma' * 10000
+    assert register_professional(client, 'upload1@example.com', content).status_code == 201
+    assert register_professional(client, 'upload2@example.com', content).status_code == 201
+
+    keys = {professional.diploma_file for professional in Professional.query.all()}
+    assert len(keys) == 1
+    key = keys.pop()
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert key == f'{sha256[:2]}/{sha256}.pdf'
+    assert (uploads / key).read_bytes() == content
+    assert StoredFile.query.get(key).ref_count == 2
+    assert list((uploads / '.incoming').iterdir()) == []
+
+    db.session.delete(Professional.query.first())
+    db.session.commit()
+    assert StoredFile.query.get(key).ref_count == 1
+
+def test_oversized_diploma_is_rejected_while_streaming(client, uploads, register_professional):
+    current_app.config['UPLOAD_MAX_SIZE'] = 1024
+    response = register_professional(client, 'upload-big@example.com', b'x' * 4096)
+    assert response.status_code == 413
+    assert 'error' in response.get_json()
+    assert User.query.filter_by(email='upload-big@example.com').first() is None
+    assert list((uploads / '.incoming').iterdir()) == []
+
+def test_uploads_gc_removes_unreferenced_files(client, uploads, register_professional):
+    assert register_professional(client, 'gc1@example.com', b'kept').status_code == 201
+    assert register_professional(client, 'gc2@example.com', b'dropped').status_code == 201
+    kept = User.query.filter_by(email='gc1@example.com').first()
+    dropped = Professional.query.filter(Professional.user_id != kept.id).first()
+    dropped_key = dropped.diploma_file
+    db.session.delete(dropped)
+    db.session.commit()
+    (uploads / '.incoming' / 'interrompido.part').write_bytes(b'x')
+
+    # Dentro do prazo de carência nada é removido
+    storage, spool = get_storage(), str(uploads / '.incoming')
+    assert collect_garbage(db.engine, storage, spool, timedelta(hours=1)) == {'files_removed': 0, 'partials_removed': 0}
+    metrics = collect_garbage(db.engine, storage, spool, timedelta(hours=1), now=datetime.utcnow() + timedelta(hours=2))
+    assert metrics['files_removed'] == 1
+    assert not (uploads / dropped_key).exists()
+    assert StoredFile.query.get(dropped_key) is None
+    assert StoredFile.query.count() == 1
+    assert (uploads / Professional.query.first().diploma_file).exists()
+
+    metrics = collect_garbage(db.engine, storage, spool, timedelta(seconds=-60))
+    assert metrics['partials_removed'] == 1